@@ -1,9 +1,12 @@
 import asyncio
 import os
 import logging
+from datetime import timedelta
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.memory import SimpleEventIsolation
 from aiogram.types import (
     BotCommand,
     BotCommandScopeAllPrivateChats,
@@ -12,10 +15,21 @@ from aiogram.types import (
 from dotenv import load_dotenv
 
 from config import Config
-from db import init_engine, create_all
+from db import init_engine, create_all, dispose
 import models  # для create_all
+from writer import start_writer, stop_writer
+from querystats import install_query_hooks
+from fsm_storage import DBStorage
 from handlers import onboarding, commands, errors
 from scheduler import BotScheduler
+from leases import get_leases
+from middlewares.db_session import DbSessionMiddleware
+from middlewares.ordering import get_chat_ordering
+from middlewares.throttling import get_throttling
+from utils.background import get_background_jobs
+from webhook import run_webhook
+from monitoring import start_monitoring
+from utils.profiling import get_profiler
 
 
 async def _setup_bot_commands(bot: Bot):
@@ -62,12 +76,36 @@ async def main():
     if not cfg.bot_token:
         raise RuntimeError("BOT_TOKEN не задано")
 
-    init_engine(cfg.database_url)
+    init_engine(cfg.database_url, cfg)
+    install_query_hooks()
+    get_profiler().start()
     await create_all(models)
+    start_writer(cfg)
 
-    bot = Bot(token=cfg.bot_token, default=DefaultBotProperties(parse_mode=None, link_preview_is_disabled=True))
-    await bot.delete_webhook(drop_pending_updates=True)
-    dp = Dispatcher(storage=MemoryStorage())
+    # TELEGRAM_API_URL — локальний сервер Bot API (або тестовий utils/fakebotapi.py)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(cfg.telegram_api_url)) if cfg.telegram_api_url else None
+    bot = Bot(
+        token=cfg.bot_token,
+        session=session,
+        default=DefaultBotProperties(parse_mode=None, link_preview_is_disabled=True),
+    )
+    # стан онбордингу — у БД: переживає перезапуск, пам'ять не росте з кількістю діалогів
+    # events_isolation: FSMContextMiddleware стоїть першим (Dispatcher.__init__) і читає стан
+    # до черги чату; блокування за ключем FSM змушує наступне оновлення чату читати стан лише
+    # після того, як попереднє його змінило
+    dp = Dispatcher(
+        storage=DBStorage(timedelta(hours=cfg.fsm_ttl_hours)),
+        events_isolation=SimpleEventIsolation(),
+    )
+
+    # флуд відсікається до черги чату: зайві запити не займають місце і не доходять до БД/джерела
+    dp.update.outer_middleware(get_throttling())
+    # різні чати — паралельно до UPDATE_MAX_CONCURRENCY, один чат — по черзі (polling і webhook)
+    dp.update.outer_middleware(get_chat_ordering())
+    # одна сесія читання на оновлення (data["db"]) і облік SQL за обробниками — після фільтрів
+    db_session = DbSessionMiddleware()
+    dp.message.middleware(db_session)
+    dp.callback_query.middleware(db_session)
 
     dp.include_router(onboarding.router)
     dp.include_router(commands.router)
@@ -78,25 +116,50 @@ async def main():
 
     bs = BotScheduler(bot)
     bs.start()
+    monitoring = await start_monitoring(cfg, bs)
 
     print("Bot started.")
     try:
-        await dp.start_polling(bot)
+        if cfg.webhook_url:
+            await run_webhook(dp, bot, cfg)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(bot)
     except (asyncio.CancelledError, KeyboardInterrupt):
         # Нормальне завершення: Ctrl+C, SIGTERM або скасування тасків поллінга
         logging.info("Shutdown requested, stopping gracefully...")
     finally:
-        # Акуратно закриваємо HTTP-сесію бота
+        # порядок важливий: спершу нічого нового не запускається (планувальник), потім
+        # дочікуються фонові задачі — їм ще потрібні письменник і HTTP-сесія бота
+        try:
+            await bs.shutdown()
+        except Exception:
+            logging.warning("scheduler shutdown failed", exc_info=True)
+        try:
+            await get_background_jobs().drain(cfg.background_drain_seconds)
+        except Exception:
+            pass
+        if monitoring is not None:
+            try:
+                await monitoring.cleanup()
+            except Exception:
+                pass
+        # віддати шарди іншим примірникам одразу, не чекаючи, поки спливе оренда
+        try:
+            await get_leases().leave()
+        except Exception:
+            pass
+        try:
+            await stop_writer()
+        except Exception:
+            pass
+        # Акуратно закриваємо HTTP-сесію бота — після всіх, хто ще міг надсилати повідомлення
         try:
             await bot.session.close()
         except Exception:
             pass
-        # Якщо у вашого планувальника є метод зупинки — зупиняємо
         try:
-            if hasattr(bs, "stop"):
-                bs.stop()
-            elif hasattr(bs, "shutdown"):
-                bs.shutdown()
+            await dispose()
         except Exception:
             pass
 
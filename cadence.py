@@ -0,0 +1,166 @@
+"""
+Пріоритети оновлень: як часто запитувати розклад кожної групи/викладача в межах
+бюджету запитів до джерела (REFRESH_BUDGET_PER_HOUR).
+
+Вага сутності — добуток трьох множників:
+  • підписники: 1 + log2(1 + n) — п'ятсот користувачів важать більше за одного, але не в 500 разів;
+  • найближче заняття: сьогодні/завтра — ×3, до 3 днів — ×2, до тижня — ×1, пізніше або немає — ×0.5;
+  • історія змін: 0.5 + change_rate (частка оновлень, що щось змінили).
+Діючий негативний кеш — ×0.1: запит однаково буде пропущено.
+
+Кожна сутність отримує щонайменше один запит за REFRESH_INTERVAL_HOURS; решта бюджету
+ділиться пропорційно вагам, але не частіше ніж раз на REFRESH_MIN_INTERVAL_MINUTES —
+надлишок від обмежених сутностей перерозподіляється між рештою.
+"""
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from repositories import next_lesson_dates, refresh_states
+
+
+@dataclass
+class Demand:
+    kind: str  # 'group' | 'teacher'
+    entity_id: int
+    subscribers: int
+    next_lesson: date | None
+    change_rate: float = 0.0
+    negative: bool = False
+
+
+@dataclass
+class Cadence:
+    demand: Demand
+    weight: float
+    interval_s: int
+
+    @property
+    def per_hour(self) -> float:
+        return 3600 / self.interval_s
+
+
+@dataclass
+class RefreshPlan:
+    budget_per_hour: float
+    cadences: list[Cadence] = field(default_factory=list)
+    created_at: datetime = field(default_factory=datetime.utcnow)
+
+    @property
+    def planned_per_hour(self) -> float:
+        return sum(c.per_hour for c in self.cadences)
+
+    def report(self, top: int = 10) -> str:
+        """Короткий звіт: бюджет, розподіл і найчастіші сутності."""
+        lines = [
+            f"бюджет {self.budget_per_hour:g}/год, заплановано {self.planned_per_hour:.1f}/год "
+            f"на {len(self.cadences)} розкладів"
+        ]
+        for c in sorted(self.cadences, key=lambda c: c.interval_s)[:top]:
+            d = c.demand
+            nxt = d.next_lesson.strftime("%d.%m") if d.next_lesson else "—"
+            lines.append(
+                f"{d.kind} {d.entity_id}: кожні {_fmt_interval(c.interval_s)} "
+                f"(підписників {d.subscribers}, заняття {nxt}, змін {d.change_rate:.2f}, вага {c.weight:.2f})"
+            )
+        return "\n".join(lines)
+
+
+def _fmt_interval(seconds: int) -> str:
+    if seconds < 3600:
+        return f"{seconds // 60} хв"
+    return f"{seconds / 3600:.1f} год"
+
+
+def weight(d: Demand, today: date) -> float:
+    subscribers = 1 + math.log2(1 + max(0, d.subscribers))
+    days = (d.next_lesson - today).days if d.next_lesson else None
+    if days is None or days > 7:
+        proximity = 0.5
+    elif days <= 1:
+        proximity = 3.0
+    elif days <= 3:
+        proximity = 2.0
+    else:
+        proximity = 1.0
+    w = subscribers * proximity * (0.5 + max(0.0, min(1.0, d.change_rate)))
+    return w * 0.1 if d.negative else w
+
+
+def plan_cadences(
+    demands: list[Demand],
+    today: date,
+    budget_per_hour: float,
+    min_interval_s: int,
+    max_interval_s: int,
+) -> RefreshPlan:
+    """
+    Розподіляє budget_per_hour між сутностями за вагами (див. опис модуля).
+    Якщо бюджету не вистачає навіть на max_interval_s для всіх — усі отримують max_interval_s.
+    """
+    min_interval_s = max(1, min(min_interval_s, max_interval_s))
+    floor_rate, cap_rate = 3600 / max_interval_s, 3600 / min_interval_s
+    weights = {i: weight(d, today) for i, d in enumerate(demands)}
+    rates = {i: floor_rate for i in weights}
+
+    extra = budget_per_hour - floor_rate * len(demands)
+    free = set(weights)
+    while free and extra > 1e-9:
+        wsum = sum(weights[i] for i in free) or 1.0
+        capped = [i for i in free if rates[i] + extra * weights[i] / wsum > cap_rate]
+        if not capped:
+            for i in free:
+                rates[i] += extra * weights[i] / wsum
+            break
+        for i in capped:
+            extra -= cap_rate - rates[i]
+            rates[i] = cap_rate
+            free.discard(i)
+
+    plan = RefreshPlan(budget_per_hour=budget_per_hour)
+    for i, d in enumerate(demands):
+        interval = int(round(min(max_interval_s, max(min_interval_s, 3600 / rates[i]))))
+        plan.cadences.append(Cadence(demand=d, weight=weights[i], interval_s=interval))
+    return plan
+
+
+async def collect_demand(
+    session: AsyncSession, today: date, now: datetime, groups: dict[int, int], teachers: dict[int, int]
+) -> list[Demand]:
+    """
+    Найближче заняття та історія змін для кожної групи/викладача з підписниками
+    (groups/teachers — {id: підписників}, з реєстру subscriptions.py).
+    """
+    demands: list[Demand] = []
+    for kind, counts in (("group", groups), ("teacher", teachers)):
+        ids = sorted(counts)
+        nearest = await next_lesson_dates(session, kind, ids, today)
+        states = await refresh_states(session, kind, ids)
+        for entity_id in ids:
+            st = states.get(entity_id)
+            demands.append(Demand(
+                kind=kind,
+                entity_id=entity_id,
+                subscribers=counts[entity_id],
+                next_lesson=nearest.get(entity_id),
+                change_rate=(st.change_rate or 0.0) if st else 0.0,
+                negative=bool(st and st.negative_until and st.negative_until > now),
+            ))
+    return demands
+
+
+_last_plan: RefreshPlan | None = None
+
+
+def set_last_plan(plan: RefreshPlan) -> None:
+    global _last_plan
+    _last_plan = plan
+
+
+def get_last_plan() -> RefreshPlan | None:
+    """Останній застосований план (для /status)."""
+    return _last_plan
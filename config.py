@@ -7,19 +7,111 @@ class Config:
     base_url: str
     offline_fixtures_dir: str | None
     database_url: str
+    # SQLite performance profile
+    sqlite_wal: bool
+    sqlite_busy_timeout_ms: int
+    sqlite_cache_size_kib: int
+    sqlite_mmap_size_mb: int
+    sqlite_checkpoint_minutes: int
+    sqlite_incremental_vacuum: bool
+    db_read_pool_size: int
+    # PostgreSQL pool
+    db_pool_size: int
+    db_max_overflow: int
+    db_pool_recycle_seconds: int
+    notification_partitions_ahead: int
+    # Write queue (single writer)
+    write_batch_max: int
+    write_batch_window_ms: int
+    # Вікно оновлення: найближчі refresh_near_days днів — кожні refresh_near_interval_minutes,
+    # усе вікно до refresh_far_days — кожні refresh_interval_hours
     refresh_interval_hours: int
+    refresh_near_days: int
+    refresh_near_interval_minutes: int
+    refresh_far_days: int
+    # Бюджет запитів до джерела на годину, розподілений за пріоритетами (0 — однаковий інтервал для всіх)
+    refresh_budget_per_hour: int
+    refresh_min_interval_minutes: int
+    refresh_replan_minutes: int
     refresh_reconcile_minutes: int
     refresh_jitter_seconds: int
+    # Викладач, усі групи якого свіжі, не завантажується окремо — але не рідше ніж раз на стільки годин
+    teacher_derived_max_hours: int
+    # Stale-while-revalidate: відповідь з БД одразу, фонове оновлення, якщо дані старші за поріг
+    swr_stale_minutes: int
+    swr_retry_seconds: int
+    # Governor джерела: AIMD-паралельність, запобіжник, backoff окремих сутностей
+    source_min_concurrency: int
+    source_max_concurrency: int
+    source_latency_target_ms: int
+    source_breaker_failures: int
+    source_breaker_cooldown_seconds: int
+    source_breaker_max_cooldown_seconds: int
+    source_backoff_base_seconds: int
+    source_backoff_max_seconds: int
+    # Негативний кеш: TTL = база * 2^(повторів-1), не довше за максимум (для порожніх розкладів — свій)
+    negative_ttl_base_hours: int
+    negative_ttl_max_hours: int
+    negative_empty_ttl_max_hours: int
     scan_interval_seconds: int
     default_notify_offset_min: int
+    # Стан діалогів (FSM) у БД: скільки живе незавершений онбординг; кеш довідників для клавіатур
+    fsm_ttl_hours: int
+    directory_cache_minutes: int
     # Retention / cleanup
     event_retention_days: int
     notification_retention_days: int
     cleanup_at_hh: int
     cleanup_at_mm: int
+    cleanup_batch_size: int
+    cleanup_batch_pause_ms: int
+    cleanup_vacuum_pages: int
+    # Зберігати стиснутий сирий HTML клітинок (raw_cells)
+    store_raw_html: bool
     # TZ & proxy
     tz: str
     http_proxy: str | None
+    # Webhook замість long polling (порожній WEBHOOK_URL — polling)
+    webhook_url: str | None
+    webhook_path: str
+    webhook_host: str
+    webhook_port: int
+    webhook_secret: str
+    webhook_max_concurrency: int
+    webhook_max_pending: int
+    webhook_drain_seconds: int
+    # Виконання оновлень: паралельно для різних чатів, по черзі в межах чату; фонові задачі обробників
+    update_max_concurrency: int
+    background_drain_seconds: int
+    # Захист від флуду: дій за хвилину на користувача за класами (0 — без обмеження)
+    throttle_source_per_minute: int
+    throttle_schedule_per_minute: int
+    throttle_nav_per_minute: int
+    throttle_other_per_minute: int
+    throttle_global_source_per_minute: int
+    # Бюджет SQL-інструкцій на обробник/крок завдання (querystats.py): за замовчуванням, за іменами, строгий режим
+    query_budget_default: int
+    query_budgets: dict[str, int]
+    query_budget_strict: bool
+    # Локальний HTTP-сервер /metrics і /healthz (0 — вимкнено)
+    metrics_host: str
+    metrics_port: int
+    # Профілювання (utils/profiling.py): цілі, каталог і ліміт файлів, період семплів, tracemalloc, ліміт /profile
+    profile_targets: frozenset[str]
+    profile_dir: str
+    profile_max_files: int
+    profile_interval_ms: int
+    profile_tracemalloc: bool
+    profile_max_seconds: int
+    # Інший сервер Bot API (локальний telegram-bot-api або utils/fakebotapi.py)
+    telegram_api_url: str | None
+    # Кілька примірників: шарди користувачів/розкладів з орендою в БД (0 — один примірник)
+    shard_count: int
+    lease_ttl_seconds: int
+    lease_heartbeat_seconds: int
+    instance_id: str | None
+    # Telegram id адміністраторів (/status)
+    admin_ids: frozenset[int] = frozenset()
     # Lesson times
     lesson_times: dict[int, tuple[str, str]] = None
 
@@ -40,18 +132,95 @@ class Config:
             base_url=os.getenv("BASE_URL", "http://193.189.127.179:5010").rstrip("/"),
             offline_fixtures_dir=os.getenv("OFFLINE_FIXTURES_DIR") or None,
             database_url=os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./bot.db"),
-            refresh_interval_hours=int(os.getenv("REFRESH_INTERVAL_HOURS", "6")),
-            refresh_reconcile_minutes=int(os.getenv("REFRESH_RECONCILE_MINUTES", "15")),
+            # SQLite
+            sqlite_wal=os.getenv("SQLITE_WAL", "1") == "1",
+            sqlite_busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+            sqlite_cache_size_kib=int(os.getenv("SQLITE_CACHE_SIZE_KIB", "16384")),
+            sqlite_mmap_size_mb=int(os.getenv("SQLITE_MMAP_SIZE_MB", "64")),
+            sqlite_checkpoint_minutes=int(os.getenv("SQLITE_CHECKPOINT_MINUTES", "10")),
+            sqlite_incremental_vacuum=os.getenv("SQLITE_INCREMENTAL_VACUUM", "1") == "1",
+            db_read_pool_size=int(os.getenv("DB_READ_POOL_SIZE", "4")),
+            # PostgreSQL
+            db_pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+            db_max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            db_pool_recycle_seconds=int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800")),
+            notification_partitions_ahead=int(os.getenv("NOTIFICATION_PARTITIONS_AHEAD", "2")),
+            write_batch_max=int(os.getenv("WRITE_BATCH_MAX", "64")),
+            write_batch_window_ms=int(os.getenv("WRITE_BATCH_WINDOW_MS", "20")),
+            refresh_interval_hours=int(os.getenv("REFRESH_INTERVAL_HOURS", "12")),
+            refresh_near_days=int(os.getenv("REFRESH_NEAR_DAYS", "7")),
+            refresh_near_interval_minutes=int(os.getenv("REFRESH_NEAR_INTERVAL_MINUTES", "60")),
+            refresh_far_days=int(os.getenv("REFRESH_FAR_DAYS", "28")),
+            refresh_budget_per_hour=int(os.getenv("REFRESH_BUDGET_PER_HOUR", "120")),
+            refresh_min_interval_minutes=int(os.getenv("REFRESH_MIN_INTERVAL_MINUTES", "15")),
+            refresh_replan_minutes=int(os.getenv("REFRESH_REPLAN_MINUTES", "60")),
+            refresh_reconcile_minutes=int(os.getenv("REFRESH_RECONCILE_MINUTES", "360")),
             refresh_jitter_seconds=int(os.getenv("REFRESH_JITTER_SECONDS", "60")),
+            teacher_derived_max_hours=int(os.getenv("TEACHER_DERIVED_MAX_HOURS", "24")),
+            swr_stale_minutes=int(os.getenv("SWR_STALE_MINUTES", "60")),
+            swr_retry_seconds=int(os.getenv("SWR_RETRY_SECONDS", "60")),
+            source_min_concurrency=int(os.getenv("SOURCE_MIN_CONCURRENCY", "1")),
+            source_max_concurrency=int(os.getenv("SOURCE_MAX_CONCURRENCY", "6")),
+            source_latency_target_ms=int(os.getenv("SOURCE_LATENCY_TARGET_MS", "3000")),
+            source_breaker_failures=int(os.getenv("SOURCE_BREAKER_FAILURES", "5")),
+            source_breaker_cooldown_seconds=int(os.getenv("SOURCE_BREAKER_COOLDOWN_SECONDS", "60")),
+            source_breaker_max_cooldown_seconds=int(os.getenv("SOURCE_BREAKER_MAX_COOLDOWN_SECONDS", "1800")),
+            source_backoff_base_seconds=int(os.getenv("SOURCE_BACKOFF_BASE_SECONDS", "300")),
+            source_backoff_max_seconds=int(os.getenv("SOURCE_BACKOFF_MAX_SECONDS", "21600")),
+            negative_ttl_base_hours=int(os.getenv("NEGATIVE_TTL_BASE_HOURS", "6")),
+            negative_ttl_max_hours=int(os.getenv("NEGATIVE_TTL_MAX_HOURS", "168")),
+            negative_empty_ttl_max_hours=int(os.getenv("NEGATIVE_EMPTY_TTL_MAX_HOURS", "24")),
             scan_interval_seconds=int(os.getenv("SCAN_INTERVAL_SECONDS", "60")),
             default_notify_offset_min=int(os.getenv("DEFAULT_NOTIFY_OFFSET_MIN", "5")),
+            fsm_ttl_hours=int(os.getenv("FSM_TTL_HOURS", "24")),
+            directory_cache_minutes=int(os.getenv("DIRECTORY_CACHE_MINUTES", "60")),
             # Retention
             event_retention_days=int(os.getenv("EVENT_RETENTION_DAYS", "90")),
             notification_retention_days=int(os.getenv("NOTIFICATION_RETENTION_DAYS", "30")),
             cleanup_at_hh=int(os.getenv("CLEANUP_AT_HH", "3")),
             cleanup_at_mm=int(os.getenv("CLEANUP_AT_MM", "30")),
+            cleanup_batch_size=int(os.getenv("CLEANUP_BATCH_SIZE", "500")),
+            cleanup_batch_pause_ms=int(os.getenv("CLEANUP_BATCH_PAUSE_MS", "50")),
+            cleanup_vacuum_pages=int(os.getenv("CLEANUP_VACUUM_PAGES", "1000")),
+            store_raw_html=os.getenv("STORE_RAW_HTML", "0") == "1",
             # TZ & proxy
             tz=os.getenv("TZ", "Europe/Kyiv"),
             http_proxy=os.getenv("HTTP_PROXY") or None,
+            webhook_url=os.getenv("WEBHOOK_URL") or None,
+            webhook_path="/" + os.getenv("WEBHOOK_PATH", "/telegram/webhook").lstrip("/"),
+            webhook_host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+            webhook_port=int(os.getenv("WEBHOOK_PORT", "8080")),
+            webhook_secret=os.getenv("WEBHOOK_SECRET", ""),
+            webhook_max_concurrency=int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "16")),
+            webhook_max_pending=int(os.getenv("WEBHOOK_MAX_PENDING", "1000")),
+            webhook_drain_seconds=int(os.getenv("WEBHOOK_DRAIN_SECONDS", "20")),
+            update_max_concurrency=int(os.getenv("UPDATE_MAX_CONCURRENCY", "32")),
+            background_drain_seconds=int(os.getenv("BACKGROUND_DRAIN_SECONDS", "20")),
+            throttle_source_per_minute=int(os.getenv("THROTTLE_SOURCE_PER_MINUTE", "6")),
+            throttle_schedule_per_minute=int(os.getenv("THROTTLE_SCHEDULE_PER_MINUTE", "20")),
+            throttle_nav_per_minute=int(os.getenv("THROTTLE_NAV_PER_MINUTE", "60")),
+            throttle_other_per_minute=int(os.getenv("THROTTLE_OTHER_PER_MINUTE", "30")),
+            throttle_global_source_per_minute=int(os.getenv("THROTTLE_GLOBAL_SOURCE_PER_MINUTE", "120")),
+            query_budget_default=int(os.getenv("QUERY_BUDGET_DEFAULT", "20")),
+            query_budgets={
+                name.strip(): int(n)
+                for name, _, n in (item.partition("=") for item in os.getenv("QUERY_BUDGETS", "week=80,btn_week=80").split(","))
+                if name.strip() and n.strip()
+            },
+            query_budget_strict=os.getenv("QUERY_BUDGET_STRICT", "0") == "1",
+            metrics_host=os.getenv("METRICS_HOST", "127.0.0.1"),
+            metrics_port=int(os.getenv("METRICS_PORT", "9102")),
+            profile_targets=frozenset(x for x in os.getenv("PROFILE_TARGETS", "").replace(" ", "").split(",") if x),
+            profile_dir=os.getenv("PROFILE_DIR", "profiles"),
+            profile_max_files=int(os.getenv("PROFILE_MAX_FILES", "50")),
+            profile_interval_ms=int(os.getenv("PROFILE_INTERVAL_MS", "10")),
+            profile_tracemalloc=os.getenv("PROFILE_TRACEMALLOC", "0") == "1",
+            profile_max_seconds=int(os.getenv("PROFILE_MAX_SECONDS", "120")),
+            telegram_api_url=(os.getenv("TELEGRAM_API_URL") or "").rstrip("/") or None,
+            shard_count=int(os.getenv("SHARD_COUNT", "0")),
+            lease_ttl_seconds=int(os.getenv("LEASE_TTL_SECONDS", "30")),
+            lease_heartbeat_seconds=int(os.getenv("LEASE_HEARTBEAT_SECONDS", "10")),
+            instance_id=os.getenv("INSTANCE_ID") or None,
+            admin_ids=frozenset(int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x),
             lesson_times=lt,
         )
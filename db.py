@@ -1,20 +1,212 @@
+from __future__ import annotations
+
+from datetime import date
+
+from sqlalchemy import MetaData, event, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase
 
+from config import Config
+
 _engine = None
 _sessionmaker = None
+# Окремий пул лише для читання (SQLite у WAL-режимі); для інших БД — той самий, що й запис
+_read_engine = None
+_read_sessionmaker = None
 
 class Base(AsyncAttrs, DeclarativeBase):
-    pass
+    # Стабільні імена обмежень — однакові в SQLite і PostgreSQL
+    metadata = MetaData(naming_convention={
+        "ix": "ix_%(column_0_label)s",
+        "uq": "uq_%(table_name)s_%(column_0_name)s",
+        "ck": "ck_%(table_name)s_%(constraint_name)s",
+        "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
+        "pk": "pk_%(table_name)s",
+    })
+
+# Діалекти, для яких repositories.py має upsert (INSERT ... ON CONFLICT) і масову вставку
+SUPPORTED_DIALECTS = ("sqlite", "postgresql")
+
+# Ключ advisory-блокування для міграцій, коли кілька інстансів стартують одночасно
+_MIGRATION_LOCK_KEY = 0x4D4B52
+
+
+# ---------- SQLite: продуктивний профіль ----------
+def _is_sqlite_file(database_url: str) -> bool:
+    url = make_url(database_url)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def _install_sqlite_profile(engine, cfg: Config, *, read_only: bool) -> None:
+    """
+    PRAGMA на кожне нове з'єднання + явний BEGIN замість неявного від драйвера.
+    Письменник бере блокування одразу (BEGIN IMMEDIATE), щоб довга транзакція
+    не впиралась у "database is locked" посеред роботи.
+    """
+    pragmas = [
+        f"PRAGMA busy_timeout={max(0, cfg.sqlite_busy_timeout_ms)}",
+        f"PRAGMA cache_size=-{max(0, cfg.sqlite_cache_size_kib)}",
+        f"PRAGMA mmap_size={max(0, cfg.sqlite_mmap_size_mb) * 1024 * 1024}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    if cfg.sqlite_wal:
+        # journal_mode зберігається у файлі БД (вмикає письменник); synchronous=NORMAL безпечний саме для WAL
+        if not read_only:
+            pragmas.insert(0, "PRAGMA journal_mode=WAL")
+        pragmas.append("PRAGMA synchronous=NORMAL")
+    if cfg.sqlite_incremental_vacuum and not read_only:
+        # діє на нову (порожню) БД; існуючу переводить enable_incremental_vacuum()
+        pragmas.insert(0, "PRAGMA auto_vacuum=INCREMENTAL")
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        # вимикаємо власний BEGIN драйвера — транзакції відкриваємо самі нижче
+        dbapi_connection.isolation_level = None
+        cur = dbapi_connection.cursor()
+        try:
+            for p in pragmas:
+                cur.execute(p)
+        finally:
+            cur.close()
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _on_begin(conn):
+        conn.exec_driver_sql("BEGIN" if read_only else "BEGIN IMMEDIATE")
+
+
+def init_engine(database_url: str, cfg: Config | None = None):
+    """
+    Для файлової SQLite створює два рушії:
+      • письменник — одне з'єднання (pool_size=1), усі записи серіалізуються через нього;
+      • читачі — окремий пул з query_only, у WAL-режимі не чекають на письменника.
+    Для PostgreSQL (postgresql+asyncpg) — один пул з розміром із конфігу.
+    Для SQLite :memory: читання і запис ідуть через один рушій.
+    Інші БД не підтримуються (RuntimeError одразу, а не на першому upsert).
+    """
+    global _engine, _sessionmaker, _read_engine, _read_sessionmaker
+    cfg = cfg or Config.load()
+    backend = make_url(database_url).get_backend_name()
+    if backend not in SUPPORTED_DIALECTS:
+        raise RuntimeError(
+            f"DATABASE_URL: діалект {backend!r} не підтримується; підтримуються: {', '.join(SUPPORTED_DIALECTS)} "
+            "(sqlite+aiosqlite, postgresql+asyncpg)"
+        )
+
+    if _is_sqlite_file(database_url):
+        _engine = create_async_engine(database_url, echo=False, future=True, pool_size=1, max_overflow=0)
+        _install_sqlite_profile(_engine, cfg, read_only=False)
+        _read_engine = create_async_engine(
+            database_url, echo=False, future=True,
+            pool_size=max(1, cfg.db_read_pool_size), max_overflow=0,
+        )
+        _install_sqlite_profile(_read_engine, cfg, read_only=True)
+    elif backend == "postgresql":
+        _engine = create_async_engine(
+            database_url, echo=False, future=True,
+            pool_size=max(1, cfg.db_pool_size),
+            max_overflow=max(0, cfg.db_max_overflow),
+            pool_recycle=cfg.db_pool_recycle_seconds,
+            pool_pre_ping=True,
+        )
+        _read_engine = _engine
+    else:
+        _engine = create_async_engine(database_url, echo=False, future=True)
+        _read_engine = _engine
 
-def init_engine(database_url: str):
-    global _engine, _sessionmaker
-    _engine = create_async_engine(database_url, echo=False, future=True)
     _sessionmaker = async_sessionmaker(_engine, expire_on_commit=False)
+    _read_sessionmaker = async_sessionmaker(_read_engine, expire_on_commit=False)
 
 def get_sessionmaker():
+    """Сесії для запису (і для читання, яке має бачити власні незакомічені зміни)."""
     return _sessionmaker
 
+def get_read_sessionmaker():
+    """Сесії лише для читання: команди, сканер нагадувань, довідники."""
+    return _read_sessionmaker
+
+def get_engine():
+    return _engine
+
+async def checkpoint(mode: str = "PASSIVE") -> tuple[int, int, int] | None:
+    """
+    Переносить WAL у основний файл БД (PRAGMA wal_checkpoint).
+    Повертає (busy, wal_pages, checkpointed_pages) або None, якщо це не SQLite.
+    """
+    if _engine is None or _engine.dialect.name != "sqlite":
+        return None
+    async with _engine.connect() as conn:
+        # поза транзакцією: всередині BEGIN чекпоінт не може завершитись
+        raw = (await conn.get_raw_connection()).driver_connection
+        cur = await raw.execute(f"PRAGMA wal_checkpoint({mode})")
+        row = await cur.fetchone()
+        await cur.close()
+    return tuple(row) if row else None
+
+async def enable_incremental_vacuum() -> bool:
+    """
+    Одноразово переводить існуючу SQLite-БД у auto_vacuum=INCREMENTAL (потрібен повний VACUUM).
+    Після цього клінап може повертати вільні сторінки порціями. Повертає True, якщо режим змінено.
+    """
+    if _engine is None or _engine.dialect.name != "sqlite":
+        return False
+    async with _engine.connect() as conn:
+        # VACUUM не можна виконувати всередині транзакції — працюємо з драйвером напряму
+        raw = (await conn.get_raw_connection()).driver_connection
+        cur = await raw.execute("PRAGMA auto_vacuum")
+        row = await cur.fetchone()
+        await cur.close()
+        if row and int(row[0]) == 2:
+            return False
+        await raw.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await raw.execute("VACUUM")
+    return True
+
+async def incremental_vacuum(max_pages: int) -> int:
+    """
+    SQLite: повертає у файлову систему до max_pages вільних сторінок (PRAGMA incremental_vacuum).
+    Працює лише з auto_vacuum=INCREMENTAL. Повертає кількість звільнених сторінок.
+    Виконується на з'єднанні письменника поза транзакцією, тож записи чекають лише на цей крок.
+    """
+    if _engine is None or _engine.dialect.name != "sqlite":
+        return 0
+    async with _engine.connect() as conn:
+        raw = (await conn.get_raw_connection()).driver_connection
+        cur = await raw.execute("PRAGMA freelist_count")
+        before = int((await cur.fetchone())[0])
+        if before:
+            # incremental_vacuum звільняє по сторінці на кожен крок виконання;
+            # executescript проганяє інструкцію до кінця (execute зупинився б після першого)
+            await raw.executescript(f"PRAGMA incremental_vacuum({max(1, int(max_pages))})")
+        cur = await raw.execute("PRAGMA freelist_count")
+        after = int((await cur.fetchone())[0])
+        await cur.close()
+    return max(0, before - after)
+
 async def create_all(models_module):
+    """Створює відсутні таблиці та доводить існуючу схему до актуальної версії (migrations.py)."""
+    import migrations
+    import partitioning
+
     async with _engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # кілька інстансів можуть стартувати одночасно — мігрує лише один
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _MIGRATION_LOCK_KEY})
+        fresh = not await conn.run_sync(migrations.had_schema)
+        await conn.run_sync(partitioning.create_partitioned_tables)
         await conn.run_sync(models_module.Base.metadata.create_all)
+        await conn.run_sync(migrations.run_migrations, fresh)
+        # секції наперед — щоб жоден запис не потрапив у default-секцію
+        await conn.run_sync(
+            partitioning.ensure_notification_partitions, date.today(), Config.load().notification_partitions_ahead
+        )
+    if Config.load().sqlite_incremental_vacuum:
+        await enable_incremental_vacuum()
+
+async def dispose():
+    if _read_engine is not None and _read_engine is not _engine:
+        await _read_engine.dispose()
+    if _engine is not None:
+        await _engine.dispose()
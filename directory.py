@@ -0,0 +1,180 @@
+"""
+Спільний кеш довідників для онбордингу і /addzoom: назва ЗВО, факультети, курси, групи, кафедри,
+викладачі, імена для Zoom-лінків.
+
+FSM користувача тримає лише id і номери сторінок, а списки для клавіатур беруться звідси:
+один примірник на всіх, DIRECTORY_CACHE_MINUTES від завантаження. Промах кешу — один запит
+до джерела на всіх, хто чекає той самий список (single-flight), із записом у довідники БД;
+якщо джерело недоступне або повернуло порожнє — список з БД. Порожні списки не кешуються.
+"""
+from __future__ import annotations
+
+import logging
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Hashable
+from urllib.parse import urlparse
+
+from config import Config
+from db import get_read_sessionmaker
+from parsing.client import SourceClient
+from parsing.extractors import (
+    parse_chairs, parse_courses, parse_faculties, parse_groups, parse_institution_name, parse_teachers,
+)
+from repositories import (
+    list_chairs, list_courses, list_distinct_teachers, list_faculties, list_groups, list_teachers,
+    upsert_chairs, upsert_faculties, upsert_groups, upsert_teachers,
+)
+from utils.metrics import PARSE_SECONDS
+from utils.singleflight import SingleFlight
+from writer import write
+
+log = logging.getLogger(__name__)
+
+DEFAULT_COURSES = [1, 2, 3, 4]
+
+
+def list_version(items: list) -> int:
+    """Коротка контрольна сума списку: чи це той самий список, з якого користувач обирав за номером."""
+    return zlib.crc32(repr(items).encode()) & 0xFFFF
+
+
+class DirectoryCache:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[Hashable, tuple[float, list]] = {}
+        self._flights = SingleFlight()
+        # Лічильники для діагностики
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: Hashable, load: Callable[[], Awaitable[list]]) -> list:
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return await self._flights.do(key, lambda: self._fill(key, load))
+
+    async def _fill(self, key: Hashable, load: Callable[[], Awaitable[list]]) -> list:
+        items = await load()
+        if items:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, items)
+        return items
+
+    def peek(self, key: Hashable) -> list | None:
+        """Список з кешу без завантаження (None — немає або застарів)."""
+        entry = self._entries.get(key)
+        return entry[1] if entry and entry[0] > time.monotonic() else None
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_directory: DirectoryCache | None = None
+
+
+def get_directory() -> DirectoryCache:
+    global _directory
+    if _directory is None:
+        _directory = DirectoryCache(Config.load().directory_cache_minutes * 60)
+    return _directory
+
+
+def ready(name: str, *args) -> bool:
+    """Чи є список (faculties/courses/groups/chairs/teachers з тими самими аргументами) у кеші — без запиту до джерела."""
+    return get_directory().peek((name, *args)) is not None
+
+
+async def _from_source(what: str, fetch: Callable[[SourceClient], Awaitable[Any]]) -> Any:
+    """Результат fetch(клієнт) або None, якщо джерело недоступне."""
+    try:
+        async with SourceClient(Config.load()) as sc:
+            return await fetch(sc)
+    except Exception as exc:
+        log.info("directory %s: source unavailable (%s), using DB", what, type(exc).__name__)
+        return None
+
+
+async def _from_db(fn):
+    async with get_read_sessionmaker()() as s:
+        return await fn(s)
+
+
+async def _load_pairs(what, fetch, parse, upsert, fallback) -> list[tuple[int, str]]:
+    html = await _from_source(what, fetch)
+    pairs = []
+    if html:
+        with PARSE_SECONDS.time(page=what):
+            pairs = parse(html)
+    if pairs:
+        await write(lambda s: upsert(s, pairs))
+        return pairs
+    return await _from_db(fallback)
+
+
+async def institution_name() -> str:
+    """Назва ЗВО з головної сторінки (привітання /start); не вдалося — хост з BASE_URL, без кешування."""
+    async def _load():
+        html = await _from_source("institution", lambda sc: sc.get_home())
+        name = parse_institution_name(html) if html else ""
+        return [name] if name else []
+
+    found = await get_directory().get(("institution",), _load)
+    if found:
+        return found[0]
+    base_url = Config.load().base_url
+    return urlparse(base_url).hostname or base_url
+
+
+async def faculties() -> list[tuple[int, str]]:
+    return await get_directory().get(("faculties",), lambda: _load_pairs(
+        "faculties", lambda sc: sc.get_start(), parse_faculties, upsert_faculties, list_faculties,
+    ))
+
+
+async def courses(faculty_id: int) -> list[int]:
+    async def _load():
+        html = await _from_source("courses", lambda sc: sc.post_faculty_form(faculty_id=faculty_id))
+        found = []
+        if html:
+            with PARSE_SECONDS.time(page="courses"):
+                found = parse_courses(html)
+        return found or await _from_db(lambda s: list_courses(s, faculty_id)) or list(DEFAULT_COURSES)
+
+    return await get_directory().get(("courses", faculty_id), _load)
+
+
+async def groups(faculty_id: int, course: int) -> list[tuple[int, str]]:
+    # довідник груп потрібен планувальнику (faculty/course для запиту) і для FK users.group_id
+    return await get_directory().get(("groups", faculty_id, course), lambda: _load_pairs(
+        "groups",
+        lambda sc: sc.post_group_form(faculty_id=faculty_id, course=course),
+        parse_groups,
+        lambda s, pairs: upsert_groups(s, faculty_id, course, pairs),
+        lambda s: list_groups(s, faculty_id, course),
+    ))
+
+
+async def chairs() -> list[tuple[int, str]]:
+    return await get_directory().get(("chairs",), lambda: _load_pairs(
+        "chairs", lambda sc: sc.get_teacher_start(), parse_chairs, upsert_chairs, list_chairs,
+    ))
+
+
+async def teachers(chair_id: int) -> list[tuple[int, str]]:
+    return await get_directory().get(("teachers", chair_id), lambda: _load_pairs(
+        "teachers",
+        lambda sc: sc.post_teacher_form(chair_id=chair_id),
+        parse_teachers,
+        lambda s, pairs: upsert_teachers(s, chair_id, pairs),
+        lambda s: list_teachers(s, chair_id),
+    ))
+
+
+async def zoom_teacher_names() -> list[str]:
+    """Усі відомі ПІБ викладачів (з розкладу й довідника) — для /addzoom."""
+    return await get_directory().get(("zoom_teachers",), lambda: _from_db(list_distinct_teachers))
@@ -0,0 +1,85 @@
+"""
+Сховище FSM aiogram у БД бота (таблиця fsm_state) замість MemoryStorage.
+
+Незавершений онбординг переживає перезапуск, а пам'ять процесу не росте з кількістю
+користувачів, які саме щось налаштовують. Дані стану — компактний JSON (лише id і номери
+сторінок; самі списки — у directory.py). Кожен запис живе FSM_TTL_HOURS від останньої
+зміни: прострочений не читається, а нічний клінап його видаляє.
+
+Читання — через пул читачів, запис — через чергу письменника; update_data і set_state
+змінюють запис в одній операції письменника (прочитати-змінити-записати без гонок).
+"""
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta
+from typing import Any, Callable, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+from db import get_read_sessionmaker
+from repositories import get_fsm_record, save_fsm_record
+from writer import write
+
+
+def _state_name(state: StateType) -> str | None:
+    return state.state if isinstance(state, State) else state
+
+
+def _dump(data: Mapping[str, Any]) -> str | None:
+    return json.dumps(dict(data), ensure_ascii=False, separators=(",", ":")) if data else None
+
+
+def _load(raw: str | None) -> dict[str, Any]:
+    return json.loads(raw) if raw else {}
+
+
+class DBStorage(BaseStorage):
+    def __init__(self, ttl: timedelta):
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    async def _read(self, key: StorageKey):
+        async with get_read_sessionmaker()() as s:
+            return await get_fsm_record(s, self.key_builder.build(key), datetime.utcnow())
+
+    async def _mutate(
+        self, key: StorageKey, fn: Callable[[str | None, dict[str, Any]], tuple[str | None, dict[str, Any]]]
+    ) -> dict[str, Any]:
+        """Змінює (стан, дані) запису функцією fn в одній операції письменника; повертає нові дані."""
+        k = self.key_builder.build(key)
+
+        async def _op(s):
+            now = datetime.utcnow()
+            rec = await get_fsm_record(s, k, now)
+            state, data = fn(rec.state if rec else None, _load(rec.data) if rec else {})
+            await save_fsm_record(s, k, state, _dump(data), now + self.ttl)
+            return data
+
+        return await write(_op)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        name = _state_name(state)
+        await self._mutate(key, lambda _st, data: (name, data))
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        rec = await self._read(key)
+        return rec.state if rec else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        fresh = dict(data)
+        await self._mutate(key, lambda st, _data: (st, fresh))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        rec = await self._read(key)
+        return _load(rec.data) if rec else {}
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> dict[str, Any]:
+        patch = dict(data)
+        merged = await self._mutate(key, lambda st, cur: (st, {**cur, **patch}))
+        return merged.copy()
+
+    async def close(self) -> None:
+        # з'єднаннями з БД керує db.py
+        pass
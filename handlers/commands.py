@@ -1,31 +1,48 @@
+import logging
 from itertools import groupby
 from datetime import datetime, date, timedelta
 from pathlib import Path
 import sys
 
 from aiogram import Router, F
-from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, FSInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
 
 from sqlalchemy import select
 
-from db import get_sessionmaker
+from config import Config
+from db import get_read_sessionmaker
+from writer import write
+from refresh import get_refresh_engine
+from cadence import get_last_plan
+import directory
+from subscriptions import get_subscriptions
+from leases import get_leases
+from middlewares.db_session import UpdateSession
+from middlewares.ordering import get_chat_ordering
+from middlewares.throttling import get_throttling
+from utils.background import get_background_jobs
+from utils.profiling import get_profiler
+from parsing.health import get_source_health
+from querystats import get_query_stats
 from models import User, TimetableEvent
 from keyboards import paginated_kb, main_menu_kb, BTN_TODAY, BTN_TOMORROW, BTN_WEEK, BTN_NEXT, BTN_SETTINGS, BTN_HELP
 from utils.time import today_kiev, now_kiev
 from utils.formatting import EntityBuilder
 
 from repositories import (
-    list_distinct_teachers,
     set_zoom_link,
     zoom_for_event,
     events_for_user_day,
-    events_for_user_range
+    events_for_user_range,
+    negative_refresh_states,
 )
 
 router = Router(name="commands")
+log = logging.getLogger(__name__)
 
 # ---------- HELP ----------
 DEFAULT_HELP_TEXT = (
@@ -77,26 +94,119 @@ def _groups_display(e: TimetableEvent) -> str | None:
     return (e.groups_text or "").strip() or None
 
 
-# ---------- Добові відповіді ----------
-async def _send_day(message: Message, day_offset: int):
-    sm = get_sessionmaker()
-    async with sm() as s:
-        u = await s.scalar(select(User).where(User.user_id == message.from_user.id))
-        if not u or (u.role == "student" and not u.group_id) or (u.role == "teacher" and not u.teacher_id):
-            await message.answer("Немає налаштованої групи/викладача. Натисніть /start.", reply_markup=main_menu_kb())
+# ---------- Stale-while-revalidate ----------
+async def _revalidate(sent: Message, u: User, render, shown_text: str, db: UpdateSession):
+    """
+    Відповідь уже надіслана з БД. Якщо розклад застарів — оновлюємо його у фоні
+    і, якщо він змінився, редагуємо відповідь (або надсилаємо нову, якщо редагування не вдалось).
+    render(session) -> (text, entities) — той самий рендер, що дав відповідь.
+    Свіжість перевіряється в сесії оновлення; фоновий рендер відкриває власну.
+    """
+    kind, entity_id = ("teacher", u.teacher_id) if u.role == "teacher" else ("group", u.group_id)
+
+    async def on_change():
+        async with get_read_sessionmaker()() as s:
+            text, entities = await render(s)
+        if text == shown_text:
             return
+        try:
+            await sent.edit_text(text, entities=entities)
+        except TelegramBadRequest:
+            await sent.answer(text, entities=entities, reply_markup=main_menu_kb())
+
+    try:
+        await get_refresh_engine().revalidate(kind, entity_id, on_change, session=db.session)
+    except Exception:
+        # відповідь уже надіслана — користувачу не заважаємо, але й не ковтаємо мовчки
+        log.warning("revalidate %s %s failed", kind, entity_id, exc_info=True)
 
-        target = today_kiev().date() + timedelta(days=day_offset)
-        rows = await events_for_user_day(s, u, target)
 
-        if not rows:
-            when = "сьогодні" if day_offset == 0 else "завтра" if day_offset == 1 else target.strftime('%d.%m.%Y')
-            await message.answer(f"Пари {when} не знайдені.", reply_markup=main_menu_kb())
-            return
+# ---------- Добові відповіді ----------
+async def _render_day(s, u: User, day_offset: int):
+    target = today_kiev().date() + timedelta(days=day_offset)
+    rows = await events_for_user_day(s, u, target)
+
+    if not rows:
+        when = "сьогодні" if day_offset == 0 else "завтра" if day_offset == 1 else target.strftime('%d.%m.%Y')
+        return f"Пари {when} не знайдені.", []
+
+    b = EntityBuilder()
+    b.add(f"Розклад на {target.strftime('%d.%m.%Y')}:\n")
+    for e in rows:
+        t = (
+            f"{e.time_start.strftime('%H:%M')}-{e.time_end.strftime('%H:%M')}"
+            if e.time_start and e.time_end else
+            f"Пара №{e.lesson_number}"
+        )
+        subj = _subject_display(e)
+        lt = f" ({e.lesson_type})" if e.lesson_type else ""
+        room = f", ауд. {e.auditory}" if e.auditory else ""
+
+        extra = ""
+        if u.role == "teacher":
+            groups = _groups_display(e)
+            if groups:
+                extra += f"\nГрупи: {groups}"
+        else:
+            teacher = _teacher_display(e)
+            if teacher:
+                extra += f"\nВикл.: {teacher}"
+
+        zoom = await zoom_for_event(s, e)
+        zoom_line = f"\n📹Zoom: {zoom}" if zoom else ""
+        b.add(f"• {t} — ").add_bold(subj).add(f"{lt}{room}{extra}{zoom_line}").newline()
+    return b.build()
+
+async def _configured_user(message: Message, db: UpdateSession) -> User | None:
+    """Користувач з обраною групою/викладачем; інакше — підказка про /start і None."""
+    u = await db.session.scalar(select(User).where(User.user_id == message.from_user.id))
+    if not u or (u.role == "student" and not u.group_id) or (u.role == "teacher" and not u.teacher_id):
+        await db.release()
+        await message.answer("Немає налаштованої групи/викладача. Натисніть /start.", reply_markup=main_menu_kb())
+        return None
+    return u
+
+async def _send_day(message: Message, day_offset: int, db: UpdateSession):
+    u = await _configured_user(message, db)
+    if u is None:
+        return
+    text, entities = await _render_day(db.session, u, day_offset)
+    await db.release()
 
-        b = EntityBuilder()
-        b.add(f"Розклад на {target.strftime('%d.%m.%Y')}:\n")
-        for e in rows:
+    sent = await message.answer(text, entities=entities, reply_markup=main_menu_kb())
+    await _revalidate(sent, u, lambda s: _render_day(s, u, day_offset), text, db)
+
+@router.message(Command("today"))
+async def today(message: Message, db: UpdateSession):
+    await _send_day(message, 0, db)
+
+@router.message(Command("tomorrow"))
+async def tomorrow(message: Message, db: UpdateSession):
+    await _send_day(message, 1, db)
+
+@router.message(Command("week", "7days"))
+async def week(message: Message, db: UpdateSession):
+    u = await _configured_user(message, db)
+    if u is None:
+        return
+    s = db.session
+    start = today_kiev().date()
+    end = start + timedelta(days=6)
+
+    rows = await events_for_user_range(s, u, start, end)
+
+    if not rows:
+        await db.release()
+        await message.answer(f"Пари з {start.strftime('%d.%m.%Y')} по {end.strftime('%d.%m.%Y')} не знайдені.", reply_markup=main_menu_kb())
+        return
+
+    b = EntityBuilder()
+    b.add(f"Розклад на {start.strftime('%d.%m.%Y')}-{end.strftime('%d.%m.%Y')}:\n")
+
+    for day, day_events_iter in groupby(rows, key=lambda e: e.date):
+        day_events = list(day_events_iter)
+        b.add(f"\n📅 {day.strftime('%d.%m.%Y')}\n")
+        for e in day_events:
             t = (
                 f"{e.time_start.strftime('%H:%M')}-{e.time_end.strftime('%H:%M')}"
                 if e.time_start and e.time_end else
@@ -110,157 +220,99 @@ async def _send_day(message: Message, day_offset: int):
             if u.role == "teacher":
                 groups = _groups_display(e)
                 if groups:
-                    extra += f"\nГрупи: {groups}"
+                    extra += f"\n   Групи: {groups}"
             else:
                 teacher = _teacher_display(e)
                 if teacher:
-                    extra += f"\nВикл.: {teacher}"
+                    extra += f"\n   Викл.: {teacher}"
 
             zoom = await zoom_for_event(s, e)
-            zoom_line = f"\n📹Zoom: {zoom}" if zoom else ""
+            zoom_line = f"\n   📹Zoom: {zoom}" if zoom else ""
             b.add(f"• {t} — ").add_bold(subj).add(f"{lt}{room}{extra}{zoom_line}").newline()
 
-    text, entities = b.build()
-    await message.answer(text, entities=entities, reply_markup=main_menu_kb())
-
-@router.message(Command("today"))
-async def today(message: Message):
-    await _send_day(message, 0)
-
-@router.message(Command("tomorrow"))
-async def tomorrow(message: Message):
-    await _send_day(message, 1)
-
-@router.message(Command("week", "7days"))
-async def week(message: Message):
-    sm = get_sessionmaker()
-    async with sm() as s:
-        u = await s.scalar(select(User).where(User.user_id == message.from_user.id))
-        if not u or (u.role == "student" and not u.group_id) or (u.role == "teacher" and not u.teacher_id):
-            await message.answer("Немає налаштованої групи/викладача. Натисніть /start.", reply_markup=main_menu_kb())
-            return
-
-        start = today_kiev().date()
-        end = start + timedelta(days=6)
-
-        rows = await events_for_user_range(s, u, start, end)
-
-        if not rows:
-            await message.answer(f"Пари з {start.strftime('%d.%m.%Y')} по {end.strftime('%d.%m.%Y')} не знайдені.", reply_markup=main_menu_kb())
-            return
-
-        b = EntityBuilder()
-        b.add(f"Розклад на {start.strftime('%d.%m.%Y')}-{end.strftime('%d.%m.%Y')}:\n")
-
-        for day, day_events_iter in groupby(rows, key=lambda e: e.date):
-            day_events = list(day_events_iter)
-            b.add(f"\n📅 {day.strftime('%d.%m.%Y')}\n")
-            for e in day_events:
-                t = (
-                    f"{e.time_start.strftime('%H:%M')}-{e.time_end.strftime('%H:%M')}"
-                    if e.time_start and e.time_end else
-                    f"Пара №{e.lesson_number}"
-                )
-                subj = _subject_display(e)
-                lt = f" ({e.lesson_type})" if e.lesson_type else ""
-                room = f", ауд. {e.auditory}" if e.auditory else ""
-
-                extra = ""
-                if u.role == "teacher":
-                    groups = _groups_display(e)
-                    if groups:
-                        extra += f"\n   Групи: {groups}"
-                else:
-                    teacher = _teacher_display(e)
-                    if teacher:
-                        extra += f"\n   Викл.: {teacher}"
-
-                zoom = await zoom_for_event(s, e)
-                zoom_line = f"\n   📹Zoom: {zoom}" if zoom else ""
-                b.add(f"• {t} — ").add_bold(subj).add(f"{lt}{room}{extra}{zoom_line}").newline()
-
+    await db.release()
     text, entities = b.build()
     await message.answer(text, entities=entities, reply_markup=main_menu_kb())
 
 # ---------- Найближча пара ----------
-@router.message(Command("next"))
-async def next_lesson(message: Message):
-    sm = get_sessionmaker()
+async def _render_next(s, u: User):
     now_local = now_kiev()
     today = now_local.date()
     current_time = now_local.time()
 
-    async with sm() as s:
-        u = await s.scalar(select(User).where(User.user_id == message.from_user.id))
-        if not u or (u.role == "student" and not u.group_id) or (u.role == "teacher" and not u.teacher_id):
-            await message.answer("Немає налаштованої групи/викладача. Натисніть /start.", reply_markup=main_menu_kb())
-            return
-
-        rows_today = await events_for_user_day(s, u, today)
-
-        def is_future(ev: TimetableEvent) -> bool:
-            if ev.time_start:
-                return ev.time_start >= current_time
-            return False
-
-        next_ev = next((e for e in rows_today if is_future(e)), None)
-        if not next_ev:
-            # шукаємо вперед до 14 днів
-            rows_future = await events_for_user_range(s, u, today, today + timedelta(days=14))
-            if rows_future:
-                next_ev = rows_future[0]
-
-        if not next_ev:
-            await message.answer("Найближчих пар не знайдено.", reply_markup=main_menu_kb())
-            return
-
-        b = EntityBuilder()
-        date_str = next_ev.date.strftime('%d.%m.%Y')
-        t = (
-            f"{next_ev.time_start.strftime('%H:%M')}-{next_ev.time_end.strftime('%H:%M')}"
-            if next_ev.time_start and next_ev.time_end else
-            f"Пара №{next_ev.lesson_number}"
-        )
-        subj = _subject_display(next_ev)
-        lt = f" ({next_ev.lesson_type})" if next_ev.lesson_type else ""
-        room = f", ауд. {next_ev.auditory}" if next_ev.auditory else ""
-
-        extra = ""
-        if u.role == "teacher":
-            groups = _groups_display(next_ev)
-            if groups:
-                extra += f"\nГрупи: {groups}"
-        else:
-            teacher = _teacher_display(next_ev)
-            if teacher:
-                extra += f"\nВикл.: {teacher}"
-
-        zoom = await zoom_for_event(s, next_ev)
-        zoom_line = f"\n📹Zoom: {zoom}" if zoom else ""
+    rows_today = await events_for_user_day(s, u, today)
+
+    def is_future(ev: TimetableEvent) -> bool:
+        if ev.time_start:
+            return ev.time_start >= current_time
+        return False
+
+    next_ev = next((e for e in rows_today if is_future(e)), None)
+    if not next_ev:
+        # шукаємо вперед до 14 днів
+        rows_future = await events_for_user_range(s, u, today, today + timedelta(days=14))
+        if rows_future:
+            next_ev = rows_future[0]
+
+    if not next_ev:
+        return "Найближчих пар не знайдено.", []
+
+    b = EntityBuilder()
+    date_str = next_ev.date.strftime('%d.%m.%Y')
+    t = (
+        f"{next_ev.time_start.strftime('%H:%M')}-{next_ev.time_end.strftime('%H:%M')}"
+        if next_ev.time_start and next_ev.time_end else
+        f"Пара №{next_ev.lesson_number}"
+    )
+    subj = _subject_display(next_ev)
+    lt = f" ({next_ev.lesson_type})" if next_ev.lesson_type else ""
+    room = f", ауд. {next_ev.auditory}" if next_ev.auditory else ""
+
+    extra = ""
+    if u.role == "teacher":
+        groups = _groups_display(next_ev)
+        if groups:
+            extra += f"\nГрупи: {groups}"
+    else:
+        teacher = _teacher_display(next_ev)
+        if teacher:
+            extra += f"\nВикл.: {teacher}"
+
+    zoom = await zoom_for_event(s, next_ev)
+    zoom_line = f"\n📹Zoom: {zoom}" if zoom else ""
+
+    b.add(f"Найближча пара — {date_str}\n")
+    b.add(f"{t} — ").add_bold(subj).add(f"{lt}{room}{extra}{zoom_line}")
+    return b.build()
 
-        b.add(f"Найближча пара — {date_str}\n")
-        b.add(f"{t} — ").add_bold(subj).add(f"{lt}{room}{extra}{zoom_line}")
+@router.message(Command("next"))
+async def next_lesson(message: Message, db: UpdateSession):
+    u = await _configured_user(message, db)
+    if u is None:
+        return
+    text, entities = await _render_next(db.session, u)
+    await db.release()
 
-    text, entities = b.build()
-    await message.answer(text, entities=entities, reply_markup=main_menu_kb())
+    sent = await message.answer(text, entities=entities, reply_markup=main_menu_kb())
+    await _revalidate(sent, u, lambda s: _render_next(s, u), text, db)
 
 
 # ---------- Обробка текстових кнопок Reply-клавіатури ----------
 @router.message(F.text == BTN_TODAY)
-async def btn_today(message: Message):
-    await _send_day(message, 0)
+async def btn_today(message: Message, db: UpdateSession):
+    await _send_day(message, 0, db)
 
 @router.message(F.text == BTN_TOMORROW)
-async def btn_tomorrow(message: Message):
-    await _send_day(message, 1)
+async def btn_tomorrow(message: Message, db: UpdateSession):
+    await _send_day(message, 1, db)
 
 @router.message(F.text == BTN_WEEK)
-async def btn_week(message: Message):
-    await week(message)
+async def btn_week(message: Message, db: UpdateSession):
+    await week(message, db)
 
 @router.message(F.text == BTN_NEXT)
-async def btn_next(message: Message):
-    await next_lesson(message)
+async def btn_next(message: Message, db: UpdateSession):
+    await next_lesson(message, db)
 
 @router.message(F.text == BTN_HELP)
 async def btn_help(message: Message):
@@ -285,39 +337,45 @@ class ZoomAdd(StatesGroup):
 # Якщо треба — скажіть, я скопіюю сюди повністю вашу актуальну реалізацію addzoom.
 
 
+def _zoom_kb(names: list[str], page: int) -> InlineKeyboardMarkup:
+    # у callback — номер у спільному списку directory.zoom_teacher_names(), у FSM — його версія
+    return paginated_kb([(str(i), n) for i, n in enumerate(names)], page=page, per_page=10, prefix="tz")
+
+
 @router.message(Command("addzoom", "setzoom"))
 async def addzoom_entry(message: Message, state: FSMContext):
-    sm = get_sessionmaker()
-    async with sm() as s:
-        names = await list_distinct_teachers(s)
+    names = await directory.zoom_teacher_names()
     if not names:
         await message.answer("У базі поки немає жодного викладача (спершу імпортуйте розклад).")
         return
 
-    await state.update_data(teacher_names=names, page=0)
-    kb = paginated_kb([(str(i), n) for i, n in enumerate(names)], page=0, per_page=10, prefix="tz")
-    await message.answer("Оберіть викладача:", reply_markup=kb)
+    await state.update_data(page=0, ver=directory.list_version(names))
+    await message.answer("Оберіть викладача:", reply_markup=_zoom_kb(names, 0))
     await state.set_state(ZoomAdd.teacher)
 
 @router.callback_query(ZoomAdd.teacher)
 async def addzoom_pick_teacher(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    names = data.get("teacher_names", [])
+    names = await directory.zoom_teacher_names()
     page = data.get("page", 0)
     payload = cb.data
 
+    if data.get("ver") != directory.list_version(names):
+        # список оновився, поки адміністратор гортав — номери кнопок уже інші
+        await state.update_data(page=0, ver=directory.list_version(names))
+        await cb.message.edit_text("Список викладачів оновився, оберіть ще раз:", reply_markup=_zoom_kb(names, 0))
+        await cb.answer(); return
+
     if payload == "tz:__prev__":
         page = max(0, page - 1)
         await state.update_data(page=page)
-        kb = paginated_kb([(str(i), n) for i, n in enumerate(names)], page=page, per_page=10, prefix="tz")
-        await cb.message.edit_reply_markup(reply_markup=kb)
+        await cb.message.edit_reply_markup(reply_markup=_zoom_kb(names, page))
         await cb.answer(); return
 
     if payload == "tz:__next__":
         page = page + 1
         await state.update_data(page=page)
-        kb = paginated_kb([(str(i), n) for i, n in enumerate(names)], page=page, per_page=10, prefix="tz")
-        await cb.message.edit_reply_markup(reply_markup=kb)
+        await cb.message.edit_reply_markup(reply_markup=_zoom_kb(names, page))
         await cb.answer(); return
 
     if payload.startswith("tz:"):
@@ -340,10 +398,120 @@ async def addzoom_save(message: Message, state: FSMContext):
         await message.answer("Це не схоже на URL. Надішліть нормальний лінк, будь ласка.")
         return
 
-    sm = get_sessionmaker()
-    async with sm() as s:
-        await set_zoom_link(s, sel, url)
-        await s.commit()
+    await write(lambda s: set_zoom_link(s, sel, url))
 
     await message.answer(f"Збережено Zoom для «{sel}»:\n{url}")
     await state.clear()
+
+
+# ---------- Адмін-команда: стан ----------
+def _is_admin(message: Message) -> bool:
+    return bool(message.from_user) and message.from_user.id in Config.load().admin_ids
+
+async def _status_text() -> str:
+    h = get_source_health().snapshot()
+    eng = get_refresh_engine()
+    lines = [
+        "Джерело розкладу:",
+        f"• запобіжник: {h['circuit']}"
+        + (f" (проба через {h['retry_in_s']} с)" if h["retry_in_s"] else "")
+        + f", помилок поспіль: {h['consecutive_failures']}, спрацювань: {h['trips']}",
+        f"• паралельність: ліміт {h['limit']}, зараз {h['in_flight']}, "
+        f"затримка ~{h['latency_ms'] if h['latency_ms'] is not None else '—'} мс",
+        f"• запитів: {h['requests']}, помилок: {h['errors']}, відхилено: {h['rejected']}",
+    ]
+    if h["last_error"]:
+        lines.append(f"• остання помилка: {h['last_error']} ({h['last_error_at']:%d.%m %H:%M:%S} UTC)")
+    lines += [
+        "Оновлення:",
+        f"• завантажень: {eng.fetches} (усе вікно: {eng.far_fetches}, {eng.fetched_bytes / 1e6:.1f} МБ), "
+        f"без запиту (з груп): {eng.derived_skips}, "
+        f"пропущено (backoff): {eng.backoff_skips}, фонових: {eng.revalidations}",
+        f"• single-flight: запущено {eng.flights.started}, приєднано {eng.flights.joined}",
+        f"• негативних результатів: {eng.negatives}, пропущено (негативний кеш): {eng.negative_skips}",
+    ]
+    subs = get_subscriptions()
+    lines.append(
+        f"• підписки: груп {len(subs.counts('group'))}, викладачів {len(subs.counts('teacher'))}"
+    )
+    u = get_chat_ordering().snapshot()
+    bg = get_background_jobs().snapshot()
+    lines += [
+        "Оновлення Telegram:",
+        f"• виконується {u['in_flight']}/{u['limit']}, у черзі {u['waiting']} (чатів з чергою {u['chats_queued']}), "
+        f"оброблено {u['processed']}, помилок {u['failed']}",
+        f"• очікування ~{u['avg_wait_ms']} мс (макс. {u['max_wait_ms']}), обробка ~{u['avg_handle_ms']} мс",
+        f"• фонові задачі: зараз {bg['running']}, запущено {bg['started']}, повторів відкинуто {bg['deduplicated']}, "
+        f"помилок {bg['failed']}, ~{bg['avg_ms']} мс (макс. {bg['max_ms']})",
+    ]
+    th = get_throttling().snapshot()
+    lines.append(
+        f"• флуд-контроль: пропущено {th['allowed']}, відхилено {th['throttled']}"
+        + (" (" + ", ".join(f"{c} ×{n}" for c, n in th["by_command"].items()) + ")" if th["by_command"] else "")
+        + f", користувачів у лічильниках {th['tracked']}"
+    )
+    lz = get_leases().snapshot()
+    if lz["shard_count"]:
+        lines.append(
+            f"• примірник {lz['instance']}: шардів {lz['shards']}/{lz['shard_count']}, "
+            f"примірників {lz['members']}, лідер: {'так' if lz['leader'] else 'ні'}, "
+            f"heartbeat: {lz['heartbeats']} (невдалих {lz['failures']})"
+        )
+    q = get_query_stats().snapshot(top=3)
+    if q:
+        lines.append("• SQL на обробник (найдорожчі): " + "; ".join(
+            f"{r['name']} ~{r['avg_statements']} (макс. {r['max_statements']}, ~{r['avg_ms']} мс"
+            + (f", понад бюджет {r['over_budget']}" if r["over_budget"] else "") + ")"
+            for r in q
+        ))
+    pr = get_profiler().snapshot()
+    if pr["targets"] or pr["files"]:
+        lines.append(
+            f"• профілювання: цілі {', '.join(pr['targets']) or '—'}, зараз {', '.join(pr['active']) or '—'}, "
+            f"файлів записано {pr['files']}, tracemalloc: {'так' if pr['tracemalloc'] else 'ні'}"
+        )
+    dc = directory.get_directory()
+    lines.append(f"• довідники: списків у кеші {len(dc)}, влучань {dc.hits}, промахів {dc.misses}")
+    plan = get_last_plan()
+    if plan:
+        lines.append("План оновлень:")
+        lines += [f"• {line}" for line in plan.report(top=5).splitlines()]
+    async with get_read_sessionmaker()() as s:
+        negatives = await negative_refresh_states(s, datetime.utcnow())
+    if negatives:
+        lines.append("Негативний кеш (UTC):")
+        lines += [
+            f"• {st.kind} {st.entity_id}: {st.negative_kind} ×{st.negative_count}, до {st.negative_until:%d.%m %H:%M}"
+            for st in negatives
+        ]
+    return "\n".join(lines)
+
+@router.message(Command("status"))
+async def status_cmd(message: Message):
+    if not _is_admin(message):
+        return
+    await message.answer(await _status_text())
+
+# ---------- Адмін-команда: профіль процесу ----------
+PROFILE_DEFAULT_SECONDS = 30
+
+@router.message(Command("profile"))
+async def profile_cmd(message: Message, command: CommandObject):
+    """/profile [секунд] [mem] — семпли стеків усього процесу (і топ виділень з mem), файли — документами."""
+    if not _is_admin(message):
+        return
+    profiler = get_profiler()
+    if profiler.capturing:
+        await message.answer("Профілювання вже триває.")
+        return
+    args = (command.args or "").split()
+    seconds = min(next((int(a) for a in args if a.isdigit()), PROFILE_DEFAULT_SECONDS), profiler.max_seconds)
+    memory = "mem" in args
+    await message.answer(f"Профілюю {seconds} с" + (" (з пам'яттю)" if memory else "") + "…")
+
+    async def _job():
+        for path in await profiler.capture(seconds, memory=memory):
+            await message.answer_document(FSInputFile(path), caption=path.name)
+
+    # окремою задачею: черга чату адміністратора не чекає на профіль
+    get_background_jobs().spawn("profile", _job, key=("profile",))
@@ -1,8 +1,11 @@
+import logging
+
 from aiogram import Router
 from aiogram.types import ErrorEvent
 
 router = Router(name="errors")
+log = logging.getLogger(__name__)
 
 @router.errors()
 async def errors_handler(event: ErrorEvent):
-    print("Error in update:", event.exception)
+    log.error("Error in update %s", event.update.update_id, exc_info=event.exception)
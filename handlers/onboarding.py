@@ -4,29 +4,31 @@ from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-import re
-from urllib.parse import urlparse
-
-from db import get_sessionmaker
-from models import User, Teacher, TimetableEvent
-from parsing.client import SourceClient
-from parsing.extractors import (
-    parse_faculties, parse_courses, parse_groups,
-    parse_chairs, parse_teachers,
-    parse_timetable, parse_timetable_teacher
-)
-from config import Config
-from repositories import (
-    upsert_faculties, upsert_groups, upsert_chairs, upsert_teachers,
-    sync_events_for_group, sync_events_for_teacher
-)
+from typing import Awaitable, Callable
+
+from writer import write
+from models import User
+from parsing.health import SourceUnavailable
+import directory
+from refresh import get_refresh_engine
+from subscriptions import get_subscriptions, subscriptions_of
 from keyboards import paginated_kb, main_menu_kb, BTN_SETTINGS
+from middlewares.db_session import UpdateSession
+from utils.background import get_background_jobs
 from utils.diag import log
 
 router = Router(name="onboarding")
 
 MINUTES_OPTIONS = [1, 5, 10]
 LIST_PER_PAGE = 10  # скільки елементів на сторінку в інлайн-клавіатурі
+SOURCE_PAUSED_TEXT = "Сайт розкладу зараз не відповідає — розклад завантажиться автоматично трохи пізніше."
+IMPORT_PROGRESS_TEXT = "⏳ Завантажую розклад…"
+IMPORT_DONE_TEXT = "✅ Розклад завантажено."
+IMPORT_EMPTY_TEXT = "На сайті поки немає розкладу для цього вибору — перевірятиму автоматично."
+IMPORT_FAILED_TEXT = "Не вдалося завантажити розклад — спробую автоматично трохи пізніше."
+GREETING_TEXT = "Вітаємо у розкладі «{name}»!"
+GREETING_LOADING_TEXT = "Вітаємо у розкладі!"
+LIST_UNAVAILABLE_TEXT = "Не вдалося отримати список із сайту розкладу. Спробуйте /start трохи пізніше."
 
 
 class StartFSM(StatesGroup):
@@ -62,66 +64,85 @@ def _page_clamp(total: int, page: int, per_page: int) -> int:
     return page
 
 
+# --------- helpers: списки, що можуть вантажитися з джерела ----------
+View = tuple[str, InlineKeyboardMarkup | None]
+
+
+async def _show_list(
+    message: Message, user_id: int, *, edit: bool, ready: bool, loading_text: str,
+    build: Callable[[], Awaitable[View]],
+) -> None:
+    """
+    Показує список build() -> (текст, клавіатура): редагуванням message (edit) або новим повідомленням.
+    Список уже в кеші (ready) — одразу; інакше — «завантажую…», а запит до джерела йде у фоні
+    й дописує список у те саме повідомлення (черга оновлень чату не чекає на сайт розкладу).
+    """
+    if ready:
+        text, kb = await build()
+        if edit:
+            await message.edit_text(text, reply_markup=kb)
+        else:
+            await message.answer(text, reply_markup=kb)
+        return
+
+    target = message
+    if edit:
+        await message.edit_text(loading_text)
+    else:
+        target = await message.answer(loading_text)
+
+    async def _job():
+        try:
+            text, kb = await build()
+        except Exception:
+            await target.edit_text(LIST_UNAVAILABLE_TEXT)
+            raise  # у журнал — через лічильник фонових задач
+        await target.edit_text(text, reply_markup=kb)
+
+    # ключ — повідомлення, яке дописує задача: повторне натискання на ньому не запускає ще один
+    # запит, а новий /start чи інша роль (нове повідомлення) отримує власну задачу
+    get_background_jobs().spawn(
+        f"onboarding-list-{user_id}", _job, key=("onboarding", user_id, target.chat.id, target.message_id),
+    )
+
+
 # =======================================
 #                 /start
 # =======================================
 @router.message(Command("start"))
 async def start_cmd(message: Message, state: FSMContext):
     await state.clear()
-    # Привітання з назвою ЗВО (беремо з головної сторінки BASE_URL)
-    cfg = Config.load()
-    name = await _get_institution_name(cfg)
-    if name:
-        await message.answer(f"Вітаємо у розкладі «{name}»!")
+    # Привітання з назвою ЗВО (з головної сторінки BASE_URL, через кеш довідників):
+    # поки назва вантажиться — коротке привітання, яке фонова задача допише
+    await _show_list(
+        message, message.from_user.id, edit=False, ready=directory.ready("institution"),
+        loading_text=GREETING_LOADING_TEXT, build=_greeting,
+    )
     # Далі — вибір ролі
     await message.answer("Будь ласка, оберіть роль:", reply_markup=role_keyboard())
     await state.set_state(StartFSM.role)
 
 
+async def _greeting() -> View:
+    return GREETING_TEXT.format(name=await directory.institution_name()), None
+
+
 @router.message(F.text == BTN_SETTINGS)
 async def settings_btn(message: Message, state: FSMContext):
     """Кнопка 'Налаштування' повторює сценарій /start."""
     return await start_cmd(message, state)
 
 
-# --------- helpers: institution name ----------
-async def _get_institution_name(cfg: Config) -> str:
-    """Пробуємо витягти назву ЗВО з головної сторінки; фолбек — хост з BASE_URL."""
-    try:
-        async with SourceClient(cfg) as sc:
-            html = await sc.get_home()
-    except Exception:
-        html = ""
-
-    name = ""
-    if html:
-        # 1) Спроба зчитати з елемента з класом, що містить 'header'
-        m = re.search(r'<div[^>]*class="[^"]*\bheader\b[^"]*"[^>]*>(.*?)</div>', html, re.I | re.S)
-        if m:
-            inner = re.sub(r'<[^>]+>', '', m.group(1))
-            name = re.sub(r'\s+', ' ', inner).strip()
-        # 2) Запасний варіант — тег <title>
-        if not name:
-            m = re.search(r'<title[^>]*>(.*?)</title>', html, re.I | re.S)
-            if m:
-                inner = re.sub(r'<[^>]+>', '', m.group(1))
-                name = re.sub(r'\s+', ' ', inner).strip()
-
-    # 3) Фолбек — хост із URL
-    if not name:
-        host = urlparse(cfg.base_url).hostname or cfg.base_url
-        name = host
-    return name
-
-
 @router.callback_query(StartFSM.role, F.data.startswith("role:"))
 async def pick_role(cb: CallbackQuery, state: FSMContext):
     role = cb.data.split(":", 1)[1]
-    sm = get_sessionmaker()
-    async with sm() as s:
-        u = await s.get(User, cb.from_user.id)
+    user_id = cb.from_user.id
+
+    async def _save_role(s):
+        u = await s.get(User, user_id)
+        before = subscriptions_of(u)
         if not u:
-            u = User(user_id=cb.from_user.id, role=role)
+            u = User(user_id=user_id, role=role)
             s.add(u)
         else:
             u.role = role
@@ -129,53 +150,78 @@ async def pick_role(cb: CallbackQuery, state: FSMContext):
                 u.teacher_id = None; u.chair_id = None
             else:
                 u.group_id = None; u.faculty_id = None; u.course = None
-        await s.commit()
+        return before, subscriptions_of(u)
 
+    get_subscriptions().update(*await write(_save_role))
+
+    await cb.answer()
     await cb.message.edit_text("Роль збережено.")
     if role == "student":
         await _student_flow_start(cb, state)
     else:
         await _teacher_flow_start(cb, state)
-    await cb.answer()
 
 
 # =======================================
 #              STUDENT FLOW
 # =======================================
-async def _student_flow_start(cb: CallbackQuery, state: FSMContext):
-    cfg = Config.load()
-    sm = get_sessionmaker()
-    async with sm() as s, SourceClient(cfg) as sc:
-        html = await sc.get_start()
-        faculties = parse_faculties(html)
-        await upsert_faculties(s, faculties)
-        await s.commit()
+# У FSM — лише id і номери сторінок; списки беруться зі спільного кешу directory.py
+def _faculty_kb(faculties: list[tuple[int, str]], page: int) -> InlineKeyboardMarkup:
+    return paginated_kb([(str(fid), title) for fid, title in faculties],
+                        prefix="fac", per_page=LIST_PER_PAGE, page=page)
 
+
+def _group_kb(groups: list[tuple[int, str]], page: int) -> InlineKeyboardMarkup:
+    return paginated_kb([(str(gid), title) for gid, title in groups],
+                        prefix="grp", per_page=LIST_PER_PAGE, page=page)
+
+
+async def _faculties_view() -> View:
+    faculties = await directory.faculties()
     log(f"faculties: {len(faculties)}")
-    await state.update_data(fac_list=faculties, fac_page=0)
+    if not faculties:
+        return LIST_UNAVAILABLE_TEXT, None
+    return "Оберіть факультет:", _faculty_kb(faculties, 0)
+
+
+async def _courses_view(faculty_id: int) -> View:
+    courses = await directory.courses(faculty_id)
+    log(f"courses for fac {faculty_id}: {len(courses)}")
+    return "Оберіть курс:", paginated_kb([(str(c), f"{c} курс") for c in courses],
+                                          prefix="crs", per_page=LIST_PER_PAGE, page=0)
+
+
+async def _groups_view(faculty_id: int, course: int) -> View:
+    groups = await directory.groups(faculty_id, course)
+    log(f"groups for fac {faculty_id} course {course}: {len(groups)}")
+    if not groups:
+        return LIST_UNAVAILABLE_TEXT, None
+    return "Оберіть групу:", _group_kb(groups, 0)
 
-    kb = paginated_kb([(str(fid), title) for fid, title in faculties],
-                      prefix="fac", per_page=LIST_PER_PAGE, page=0)
-    await cb.message.answer("Оберіть факультет:", reply_markup=kb)
+
+async def _student_flow_start(cb: CallbackQuery, state: FSMContext):
+    await state.update_data(fac_page=0)
     await state.set_state(StartFSM.faculty)
+    await _show_list(
+        cb.message, cb.from_user.id, edit=False, ready=directory.ready("faculties"),
+        loading_text="Завантажую список факультетів…", build=_faculties_view,
+    )
 
 
 @router.callback_query(StartFSM.faculty)
 async def pick_faculty(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    fac_list: list[tuple[int, str]] = data.get("fac_list", [])
     page = int(data.get("fac_page", 0))
 
     payload = cb.data
 
     # пагінація
     if payload == "fac:__prev__" or payload == "fac:__next__":
+        fac_list = await directory.faculties()
         delta = -1 if payload.endswith("__prev__") else +1
         page = _page_clamp(len(fac_list), page + delta, LIST_PER_PAGE)
         await state.update_data(fac_page=page)
-        kb = paginated_kb([(str(fid), title) for fid, title in fac_list],
-                          prefix="fac", per_page=LIST_PER_PAGE, page=page)
-        await cb.message.edit_reply_markup(reply_markup=kb)
+        await cb.message.edit_reply_markup(reply_markup=_faculty_kb(fac_list, page))
         await cb.answer()
         return
 
@@ -185,24 +231,15 @@ async def pick_faculty(cb: CallbackQuery, state: FSMContext):
 
     faculty_id = int(payload.split(":", 1)[1])
     await state.update_data(faculty_id=faculty_id)
-
-    # тягнемо курси для обраного факультету
-    cfg = Config.load()
-    async with SourceClient(cfg) as sc:
-        html = await sc.post_faculty_form(faculty_id=faculty_id)
-        courses = parse_courses(html)
-    if not courses:
-        courses = [1, 2, 3, 4]
-
-    log(f"courses for fac {faculty_id}: {len(courses)}")
-    await state.update_data(courses=courses)
-
-    kb = paginated_kb([(str(c), f"{c} курс") for c in courses],
-                      prefix="crs", per_page=LIST_PER_PAGE, page=0)
-    await cb.message.edit_text("Оберіть курс:", reply_markup=kb)
     await state.set_state(StartFSM.course)
     await cb.answer()
 
+    # курси обраного факультету
+    await _show_list(
+        cb.message, cb.from_user.id, edit=True, ready=directory.ready("courses", faculty_id),
+        loading_text="Завантажую курси…", build=lambda: _courses_view(faculty_id),
+    )
+
 
 @router.callback_query(StartFSM.course)
 async def pick_course(cb: CallbackQuery, state: FSMContext):
@@ -218,36 +255,28 @@ async def pick_course(cb: CallbackQuery, state: FSMContext):
     st = await state.get_data()
     faculty_id = st["faculty_id"]
 
-    cfg = Config.load()
-    async with SourceClient(cfg) as sc:
-        html = await sc.post_group_form(faculty_id=faculty_id, course=course)
-        groups = parse_groups(html)
-
-    await state.update_data(course=course, group_list=groups, group_page=0)
-
-    log(f"groups for fac {faculty_id} course {course}: {len(groups)}")
-    kb = paginated_kb([(str(gid), title) for gid, title in groups],
-                      prefix="grp", per_page=LIST_PER_PAGE, page=0)
-    await cb.message.edit_text("Оберіть групу:", reply_markup=kb)
+    await state.update_data(course=course, group_page=0)
     await state.set_state(StartFSM.group)
     await cb.answer()
+    await _show_list(
+        cb.message, cb.from_user.id, edit=True, ready=directory.ready("groups", faculty_id, course),
+        loading_text="Завантажую список груп…", build=lambda: _groups_view(faculty_id, course),
+    )
 
 
 @router.callback_query(StartFSM.group)
-async def pick_group(cb: CallbackQuery, state: FSMContext):
+async def pick_group(cb: CallbackQuery, state: FSMContext, db: UpdateSession):
     data = await state.get_data()
-    groups: list[tuple[int, str]] = data.get("group_list", [])
     page = int(data.get("group_page", 0))
     payload = cb.data
 
     # пагінація груп
     if payload in ("grp:__prev__", "grp:__next__"):
+        groups = await directory.groups(data["faculty_id"], data["course"])
         delta = -1 if payload.endswith("__prev__") else +1
         page = _page_clamp(len(groups), page + delta, LIST_PER_PAGE)
         await state.update_data(group_page=page)
-        kb = paginated_kb([(str(gid), title) for gid, title in groups],
-                          prefix="grp", per_page=LIST_PER_PAGE, page=page)
-        await cb.message.edit_reply_markup(reply_markup=kb)
+        await cb.message.edit_reply_markup(reply_markup=_group_kb(groups, page))
         await cb.answer()
         return
 
@@ -260,68 +289,76 @@ async def pick_group(cb: CallbackQuery, state: FSMContext):
     course = data["course"]
 
     # зберігаємо вибір користувача
-    sm = get_sessionmaker()
-    cfg = Config.load()
-    async with sm() as s:
-        u = await s.get(User, cb.from_user.id)
+    user_id = cb.from_user.id
+
+    async def _save_group(s):
+        u = await s.get(User, user_id)
+        before = subscriptions_of(u)
         u.role = "student"
         u.faculty_id = faculty_id
         u.course = course
         u.group_id = group_id
-        await s.commit()
+        return before, subscriptions_of(u)
 
-    # завантаження розкладу
-    async with sm() as s, SourceClient(cfg) as sc:
-        html = await sc.post_filter(faculty_id=faculty_id, course=course, group_id=group_id)
-        events_dicts = list(parse_timetable(html, group_id=group_id, cfg_times=cfg.lesson_times))
-        new_events = [TimetableEvent(**d) for d in events_dicts]
-        await sync_events_for_group(s, group_id, new_events)
-        await s.commit()
+    get_subscriptions().update(*await write(_save_group))
 
-    # вибір хвилин нагадувань
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=f"{m} хв", callback_data=f"nm:{m}")] for m in MINUTES_OPTIONS
-    ])
-    await cb.message.edit_text("За скільки хвилин нагадувати перед парою?", reply_markup=kb)
+    # вибір хвилин нагадувань — одразу, розклад вантажиться у фоні
     await state.set_state(StartFSM.notify)
     await cb.answer()
+    await cb.message.edit_text("За скільки хвилин нагадувати перед парою?", reply_markup=_notify_kb())
+    await _start_import(cb.message, user_id, "group", group_id, db)
 
 
 # =======================================
 #              TEACHER FLOW
 # =======================================
-async def _teacher_flow_start(cb: CallbackQuery, state: FSMContext):
-    cfg = Config.load()
-    sm = get_sessionmaker()
-    async with sm() as s, SourceClient(cfg) as sc:
-        html = await sc.get_teacher_start()
-        chairs = parse_chairs(html)
-        await upsert_chairs(s, chairs)
-        await s.commit()
+def _chair_kb(chairs: list[tuple[int, str]], page: int) -> InlineKeyboardMarkup:
+    return paginated_kb([(str(cid), title) for cid, title in chairs],
+                        prefix="chr", per_page=LIST_PER_PAGE, page=page)
+
 
+def _teacher_kb(teachers: list[tuple[int, str]], page: int) -> InlineKeyboardMarkup:
+    return paginated_kb([(str(tid), fio) for tid, fio in teachers],
+                        prefix="tch", per_page=LIST_PER_PAGE, page=page)
+
+
+async def _chairs_view() -> View:
+    chairs = await directory.chairs()
     log(f"chairs: {len(chairs)}")
-    await state.update_data(chair_list=chairs, chr_page=0)
+    if not chairs:
+        return LIST_UNAVAILABLE_TEXT, None
+    return "Оберіть кафедру:", _chair_kb(chairs, 0)
+
+
+async def _teachers_view(chair_id: int) -> View:
+    teachers = await directory.teachers(chair_id)
+    log(f"teachers for chair {chair_id}: {len(teachers)}")
+    if not teachers:
+        return LIST_UNAVAILABLE_TEXT, None
+    return "Оберіть викладача:", _teacher_kb(teachers, 0)
 
-    kb = paginated_kb([(str(cid), title) for cid, title in chairs],
-                      prefix="chr", per_page=LIST_PER_PAGE, page=0)
-    await cb.message.answer("Оберіть кафедру:", reply_markup=kb)
+
+async def _teacher_flow_start(cb: CallbackQuery, state: FSMContext):
+    await state.update_data(chr_page=0)
     await state.set_state(StartFSM.chair)
+    await _show_list(
+        cb.message, cb.from_user.id, edit=False, ready=directory.ready("chairs"),
+        loading_text="Завантажую список кафедр…", build=_chairs_view,
+    )
 
 
 @router.callback_query(StartFSM.chair)
 async def pick_chair(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    chairs: list[tuple[int, str]] = data.get("chair_list", [])
     page = int(data.get("chr_page", 0))
     payload = cb.data
 
     if payload in ("chr:__prev__", "chr:__next__"):
+        chairs = await directory.chairs()
         delta = -1 if payload.endswith("__prev__") else +1
         page = _page_clamp(len(chairs), page + delta, LIST_PER_PAGE)
         await state.update_data(chr_page=page)
-        kb = paginated_kb([(str(cid), title) for cid, title in chairs],
-                          prefix="chr", per_page=LIST_PER_PAGE, page=page)
-        await cb.message.edit_reply_markup(reply_markup=kb)
+        await cb.message.edit_reply_markup(reply_markup=_chair_kb(chairs, page))
         await cb.answer()
         return
 
@@ -330,40 +367,27 @@ async def pick_chair(cb: CallbackQuery, state: FSMContext):
         return
 
     chair_id = int(payload.split(":", 1)[1])
-    await state.update_data(chair_id=chair_id)
-
-    cfg = Config.load()
-    sm = get_sessionmaker()
-    async with sm() as s, SourceClient(cfg) as sc:
-        html = await sc.post_teacher_form(chair_id=chair_id)
-        teachers = parse_teachers(html)
-        await upsert_teachers(s, chair_id, teachers)
-        await s.commit()
-
-    log(f"teachers for chair {chair_id}: {len(teachers)}")
-    await state.update_data(teacher_list=teachers, tch_page=0)
-
-    kb = paginated_kb([(str(tid), fio) for tid, fio in teachers],
-                      prefix="tch", per_page=LIST_PER_PAGE, page=0)
-    await cb.message.edit_text("Оберіть викладача:", reply_markup=kb)
+    await state.update_data(chair_id=chair_id, tch_page=0)
     await state.set_state(StartFSM.teacher)
     await cb.answer()
+    await _show_list(
+        cb.message, cb.from_user.id, edit=True, ready=directory.ready("teachers", chair_id),
+        loading_text="Завантажую список викладачів…", build=lambda: _teachers_view(chair_id),
+    )
 
 
 @router.callback_query(StartFSM.teacher)
-async def pick_teacher(cb: CallbackQuery, state: FSMContext):
+async def pick_teacher(cb: CallbackQuery, state: FSMContext, db: UpdateSession):
     data = await state.get_data()
-    tlist: list[tuple[int, str]] = data.get("teacher_list", [])
     page = int(data.get("tch_page", 0))
     payload = cb.data
 
     if payload in ("tch:__prev__", "tch:__next__"):
+        tlist = await directory.teachers(data["chair_id"])
         delta = -1 if payload.endswith("__prev__") else +1
         page = _page_clamp(len(tlist), page + delta, LIST_PER_PAGE)
         await state.update_data(tch_page=page)
-        kb = paginated_kb([(str(tid), fio) for tid, fio in tlist],
-                          prefix="tch", per_page=LIST_PER_PAGE, page=page)
-        await cb.message.edit_reply_markup(reply_markup=kb)
+        await cb.message.edit_reply_markup(reply_markup=_teacher_kb(tlist, page))
         await cb.answer()
         return
 
@@ -374,32 +398,62 @@ async def pick_teacher(cb: CallbackQuery, state: FSMContext):
     teacher_id = int(payload.split(":", 1)[1])
     chair_id = data["chair_id"]
 
-    sm = get_sessionmaker()
-    cfg = Config.load()
+    user_id = cb.from_user.id
 
-    async with sm() as s:
-        u = await s.get(User, cb.from_user.id)
+    async def _save_teacher(s):
+        u = await s.get(User, user_id)
+        before = subscriptions_of(u)
         u.role = "teacher"
         u.chair_id = chair_id
         u.teacher_id = teacher_id
-        await s.commit()
+        return before, subscriptions_of(u)
 
-        t = await s.get(Teacher, teacher_id)
-        teacher_full = t.full_name if t else None
+    get_subscriptions().update(*await write(_save_teacher))
 
-    async with sm() as s, SourceClient(cfg) as sc:
-        html = await sc.post_teacher_filter(chair_id=chair_id, teacher_id=teacher_id)
-        events_dicts = list(parse_timetable_teacher(html, teacher_id=teacher_id, teacher_full_name=teacher_full, cfg_times=cfg.lesson_times))
-        new_events = [TimetableEvent(**d) for d in events_dicts]
-        await sync_events_for_teacher(s, teacher_id, new_events)
-        await s.commit()
+    await state.set_state(StartFSM.notify)
+    await cb.answer()
+    await cb.message.edit_text("За скільки хвилин нагадувати перед парою?", reply_markup=_notify_kb())
+    await _start_import(cb.message, user_id, "teacher", teacher_id, db)
 
-    kb = InlineKeyboardMarkup(inline_keyboard=[
+
+# =======================================
+#         ІМПОРТ РОЗКЛАДУ ПІСЛЯ ВИБОРУ
+# =======================================
+def _notify_kb() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=f"{m} хв", callback_data=f"nm:{m}")] for m in MINUTES_OPTIONS
     ])
-    await cb.message.edit_text("За скільки хвилин нагадувати перед парою?", reply_markup=kb)
-    await state.set_state(StartFSM.notify)
-    await cb.answer()
+
+
+async def _start_import(message: Message, user_id: int, kind: str, entity_id: int, db: UpdateSession) -> None:
+    """
+    Завантажує розклад обраної групи/викладача фоновою задачею і повідомляє про результат
+    редагуванням окремого повідомлення. Свіжий розклад у БД (is_fresh) не перезавантажується.
+    Кілька користувачів, що обрали ту саму групу, чекають один запит (single-flight у RefreshEngine).
+    """
+    engine = get_refresh_engine()
+    fresh = await engine.is_fresh(kind, entity_id, session=db.session)
+    await db.release()
+    if fresh:
+        return
+    status = await message.answer(IMPORT_PROGRESS_TEXT)
+
+    async def _job():
+        # вибір користувача — без backoff і негативного кешу
+        refresh = engine.refresh_group if kind == "group" else engine.refresh_teacher
+        try:
+            result = await refresh(entity_id, force=True)
+        except SourceUnavailable:
+            await status.edit_text(SOURCE_PAUSED_TEXT)
+            return
+        except Exception:
+            await status.edit_text(IMPORT_FAILED_TEXT)
+            raise
+        await status.edit_text(IMPORT_DONE_TEXT if result is not None else IMPORT_EMPTY_TEXT)
+
+    get_background_jobs().spawn(
+        f"import-{kind}-{entity_id}", _job, key=("import", user_id, kind, entity_id),
+    )
 
 
 # =======================================
@@ -408,11 +462,13 @@ async def pick_teacher(cb: CallbackQuery, state: FSMContext):
 @router.callback_query(StartFSM.notify, F.data.startswith("nm:"))
 async def pick_notify(cb: CallbackQuery, state: FSMContext):
     minutes = int(cb.data.split(":", 1)[1])
-    sm = get_sessionmaker()
-    async with sm() as s:
-        u = await s.get(User, cb.from_user.id)
+    user_id = cb.from_user.id
+
+    async def _save_notify(s):
+        u = await s.get(User, user_id)
         u.notify_offset_min = minutes
-        await s.commit()
+
+    await write(_save_notify)
     await state.clear()
     # Після завершення налаштувань показуємо постійну клавіатуру-меню
     await cb.message.answer(
@@ -0,0 +1,152 @@
+"""
+Кілька примірників бота: хто з них нагадує яким користувачам і оновлює які розклади.
+
+Користувачі, групи й викладачі розкладені по SHARD_COUNT шардах (id % SHARD_COUNT).
+Кожен примірник раз на LEASE_HEARTBEAT_SECONDS:
+  • продовжує свій запис у cluster_members (живий, доки не мине LEASE_TTL_SECONDS);
+  • rendezvous-хешуванням над живими примірниками визначає «свої» шарди — коли примірник
+    з'являється чи зникає, переїжджає лише ~1/N шардів;
+  • віддає шарди, що більше не його, продовжує свої і забирає вільні чи прострочені в shard_leases.
+Шард, який ще тримає живий попередній власник, переходить після того, як той його віддасть
+на своєму heartbeat, — два примірники не обробляють шард одночасно. Мертвий примірник втрачає
+шарди через LEASE_TTL_SECONDS. Якщо heartbeat не вдається, примірник сам перестає вважати шарди
+своїми, щойно оренда могла спливти (годинники примірників мають бути синхронізовані).
+
+Шард 0 — ще й «лідерство»: його власник виконує спільні для БД завдання (нічний клінап).
+SHARD_COUNT=0 — один примірник, усе належить йому.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+
+from config import Config
+from repositories import claim_shards, ensure_shards, heartbeat_member, leave_cluster, live_members
+from writer import write
+
+log = logging.getLogger(__name__)
+
+Listener = Callable[[set[int], set[int]], None]
+
+
+def _score(instance_id: str, shard: int) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{instance_id}:{shard}".encode(), digest_size=8).digest(), "big")
+
+
+def rendezvous_owner(shard: int, members: list[str]) -> str | None:
+    """Примірник з найбільшою вагою hash(примірник, шард) — власник шарда."""
+    return max(members, key=lambda m: _score(m, shard), default=None)
+
+
+class ShardLeases:
+    def __init__(self, cfg: Config, instance_id: str):
+        self.shard_count = max(0, cfg.shard_count)
+        self.instance_id = instance_id
+        self.ttl = timedelta(seconds=max(2, cfg.lease_ttl_seconds))
+        self.started_at = datetime.utcnow()
+        self.held: set[int] = set()
+        self.members: list[str] = []
+        self._valid_until = 0.0
+        self._shards_ready = False
+        self._listeners: list[Listener] = []
+        # Лічильники для діагностики
+        self.heartbeats = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.shard_count > 0
+
+    def add_listener(self, listener: Listener) -> None:
+        """listener(gained, lost) — після heartbeat, що змінив набір шардів."""
+        self._listeners.append(listener)
+
+    def shard_of(self, entity_id: int) -> int:
+        return entity_id % self.shard_count if self.enabled else 0
+
+    def _holds(self, shard: int) -> bool:
+        return shard in self.held and time.monotonic() < self._valid_until
+
+    def owns(self, entity_id: int) -> bool:
+        """Чи обробляє цей примірник користувача/групу/викладача з таким id."""
+        return not self.enabled or self._holds(self.shard_of(entity_id))
+
+    def is_leader(self) -> bool:
+        return not self.enabled or self._holds(0)
+
+    def share(self) -> float:
+        """Частка шардів цього примірника (для поділу бюджету запитів до джерела)."""
+        if not self.enabled:
+            return 1.0
+        return len([s for s in self.held if self._holds(s)]) / self.shard_count
+
+    async def heartbeat(self) -> None:
+        if not self.enabled:
+            return
+        started = time.monotonic()
+        try:
+            held, members = await write(self._heartbeat_op)
+        except Exception:
+            self.failures += 1
+            log.warning("lease heartbeat failed", exc_info=True)
+            return
+        self.heartbeats += 1
+        self._shards_ready = True
+        # оренда рахується від початку heartbeat: БД могла записати її раніше, ніж ми дізналися
+        self._valid_until = started + self.ttl.total_seconds()
+        gained, lost = held - self.held, self.held - held
+        self.held, self.members = held, members
+        if gained or lost:
+            log.info(
+                "shards: +%d -%d, holding %d/%d (%d instances)",
+                len(gained), len(lost), len(held), self.shard_count, len(members),
+            )
+            for listener in self._listeners:
+                try:
+                    listener(gained, lost)
+                except Exception:
+                    log.warning("lease listener failed", exc_info=True)
+
+    async def _heartbeat_op(self, s):
+        now = datetime.utcnow()
+        expires = now + self.ttl
+        if not self._shards_ready:
+            await ensure_shards(s, self.shard_count)
+        await heartbeat_member(s, self.instance_id, self.started_at, now, expires)
+        members = await live_members(s, now)
+        wanted = {i for i in range(self.shard_count) if rendezvous_owner(i, members) == self.instance_id}
+        return await claim_shards(s, self.instance_id, wanted, now, expires), members
+
+    async def leave(self) -> None:
+        """Під час зупинки: віддати шарди одразу, не чекаючи, поки спливе оренда."""
+        if not self.enabled:
+            return
+        self.held = set()
+        await write(lambda s: leave_cluster(s, self.instance_id))
+
+    def snapshot(self) -> dict:
+        return {
+            "instance": self.instance_id,
+            "shards": len(self.held),
+            "shard_count": self.shard_count,
+            "members": len(self.members),
+            "leader": self.is_leader(),
+            "heartbeats": self.heartbeats,
+            "failures": self.failures,
+        }
+
+
+_leases: ShardLeases | None = None
+
+
+def get_leases() -> ShardLeases:
+    global _leases
+    if _leases is None:
+        cfg = Config.load()
+        _leases = ShardLeases(cfg, cfg.instance_id or f"{socket.gethostname()}-{os.getpid()}")
+    return _leases
@@ -0,0 +1,71 @@
+"""
+Одна сесія читання на оновлення Telegram і облік SQL за обробниками.
+
+Внутрішній middleware на dp.message і dp.callback_query (після фільтрів, тож ім'я обробника
+відоме): кладе в data["db"] UpdateSession і рахує інструкції оновлення під іменем обробника
+(querystats.track, бюджет — QUERY_BUDGETS / QUERY_BUDGET_DEFAULT), а тривалість і помилки
+обробника — у метрики (utils/metrics.py). Обробники з PROFILE_TARGETS профілюються (utils/profiling.py).
+
+AsyncSession створюється лише при першому зверненні до db.session, а з'єднання з пулу бере
+лише перший запит. Сесія бачить знімок БД на момент першого запиту (WAL): свої записи через
+письменника обробник читає після db.release(). release() варто викликати й перед мережею
+(відповідь, запит до джерела), щоб не тримати з'єднання читача; сесія після нього знову придатна.
+"""
+from __future__ import annotations
+
+from contextlib import nullcontext
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import get_read_sessionmaker
+from querystats import track
+from utils.metrics import HANDLER_ERRORS, HANDLER_SECONDS
+from utils.profiling import get_profiler
+
+
+class UpdateSession:
+    def __init__(self, sessionmaker):
+        self._sm = sessionmaker
+        self._session: AsyncSession | None = None
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._sm()
+        return self._session
+
+    async def release(self) -> None:
+        """Повертає з'єднання в пул (кінець транзакції читання); сесією можна користуватись далі."""
+        if self._session is not None:
+            await self._session.close()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        h = data.get("handler")
+        name = getattr(h.callback, "__name__", "handler") if h is not None else "handler"
+        db = data["db"] = UpdateSession(get_read_sessionmaker())
+        profiler = get_profiler()
+        code = getattr(h.callback, "__code__", None) if h is not None else None
+        profile = profiler.target(name, code) if code is not None and profiler.wants(name) else nullcontext()
+        try:
+            with HANDLER_SECONDS.time(handler=name), track(name), profile:
+                return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            await db.close()
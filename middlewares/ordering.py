@@ -0,0 +1,127 @@
+"""
+Виконання оновлень: різні чати — паралельно (не більше UPDATE_MAX_CONCURRENCY одночасно),
+оновлення одного чату — строго по черзі, в порядку надходження.
+
+Зовнішній middleware на dp.update, тож працює однаково для polling і webhook. Оновлення
+спершу стає в чергу свого чату, і лише потім займає загальний слот: кілька натискань одного
+користувача не забирають слоти в інших. Довгу роботу обробник віддає у фон
+(utils/background.py), щоб звільнити чергу чату.
+
+Стан FSM читає FSMContextMiddleware ще до цього middleware, тож порядок кроків FSM
+забезпечує events_isolation=SimpleEventIsolation() диспетчера (app.py): наступне оновлення
+того самого ключа FSM чекає і читає стан уже після попереднього.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from config import Config
+
+
+class _ChatQueue:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class ChatOrderingMiddleware(BaseMiddleware):
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max(1, max_concurrency)
+        self._sem = asyncio.Semaphore(self.max_concurrency)
+        self._chats: dict[int, _ChatQueue] = {}
+        # Лічильники для діагностики
+        self.waiting = 0
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        key = chat.id if chat else (user.id if user else None)
+        queue = None
+        if key is not None:
+            queue = self._chats.get(key)
+            if queue is None:
+                queue = self._chats[key] = _ChatQueue()
+            queue.users += 1
+
+        queued = time.monotonic()
+        self.waiting += 1
+        waiting = True
+        try:
+            if queue is not None:
+                await queue.lock.acquire()
+            try:
+                await self._sem.acquire()
+            except BaseException:
+                if queue is not None:
+                    queue.lock.release()
+                raise
+            self.waiting -= 1
+            waiting = False
+            return await self._run(handler, event, data, queued)
+        finally:
+            if waiting:
+                self.waiting -= 1
+            if queue is not None:
+                if not waiting:
+                    queue.lock.release()
+                queue.users -= 1
+                if queue.users == 0:
+                    self._chats.pop(key, None)
+
+    async def _run(self, handler, event, data, queued: float) -> Any:
+        started = time.monotonic()
+        waited = started - queued
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        self.in_flight += 1
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.processed += 1
+            self.busy_seconds += time.monotonic() - started
+            self._sem.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "chats_queued": sum(1 for q in self._chats.values() if q.users > 1),
+            "processed": self.processed,
+            "failed": self.failed,
+            "avg_wait_ms": round(self.wait_seconds / self.processed * 1000) if self.processed else 0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000),
+            "avg_handle_ms": round(self.busy_seconds / self.processed * 1000) if self.processed else 0,
+        }
+
+
+_ordering: ChatOrderingMiddleware | None = None
+
+
+def get_chat_ordering() -> ChatOrderingMiddleware:
+    global _ordering
+    if _ordering is None:
+        _ordering = ChatOrderingMiddleware(Config.load().update_max_concurrency)
+    return _ordering
@@ -0,0 +1,182 @@
+"""
+Захист від флуду: token bucket на користувача для кожного класу дій і спільний bucket
+для дій, що йдуть на сайт розкладу.
+
+Класи дій:
+  • source   — /start, «Налаштування» і остаточний вибір групи/викладача (імпорт розкладу
+               з джерела); проміжні кроки онбордингу — nav: списки беруться з кешу довідників
+               у фоні, і звичайний онбординг не впирається в бюджет source;
+  • schedule — /today, /tomorrow, /week, /next і їхні кнопки (читання БД);
+  • nav      — гортання списків та інші натискання інлайн-кнопок;
+  • other    — решта повідомлень.
+Бюджет класу — THROTTLE_<КЛАС>_PER_MINUTE, запас (burst) — третина хвилинного бюджету;
+0 — без обмеження. Дії класу source додатково обмежені THROTTLE_GLOBAL_SOURCE_PER_MINUTE на всіх.
+
+Зайвий запит не доходить до обробника, БД і джерела: callback отримує коротку підказку
+(answerCallbackQuery), повідомлення — готовий текст, не частіше ніж раз на вікно очікування.
+Адміністратори (ADMIN_IDS) не обмежуються. Відмови рахуються за командами (/status).
+"""
+from __future__ import annotations
+
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+
+from config import Config
+from keyboards import BTN_NEXT, BTN_SETTINGS, BTN_TODAY, BTN_TOMORROW, BTN_WEEK
+
+SOURCE, SCHEDULE, NAV, OTHER = "source", "schedule", "nav", "other"
+
+_COMMANDS = {
+    "start": SOURCE,
+    "today": SCHEDULE, "tomorrow": SCHEDULE, "week": SCHEDULE, "next": SCHEDULE,
+}
+_BUTTONS = {
+    BTN_SETTINGS: ("/start", SOURCE),
+    BTN_TODAY: ("/today", SCHEDULE),
+    BTN_TOMORROW: ("/tomorrow", SCHEDULE),
+    BTN_WEEK: ("/week", SCHEDULE),
+    BTN_NEXT: ("/next", SCHEDULE),
+}
+# префікси callback_data остаточного вибору в онбордингу — він імпортує розклад з джерела (гортання — ні)
+_SOURCE_CALLBACKS = {"grp", "tch"}
+
+THROTTLED_TEXT = "Забагато запитів. Спробуйте знову за {wait} с."
+# скільки користувачів тримати в пам'яті, перш ніж прибрати повні (давно неактивні) buckets
+_PRUNE_AT = 5000
+
+
+def classify(event: Message | CallbackQuery) -> tuple[str, str]:
+    """(назва команди для лічильників, клас дії)."""
+    if isinstance(event, CallbackQuery):
+        prefix, _, rest = (event.data or "").partition(":")
+        if prefix in _SOURCE_CALLBACKS and not rest.startswith("__"):
+            return f"cb:{prefix}", SOURCE
+        return f"cb:{prefix or '?'}", NAV
+    text = (event.text or "").strip()
+    if text in _BUTTONS:
+        return _BUTTONS[text]
+    if text.startswith("/"):
+        name = text.split()[0][1:].split("@")[0].lower()
+        return f"/{name}", _COMMANDS.get(name, OTHER)
+    return "text", OTHER
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, rate: float, capacity: float, now: float) -> float:
+        """Забирає токен. Повертає 0, якщо вдалося, інакше — скільки секунд чекати на наступний."""
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+    def full_at(self, rate: float, capacity: float) -> float:
+        return self.updated + (capacity - self.tokens) / rate
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, cfg: Config):
+        per_minute = {
+            SOURCE: cfg.throttle_source_per_minute,
+            SCHEDULE: cfg.throttle_schedule_per_minute,
+            NAV: cfg.throttle_nav_per_minute,
+            OTHER: cfg.throttle_other_per_minute,
+        }
+        # (токенів за секунду, місткість) для кожного класу; 0 за хвилину — без обмеження
+        self.budgets = {k: (n / 60, max(1.0, n / 3)) for k, n in per_minute.items() if n > 0}
+        self.global_source = (
+            (cfg.throttle_global_source_per_minute / 60, max(1.0, cfg.throttle_global_source_per_minute / 3))
+            if cfg.throttle_global_source_per_minute > 0 else None
+        )
+        self.admin_ids = cfg.admin_ids
+        self._buckets: dict[tuple[int, str], TokenBucket] = {}
+        self._global = TokenBucket(self.global_source[1], time.monotonic()) if self.global_source else None
+        self._noticed_until: dict[int, float] = {}
+        # Лічильники для діагностики
+        self.allowed = 0
+        self.throttled: Counter[str] = Counter()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        target = (event.message or event.callback_query) if isinstance(event, Update) else None
+        user = data.get("event_from_user")
+        if target is None or user is None or user.id in self.admin_ids:
+            return await handler(event, data)
+
+        command, kind = classify(target)
+        wait = self._take(user.id, kind)
+        if not wait:
+            self.allowed += 1
+            return await handler(event, data)
+
+        self.throttled[command] += 1
+        await self._reply(target, user.id, wait)
+        return None
+
+    def _take(self, user_id: int, kind: str) -> float:
+        now = time.monotonic()
+        budget = self.budgets.get(kind)
+        wait = 0.0
+        if budget:
+            bucket = self._buckets.get((user_id, kind))
+            if bucket is None:
+                if len(self._buckets) >= _PRUNE_AT:
+                    self._prune(now)
+                bucket = self._buckets[(user_id, kind)] = TokenBucket(budget[1], now)
+            wait = bucket.take(*budget, now)
+        if not wait and kind == SOURCE and self._global is not None:
+            # спільний бюджет джерела списується лише з дозволених особистим бюджетом запитів
+            wait = self._global.take(*self.global_source, now)
+        return wait
+
+    def _prune(self, now: float) -> None:
+        """Прибирає buckets, що вже наповнилися: новий такий самий створиться за потреби."""
+        for key in [k for k, b in self._buckets.items() if b.full_at(*self.budgets[k[1]]) <= now]:
+            del self._buckets[key]
+        for user_id in [u for u, t in self._noticed_until.items() if t <= now]:
+            del self._noticed_until[user_id]
+
+    async def _reply(self, target: Message | CallbackQuery, user_id: int, wait: float) -> None:
+        text = THROTTLED_TEXT.format(wait=max(1, round(wait)))
+        if isinstance(target, CallbackQuery):
+            await target.answer(text)
+            return
+        # повідомлення — одне на вікно очікування, щоб скрипт не отримував відповідь на кожен запит
+        now = time.monotonic()
+        if self._noticed_until.get(user_id, 0) > now:
+            return
+        self._noticed_until[user_id] = now + wait
+        await target.answer(text)
+
+    def snapshot(self) -> dict:
+        return {
+            "allowed": self.allowed,
+            "throttled": sum(self.throttled.values()),
+            "by_command": dict(self.throttled.most_common(5)),
+            "tracked": len(self._buckets),
+        }
+
+
+_throttling: ThrottlingMiddleware | None = None
+
+
+def get_throttling() -> ThrottlingMiddleware:
+    global _throttling
+    if _throttling is None:
+        _throttling = ThrottlingMiddleware(Config.load())
+    return _throttling
@@ -0,0 +1,304 @@
+"""
+Легка еволюція схеми для вже існуючих БД (bot.db).
+
+metadata.create_all() створює лише відсутні таблиці (разом з їхніми індексами),
+але не чіпає таблиці, що вже існують. Тому все, що змінює існуючу схему, —
+нові індекси, колонки, перенесення даних — описується тут як пронумерований крок.
+
+Поточна версія зберігається в таблиці schema_version. Свіжа БД, створена
+create_all з актуальних моделей, одразу штампується останньою версією.
+Кроки виконуються синхронно через AsyncConnection.run_sync().
+"""
+from __future__ import annotations
+import hashlib
+from types import SimpleNamespace
+from typing import Callable
+
+from sqlalchemy import Connection, Date, inspect, text
+
+import models
+
+
+def _create_indexes(conn: Connection, *names: str) -> None:
+    wanted = set(names)
+    insp = inspect(conn)
+    for table in models.Base.metadata.sorted_tables:
+        for idx in table.indexes:
+            if idx.name not in wanted:
+                continue
+            # індекс над колонкою, яку додасть пізніший крок, — створить той крок
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            if all(c.name in existing for c in idx.columns):
+                idx.create(conn, checkfirst=True)
+
+
+def _add_columns(conn: Connection, table: str, *names: str) -> None:
+    """ALTER TABLE ... ADD COLUMN за визначенням колонки в моделі (тип, NOT NULL, server_default)."""
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    for name in names:
+        if name in existing:
+            continue
+        col = models.Base.metadata.tables[table].c[name]
+        ddl = f"ALTER TABLE {table} ADD COLUMN {name} {col.type.compile(dialect=conn.dialect)}"
+        if col.server_default is not None:
+            ddl += f" DEFAULT {col.server_default.arg}"
+        if not col.nullable:
+            ddl += " NOT NULL"
+        conn.execute(text(ddl))
+
+
+def _m001_hot_query_indexes(conn: Connection) -> None:
+    # Перед унікальним індексом прибираємо можливі дублікати (лишаємо найстаріший запис)
+    conn.execute(text(
+        "DELETE FROM notification_log WHERE id NOT IN ("
+        " SELECT MIN(id) FROM notification_log GROUP BY user_id, event_id"
+        ")"
+    ))
+    _create_indexes(
+        conn,
+        "ux_notif_user_event",
+        "ix_notif_sent_at",
+        "ix_notif_scheduled_for",
+        "ix_users_group_id",
+        "ix_users_teacher_id",
+        "ix_zoom_teacher_id",
+        "ix_teachers_full_name",
+        "ix_events_date",
+        "ix_events_teacher_full",
+    )
+
+
+def _m002_intern_event_strings(conn: Connection) -> None:
+    """
+    Текстові поля timetable_events -> посилання на text_values (<поле>_id),
+    raw_html -> лише sha1 у source_hash. Перетворення на місці, id подій зберігаються.
+    """
+    table = "timetable_events"
+    insp = inspect(conn)
+    columns = {c["name"] for c in insp.get_columns(table)}
+    if "subject_full" not in columns:
+        return
+
+    # старі індекси заважають DROP COLUMN; потрібні створимо наново наприкінці
+    for idx in insp.get_indexes(table):
+        conn.execute(text(f"DROP INDEX {idx['name']}"))
+
+    for field in models.INTERNED_EVENT_FIELDS:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {field}_id INTEGER REFERENCES text_values(id)"))
+        conn.execute(text(
+            f"INSERT INTO text_values (value) SELECT DISTINCT {field} FROM {table} "
+            f"WHERE {field} IS NOT NULL ON CONFLICT (value) DO NOTHING"
+        ))
+        conn.execute(text(
+            f"UPDATE {table} SET {field}_id = (SELECT t.id FROM text_values t WHERE t.value = {table}.{field}) "
+            f"WHERE {field} IS NOT NULL"
+        ))
+
+    # source_hash тепер — sha1 сирого HTML, за ним синхронізація впізнає незмінені події
+    conn.execute(text(f"UPDATE {table} SET source_hash = NULL"))
+    rows = conn.execute(text(f"SELECT id, raw_html FROM {table} WHERE raw_html IS NOT NULL")).all()
+    for i in range(0, len(rows), 500):
+        conn.execute(
+            text(f"UPDATE {table} SET source_hash = :h WHERE id = :id"),
+            [{"id": ev_id, "h": hashlib.sha1(raw.encode("utf-8")).hexdigest()} for ev_id, raw in rows[i:i + 500]],
+        )
+
+    for column in (*models.INTERNED_EVENT_FIELDS, "raw_html"):
+        conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+
+    _create_indexes(conn, *(idx.name for idx in models.TimetableEvent.__table__.indexes))
+
+
+def _rebuild_sqlite_table(conn: Connection, table: str) -> None:
+    """
+    SQLite не вміє DROP COLUMN для колонок із зовнішнім ключем — перебудовуємо таблицю
+    за моделлю: rename → create → copy спільних колонок → drop.
+    legacy_alter_table, щоб посилання з інших таблиць лишились на ім'я `table`.
+    """
+    old = f"{table}__old"
+    model_table = models.Base.metadata.tables[table]
+    conn.execute(text("PRAGMA legacy_alter_table=ON"))
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {old}"))
+    for idx in inspect(conn).get_indexes(old):
+        conn.execute(text(f"DROP INDEX {idx['name']}"))
+    model_table.create(conn)
+    old_columns = {c["name"] for c in inspect(conn).get_columns(old)}
+    columns = ", ".join(c.name for c in model_table.columns if c.name in old_columns)
+    conn.execute(text(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {old}"))
+    conn.execute(text(f"DROP TABLE {old}"))
+    conn.execute(text("PRAGMA legacy_alter_table=OFF"))
+
+
+def _m003_canonical_lessons(conn: Connection) -> None:
+    """
+    Копії одного заняття з розкладів різних груп/викладача зливаються в одне
+    (найменший id), власники переходять у event_groups / event_teachers,
+    журнал нагадувань перепризначається на вцілілу копію.
+    """
+    from repositories import lesson_key
+
+    table = "timetable_events"
+    insp = inspect(conn)
+    if "lesson_key" in {c["name"] for c in insp.get_columns(table)}:
+        return
+    for idx in insp.get_indexes(table):
+        if {"group_id", "teacher_id"} & set(idx["column_names"]):
+            conn.execute(text(f"DROP INDEX {idx['name']}"))
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN lesson_key VARCHAR(40)"))
+
+    def tv(field: str) -> str:
+        return f"(SELECT value FROM text_values WHERE id = e.{field}_id)"
+
+    rows = conn.execute(text(
+        f"SELECT e.id, e.group_id, e.teacher_id, e.date, e.lesson_number, "
+        f"{tv('teacher_short')}, {tv('teacher_full')}, {tv('auditory')}, {tv('subject_full')}, {tv('subject_code')} "
+        f"FROM {table} e ORDER BY e.id"
+    ).columns(date=Date)).all()
+
+    winners: dict[str, int] = {}
+    keys, moved = [], []
+    group_links, teacher_links = set(), set()
+    for ev_id, group_id, teacher_id, day, num, t_short, t_full, aud, subj_full, subj_code in rows:
+        key = lesson_key(SimpleNamespace(
+            date=day, lesson_number=num, teacher_short=t_short, teacher_full=t_full,
+            auditory=aud, subject_full=subj_full, subject_code=subj_code,
+        ))
+        winner = winners.setdefault(key, ev_id)
+        if winner == ev_id:
+            keys.append({"id": ev_id, "k": key})
+        else:
+            moved.append({"loser": ev_id, "winner": winner})
+        if group_id:
+            group_links.add((group_id, day, winner))
+        if teacher_id:
+            teacher_links.add((teacher_id, day, winner))
+
+    if group_links:
+        conn.execute(models.EventGroup.__table__.insert(),
+                     [{"group_id": o, "date": d, "event_id": e} for o, d, e in group_links])
+    if teacher_links:
+        conn.execute(models.EventTeacher.__table__.insert(),
+                     [{"teacher_id": o, "date": d, "event_id": e} for o, d, e in teacher_links])
+    if keys:
+        conn.execute(text(f"UPDATE {table} SET lesson_key = :k WHERE id = :id"), keys)
+    if moved:
+        # копія з розкладу викладача знає перелік груп, з розкладу групи — ПІБ викладача
+        merged = [f"{f}_id" for f in models.INTERNED_EVENT_FIELDS] + ["time_start", "time_end", "source_added"]
+        conn.execute(text(
+            f"UPDATE {table} SET "
+            + ", ".join(f"{c} = COALESCE({c}, (SELECT l.{c} FROM {table} l WHERE l.id = :loser))" for c in merged)
+            + " WHERE id = :winner"
+        ), moved)
+        conn.execute(text(
+            "UPDATE notification_log SET event_id = :winner WHERE event_id = :loser AND user_id NOT IN "
+            "(SELECT user_id FROM notification_log WHERE event_id = :winner)"
+        ), moved)
+        conn.execute(text("DELETE FROM notification_log WHERE event_id = :loser"), moved)
+        conn.execute(text(f"DELETE FROM {table} WHERE id = :loser"), moved)
+
+    if conn.dialect.name == "sqlite":
+        _rebuild_sqlite_table(conn, table)
+    else:
+        conn.execute(text(f"ALTER TABLE {table} DROP COLUMN group_id, DROP COLUMN teacher_id"))
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN lesson_key SET NOT NULL"))
+        _create_indexes(conn, "ux_events_lesson_key")
+
+
+def _m004_teacher_derivation(conn: Connection) -> None:
+    if "derived" not in {c["name"] for c in inspect(conn).get_columns("event_teachers")}:
+        conn.execute(text("ALTER TABLE event_teachers ADD COLUMN derived BOOLEAN NOT NULL DEFAULT FALSE"))
+    _create_indexes(conn, "ix_groups_title", "ix_teachers_short_name")
+
+
+def _m005_refresh_attempts(conn: Connection) -> None:
+    _add_columns(conn, "refresh_state", "last_attempt_at", "failure_count")
+
+
+def _m006_negative_cache(conn: Connection) -> None:
+    _add_columns(conn, "refresh_state", "negative_kind", "negative_count", "negative_until")
+    _create_indexes(conn, "ix_refresh_state_negative_until")
+
+
+def _m007_refresh_horizons(conn: Connection) -> None:
+    _add_columns(conn, "refresh_state", "far_fetched_at")
+    # досі кожне завантаження брало все вікно
+    conn.execute(text("UPDATE refresh_state SET far_fetched_at = fetched_at"))
+
+
+def _m008_change_rate(conn: Connection) -> None:
+    _add_columns(conn, "refresh_state", "change_rate")
+
+
+def _m009_directory_indexes(conn: Connection) -> None:
+    _create_indexes(conn, "ix_groups_faculty_course", "ix_teachers_chair_id")
+
+
+def _m010_link_source_hashes(conn: Connection) -> None:
+    """Хеш клітинки — на кожному зв'язку: сторінки групи й викладача мають різний HTML того ж заняття."""
+    for table in ("event_groups", "event_teachers"):
+        _add_columns(conn, table, "source_hash")
+    # відомий досі хеш (перше джерело) — зв'язкам із власних сторінок; виведені лишаються без нього
+    conn.execute(text(
+        "UPDATE event_groups SET source_hash = "
+        "(SELECT source_hash FROM timetable_events WHERE timetable_events.id = event_groups.event_id)"
+    ))
+    conn.execute(text(
+        "UPDATE event_teachers SET source_hash = "
+        "(SELECT source_hash FROM timetable_events WHERE timetable_events.id = event_teachers.event_id) "
+        "WHERE derived = FALSE"
+    ))
+    _create_indexes(conn, "ix_event_groups_source_hash", "ix_event_teachers_source_hash")
+
+
+# (версія, опис, крок) — лише дописувати в кінець, не перенумеровувати
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "indexes for hot repository queries", _m001_hot_query_indexes),
+    (2, "intern timetable strings, hash raw cells", _m002_intern_event_strings),
+    (3, "canonical lessons linked to groups and teachers", _m003_canonical_lessons),
+    (4, "teacher timetables derived from group pages", _m004_teacher_derivation),
+    (5, "refresh attempts and failure counts", _m005_refresh_attempts),
+    (6, "negative cache for dead or empty timetables", _m006_negative_cache),
+    (7, "near and far refresh horizons", _m007_refresh_horizons),
+    (8, "timetable change rate for refresh priorities", _m008_change_rate),
+    (9, "directory lookups by faculty/course and chair", _m009_directory_indexes),
+    (10, "raw cell hash per group/teacher link", _m010_link_source_hashes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def _get_version(conn: Connection) -> int:
+    return int(conn.execute(text("SELECT version FROM schema_version")).scalar() or 0)
+
+
+def _set_version(conn: Connection, version: int) -> None:
+    conn.execute(text("UPDATE schema_version SET version = :v"), {"v": version})
+
+
+def had_schema(conn: Connection) -> bool:
+    """Чи існувала схема бота до create_all (тобто чи це не свіжа БД)."""
+    return inspect(conn).has_table("users")
+
+
+def run_migrations(conn: Connection, fresh: bool) -> list[int]:
+    """
+    Застосовує відсутні кроки у порядку версій (в транзакції виклику, разом з
+    оновленням версії). Повертає список застосованих версій.
+    """
+    if not inspect(conn).has_table("schema_version"):
+        conn.execute(text("CREATE TABLE schema_version (version INTEGER NOT NULL)"))
+        conn.execute(text("INSERT INTO schema_version (version) VALUES (0)"))
+
+    if fresh:
+        _set_version(conn, LATEST_VERSION)
+        return []
+
+    current = _get_version(conn)
+    applied: list[int] = []
+    for version, _desc, step in MIGRATIONS:
+        if version <= current:
+            continue
+        step(conn)
+        _set_version(conn, version)
+        applied.append(version)
+    return applied
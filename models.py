@@ -3,11 +3,12 @@ from datetime import datetime, date, time
 from typing import Optional
 
 from sqlalchemy import (
-    Column, Integer, String, Date, Time, DateTime, Text, ForeignKey, Index
+    Column, Integer, BigInteger, Float, String, Date, Time, DateTime, Text, LargeBinary, Boolean, ForeignKey, Index,
+    false,
 )
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.orm import relationship
 
-Base = declarative_base()
+from db import Base
 
 
 # ---------- Довідники ----------
@@ -45,10 +46,19 @@ class Teacher(Base):
     chair = relationship("Chair", back_populates="teachers")
 
 
+Index("ix_teachers_full_name", Teacher.full_name)
+Index("ix_teachers_short_name", Teacher.short_name)
+# Довідник для онбордингу: групи факультету й курсу, викладачі кафедри
+Index("ix_groups_faculty_course", Group.faculty_id, Group.course)
+Index("ix_teachers_chair_id", Teacher.chair_id)
+# Зіставлення груп з переліку в клітинці викладача (groups_text) за назвою
+Index("ix_groups_title", Group.title)
+
+
 # ---------- Користувач ----------
 class User(Base):
     __tablename__ = "users"
-    user_id = Column(Integer, primary_key=True)  # telegram id
+    user_id = Column(BigInteger, primary_key=True, autoincrement=False)  # telegram id (може бути > 2^31)
     role = Column(String(16), nullable=False, default="student")  # 'student' | 'teacher'
 
     # student:
@@ -65,15 +75,69 @@ class User(Base):
     group = relationship("Group", back_populates="users")
 
 
+Index("ix_users_group_id", User.group_id)
+Index("ix_users_teacher_id", User.teacher_id)
+
+
 # ---------- Розклад ----------
+class TextValue(Base):
+    """
+    Словник рядків розкладу (назви предметів, ПІБ, аудиторії, переліки груп).
+    Ті самі рядки повторюються в тисячах подій — у подіях зберігаються лише їхні id.
+    """
+    __tablename__ = "text_values"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    value = Column(Text, nullable=False, unique=True)
+
+
+class RawCell(Base):
+    """
+    Сирий HTML клітинки розкладу: zlib, дедуплікований за sha1. Посилання — source_hash
+    заняття (перше джерело) і зв'язків event_groups / event_teachers (клітинка кожної сторінки).
+    """
+    __tablename__ = "raw_cells"
+    hash = Column(String(40), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+
+
+# Текстові поля події, що зберігаються як посилання на text_values (<поле>_id)
+INTERNED_EVENT_FIELDS = (
+    "subject_code", "subject_full", "lesson_type", "auditory",
+    "teacher_short", "teacher_full", "groups_text",
+)
+
+
+def _interned(rel: str):
+    """
+    Рядкове поле події поверх зв'язку з TextValue.
+    Для завантаженої з БД події — значення з довідника; для щойно розібраної
+    (ще не збереженої) — рядок, який інтернується під час синхронізації.
+    """
+    pending = f"_pending{rel}"
+
+    def fget(self):
+        tv = getattr(self, rel)
+        if tv is not None:
+            return tv.value
+        return self.__dict__.get(pending)
+
+    def fset(self, value):
+        self.__dict__[pending] = value
+
+    return property(fget, fset)
+
+
 class TimetableEvent(Base):
+    """
+    Канонічне заняття: одна фізична пара зберігається один раз, незалежно від того,
+    зі скількох розкладів (груп потоку, викладача) її отримано. Хто її бачить —
+    у таблицях зв'язків EventGroup / EventTeacher.
+    """
     __tablename__ = "timetable_events"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    # Прив'язка для студентського режиму
-    group_id = Column(Integer, ForeignKey("groups.id"), nullable=True)
-    # Прив'язка для викладацького режиму
-    teacher_id = Column(Integer, ForeignKey("teachers.id"), nullable=True)
+    # sha1 від (дата, пара, викладач, аудиторія, предмет) — див. repositories.lesson_key
+    lesson_key = Column(String(40), nullable=False)
 
     date = Column(Date, nullable=False)
     weekday = Column(Integer, nullable=True)
@@ -82,33 +146,151 @@ class TimetableEvent(Base):
     time_start = Column(Time, nullable=True)
     time_end = Column(Time, nullable=True)
 
-    subject_code = Column(String(64), nullable=True)
-    subject_full = Column(Text, nullable=True)
-    lesson_type = Column(String(64), nullable=True)
+    subject_code_id = Column(Integer, ForeignKey("text_values.id"), nullable=True)
+    subject_full_id = Column(Integer, ForeignKey("text_values.id"), nullable=True)
+    lesson_type_id = Column(Integer, ForeignKey("text_values.id"), nullable=True)
 
-    auditory = Column(String(128), nullable=True)
+    auditory_id = Column(Integer, ForeignKey("text_values.id"), nullable=True)
 
-    teacher_short = Column(String(255), nullable=True)
-    teacher_full = Column(String(255), nullable=True)
+    teacher_short_id = Column(Integer, ForeignKey("text_values.id"), nullable=True)
+    teacher_full_id = Column(Integer, ForeignKey("text_values.id"), nullable=True)
 
     # Для викладача: перелік груп у клітинці
-    groups_text = Column(Text, nullable=True)
+    groups_text_id = Column(Integer, ForeignKey("text_values.id"), nullable=True)
 
     source_added = Column(Date, nullable=True)
     source_url = Column(Text, nullable=True)
-    source_hash = Column(String(64), nullable=True)
-    raw_html = Column(Text, nullable=True)
+    # sha1 сирого HTML клітинки (див. RawCell)
+    source_hash = Column(String(40), nullable=True)
+
+    _subject_code = relationship(TextValue, foreign_keys=[subject_code_id], lazy="joined")
+    _subject_full = relationship(TextValue, foreign_keys=[subject_full_id], lazy="joined")
+    _lesson_type = relationship(TextValue, foreign_keys=[lesson_type_id], lazy="joined")
+    _auditory = relationship(TextValue, foreign_keys=[auditory_id], lazy="joined")
+    _teacher_short = relationship(TextValue, foreign_keys=[teacher_short_id], lazy="joined")
+    _teacher_full = relationship(TextValue, foreign_keys=[teacher_full_id], lazy="joined")
+    _groups_text = relationship(TextValue, foreign_keys=[groups_text_id], lazy="joined")
+
+    subject_code = _interned("_subject_code")
+    subject_full = _interned("_subject_full")
+    lesson_type = _interned("_lesson_type")
+    auditory = _interned("_auditory")
+    teacher_short = _interned("_teacher_short")
+    teacher_full = _interned("_teacher_full")
+    groups_text = _interned("_groups_text")
+
+    # Сирий HTML клітинки з парсера: у БД не зберігається як є (лише RawCell за хешем)
+    raw_html = None
+
+
+Index("ux_events_lesson_key", TimetableEvent.lesson_key, unique=True)
+# Клінап за датою та список імен викладачів для /addzoom
+Index("ix_events_date", TimetableEvent.date)
+Index("ix_events_teacher_full", TimetableEvent.teacher_full_id)
+Index("ix_events_source_hash", TimetableEvent.source_hash)
+
+
+class EventGroup(Base):
+    """Заняття в розкладі групи (дата продубльована для вибірки за діапазоном без join)."""
+    __tablename__ = "event_groups"
+    group_id = Column(Integer, ForeignKey("groups.id"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    event_id = Column(Integer, ForeignKey("timetable_events.id"), primary_key=True)
+    # sha1 клітинки цього заняття на сторінці групи (див. RawCell)
+    source_hash = Column(String(40), nullable=True)
+
+
+class EventTeacher(Base):
+    """
+    Заняття в розкладі викладача.
+    derived — зв'язок виведено з розкладу групи (ПІБ у клітинці збігся з Teacher),
+    а не отримано з власної сторінки викладача; живе, доки заняття є хоч в одній групі.
+    """
+    __tablename__ = "event_teachers"
+    teacher_id = Column(Integer, ForeignKey("teachers.id"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    event_id = Column(Integer, ForeignKey("timetable_events.id"), primary_key=True)
+    derived = Column(Boolean, nullable=False, default=False, server_default=false())
+    # sha1 клітинки на власній сторінці викладача; у виведених зв'язків — NULL
+    source_hash = Column(String(40), nullable=True)
+
+
+# Пошук власників заняття (сироти, Zoom) і клінап за датою
+Index("ix_event_groups_event_id", EventGroup.event_id)
+Index("ix_event_groups_date", EventGroup.date)
+Index("ix_event_teachers_event_id", EventTeacher.event_id)
+Index("ix_event_teachers_date", EventTeacher.date)
+# клінап raw_cells: чи посилається на клітинку хоч один зв'язок
+Index("ix_event_groups_source_hash", EventGroup.source_hash)
+Index("ix_event_teachers_source_hash", EventTeacher.source_hash)
+
+
+# ---------- Свіжість розкладів ----------
+class RefreshState(Base):
+    """Коли розклад групи/викладача востаннє був актуальним."""
+    __tablename__ = "refresh_state"
+    kind = Column(String(16), primary_key=True)  # 'group' | 'teacher'
+    entity_id = Column(Integer, primary_key=True)
+    # останнє успішне власне завантаження сторінки (будь-якого вікна)
+    fetched_at = Column(DateTime, nullable=True)
+    # останнє завантаження всього вікна, включно з далеким горизонтом (REFRESH_FAR_DAYS)
+    far_fetched_at = Column(DateTime, nullable=True)
+    # останнє підтвердження свіжості без запиту (викладач покритий розкладами груп)
+    derived_at = Column(DateTime, nullable=True)
+    # остання спроба (вдала чи ні) і кількість невдач поспіль — для паузи між повторами
+    last_attempt_at = Column(DateTime, nullable=True)
+    failure_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # негативний кеш: 'missing' (сторінка без розкладу), 'empty' (порожній розклад),
+    # 'parse_error'; до negative_until сутність не запитується, TTL росте з negative_count
+    negative_kind = Column(String(16), nullable=True)
+    negative_count = Column(Integer, nullable=False, default=0, server_default="0")
+    negative_until = Column(DateTime, nullable=True)
+    # частка оновлень, що щось змінили (експоненційне середнє) — для пріоритетів планувальника
+    change_rate = Column(Float, nullable=False, default=0.0, server_default="0")
+
+    @property
+    def last_success_at(self) -> Optional[datetime]:
+        return max((t for t in (self.fetched_at, self.derived_at) if t), default=None)
+
+
+Index("ix_refresh_state_negative_until", RefreshState.negative_until)
+
+
+# ---------- Стан діалогів (FSM aiogram) ----------
+class FsmRecord(Base):
+    """Стан і дані FSM одного користувача/чату (fsm_storage.DBStorage). Дані — компактний JSON."""
+    __tablename__ = "fsm_state"
+    key = Column(String(255), primary_key=True)
+    state = Column(String(255), nullable=True)
+    data = Column(Text, nullable=True)
+    expires_at = Column(DateTime, nullable=False)
+
+
+Index("ix_fsm_state_expires_at", FsmRecord.expires_at)
+
+
+# ---------- Кілька примірників бота (leases.py) ----------
+class ClusterMember(Base):
+    """Живий примірник бота: heartbeat продовжує expires_at, прострочений вважається мертвим."""
+    __tablename__ = "cluster_members"
+    instance_id = Column(String(64), primary_key=True)
+    started_at = Column(DateTime, nullable=False)
+    heartbeat_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
 
-
-# Індекси для швидкого пошуку/ідемпотентності
-Index(
-    "ix_events_group_day",
-    TimetableEvent.group_id, TimetableEvent.date, TimetableEvent.time_start, TimetableEvent.lesson_number
-)
-Index(
-    "ix_events_teacher_day",
-    TimetableEvent.teacher_id, TimetableEvent.date, TimetableEvent.time_start, TimetableEvent.lesson_number
-)
+Index("ix_cluster_members_expires_at", ClusterMember.expires_at)
+
+
+class ShardLease(Base):
+    """Оренда шарда: примірник owner обробляє сутності шарда, доки не мине expires_at."""
+    __tablename__ = "shard_leases"
+    shard = Column(Integer, primary_key=True, autoincrement=False)
+    owner = Column(String(64), nullable=True)
+    expires_at = Column(DateTime, nullable=True)
+
+
+Index("ix_shard_leases_owner", ShardLease.owner)
 
 
 # ---------- Zoom-лінки ----------
@@ -121,12 +303,16 @@ class ZoomLink(Base):
     updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+Index("ix_zoom_teacher_id", ZoomLink.teacher_id)
+
+
 # ---------- Логи розсилки ----------
 class NotificationLog(Base):
+    # У PostgreSQL таблиця секціонована по місяцях і створюється DDL з partitioning.py
     __tablename__ = "notification_log"
     id = Column(Integer, primary_key=True, autoincrement=True)
 
-    user_id = Column(Integer, nullable=False)
+    user_id = Column(BigInteger, nullable=False)
     group_id = Column(Integer, nullable=True)
     event_id = Column(Integer, ForeignKey("timetable_events.id"), nullable=False)
 
@@ -134,3 +320,10 @@ class NotificationLog(Base):
     sent_at = Column(DateTime, nullable=True)
     status = Column(String(16), nullable=False)
     error = Column(Text, nullable=True)
+
+
+# Одне нагадування на (користувач, подія) — has_notification на кожного кандидата
+Index("ux_notif_user_event", NotificationLog.user_id, NotificationLog.event_id, unique=True)
+# Клінап логів (OR за sent_at / scheduled_for)
+Index("ix_notif_sent_at", NotificationLog.sent_at)
+Index("ix_notif_scheduled_for", NotificationLog.scheduled_for)
@@ -0,0 +1,177 @@
+"""
+Локальний HTTP-сервер моніторингу (METRICS_HOST:METRICS_PORT, 0 — вимкнено):
+  • /metrics — метрики у форматі Prometheus: гарячі шляхи з utils/metrics.py плюс колектори,
+    що під час запиту читають наявні лічильники діагностики (SQL за обробниками, кеш довідників,
+    single-flight оновлень, черга письменника, флуд-контроль, черги оновлень, фонові задачі,
+    запобіжник джерела, webhook);
+  • /healthz — 200, якщо БД відповідає, письменник і планувальник працюють, інакше 503;
+    у JSON — стан кожної перевірки, запобіжника джерела й оренди шардів.
+
+Сервер окремий від webhook: метрики не мають бути доступні з інтернету, тож за замовчуванням
+слухає лише 127.0.0.1.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from aiohttp import web
+from sqlalchemy import text
+
+import directory
+from config import Config
+from db import get_read_sessionmaker
+from leases import get_leases
+from middlewares.ordering import get_chat_ordering
+from middlewares.throttling import get_throttling
+from parsing.health import CLOSED, HALF_OPEN, get_source_health
+from querystats import get_query_stats
+from refresh import get_refresh_engine
+from utils.background import get_background_jobs
+from utils.metrics import REGISTRY
+from webhook import get_webhook_ingest
+from writer import get_writer
+
+log = logging.getLogger(__name__)
+
+HEALTH_DB_TIMEOUT_SECONDS = 2.0
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+_BREAKER_STATES = {CLOSED: 0, HALF_OPEN: 1}
+
+
+# ---------- Колектори наявних лічильників ----------
+def _queries():
+    rows = get_query_stats().by_name.items()
+    yield ("bot_db_statements_total", "counter", "SQL-інструкцій за обробником/кроком завдання",
+           [({"scope": name}, row[1]) for name, row in rows])
+    yield ("bot_db_seconds_total", "counter", "Час у БД за обробником/кроком завдання",
+           [({"scope": name}, row[2]) for name, row in rows])
+    yield ("bot_db_scopes_total", "counter", "Виконань обробника/кроку завдання з обліком SQL",
+           [({"scope": name}, row[0]) for name, row in rows])
+    yield ("bot_db_over_budget_total", "counter", "Перевищень бюджету SQL-інструкцій",
+           [({"scope": name}, row[4]) for name, row in rows])
+
+
+def _caches():
+    dc = directory.get_directory()
+    flights = get_refresh_engine().flights
+    yield ("bot_cache_requests_total", "counter", "Звернення до кешів: влучання/промахи",
+           [({"cache": "directory", "result": "hit"}, dc.hits),
+            ({"cache": "directory", "result": "miss"}, dc.misses),
+            ({"cache": "refresh_flight", "result": "hit"}, flights.joined),
+            ({"cache": "refresh_flight", "result": "miss"}, flights.started)])
+    yield ("bot_cache_entries", "gauge", "Списків у кеші довідників", [({"cache": "directory"}, len(dc))])
+
+
+def _refresh():
+    eng = get_refresh_engine()
+    yield ("bot_refresh_skips_total", "counter", "Оновлення, пропущені без запиту до джерела",
+           [({"reason": "derived"}, eng.derived_skips), ({"reason": "backoff"}, eng.backoff_skips),
+            ({"reason": "negative"}, eng.negative_skips)])
+    yield ("bot_refresh_fetched_bytes_total", "counter", "Байтів завантажених сторінок розкладу",
+           [({}, eng.fetched_bytes)])
+
+
+def _writer():
+    w = get_writer()
+    if w is None:
+        return
+    yield ("bot_writer_batches_total", "counter", "Транзакцій письменника", [({}, w.batches)])
+    yield ("bot_writer_ops_total", "counter", "Операцій запису", [({}, w.ops)])
+    yield ("bot_writer_queue", "gauge", "Операцій у черзі письменника", [({}, w.queued)])
+
+
+def _updates():
+    u = get_chat_ordering()
+    th = get_throttling()
+    bg = get_background_jobs()
+    yield ("bot_updates_in_flight", "gauge", "Оновлень Telegram, що виконуються", [({}, u.in_flight)])
+    yield ("bot_updates_waiting", "gauge", "Оновлень Telegram у черзі", [({}, u.waiting)])
+    yield ("bot_updates_total", "counter", "Оброблених оновлень Telegram за результатом",
+           [({"result": "ok"}, u.processed - u.failed), ({"result": "failed"}, u.failed)])
+    yield ("bot_update_wait_seconds_total", "counter", "Сумарне очікування оновлень у черзі", [({}, u.wait_seconds)])
+    yield ("bot_throttled_total", "counter", "Відхилених флуд-контролем запитів",
+           [({"command": c}, n) for c, n in th.throttled.items()])
+    yield ("bot_background_jobs", "gauge", "Фонових задач обробників, що виконуються", [({}, bg.running)])
+    yield ("bot_background_jobs_total", "counter", "Фонових задач обробників за результатом",
+           [({"result": "started"}, bg.started), ({"result": "deduplicated"}, bg.deduplicated),
+            ({"result": "failed"}, bg.failed)])
+
+
+def _source():
+    h = get_source_health()
+    yield ("bot_source_circuit_state", "gauge", "Запобіжник джерела: 0 — закритий, 1 — проба, 2 — відкритий",
+           [({}, _BREAKER_STATES.get(h.breaker.state, 2))])
+    yield ("bot_source_concurrency_limit", "gauge", "Ліміт паралельних запитів до джерела", [({}, h.limiter.limit)])
+    yield ("bot_source_circuit_trips_total", "counter", "Спрацювань запобіжника джерела", [({}, h.breaker.trips)])
+
+
+def _webhook():
+    ingest = get_webhook_ingest()
+    if ingest is None:
+        return
+    yield ("bot_webhook_requests_total", "counter", "Запити Telegram на webhook за результатом",
+           [({"result": "accepted"}, ingest.received), ({"result": "rejected"}, ingest.rejected),
+            ({"result": "overloaded"}, ingest.overloaded)])
+    yield ("bot_webhook_pending", "gauge", "Прийнятих, але не оброблених оновлень", [({}, ingest.pending)])
+
+
+for _collector in (_queries, _caches, _refresh, _writer, _updates, _source, _webhook):
+    REGISTRY.add_collector(_collector)
+
+
+# ---------- Сервер ----------
+class Monitoring:
+    def __init__(self, scheduler=None):
+        # BotScheduler — для перевірки, що планувальник працює
+        self.scheduler = scheduler
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=REGISTRY.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    async def healthz(self, request: web.Request) -> web.Response:
+        checks = {
+            "db": await self._db_ok(),
+            "writer": (w := get_writer()) is not None and w.running,
+            "scheduler": self.scheduler is None or self.scheduler.scheduler.running,
+        }
+        leases = get_leases()
+        body = {
+            "status": "ok" if all(checks.values()) else "fail",
+            "checks": checks,
+            # джерело й оренда — інформаційно: бот відповідає з БД і без них
+            "source_circuit": get_source_health().breaker.state,
+            "shards": f"{len(leases.held)}/{leases.shard_count}" if leases.enabled else None,
+        }
+        return web.json_response(body, status=200 if body["status"] == "ok" else 503)
+
+    @staticmethod
+    async def _db_ok() -> bool:
+        try:
+            async with get_read_sessionmaker()() as s:
+                await asyncio.wait_for(s.execute(text("SELECT 1")), HEALTH_DB_TIMEOUT_SECONDS)
+            return True
+        except Exception:
+            log.warning("healthz: database check failed", exc_info=True)
+            return False
+
+
+async def start_monitoring(cfg: Config, scheduler=None) -> web.AppRunner | None:
+    """Піднімає /metrics і /healthz; None, якщо METRICS_PORT=0. Зупинка — runner.cleanup()."""
+    if cfg.metrics_port <= 0:
+        return None
+    mon = Monitoring(scheduler)
+    app = web.Application()
+    app.router.add_get("/metrics", mon.metrics)
+    app.router.add_get("/healthz", mon.healthz)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, cfg.metrics_host, cfg.metrics_port).start()
+    except OSError:
+        # зайнятий порт (кілька примірників на хості) не зупиняє бота
+        log.warning("monitoring: cannot listen on %s:%s", cfg.metrics_host, cfg.metrics_port, exc_info=True)
+        await runner.cleanup()
+        return None
+    log.info("monitoring on http://%s:%s/metrics", cfg.metrics_host, cfg.metrics_port)
+    return runner
@@ -4,7 +4,10 @@ import httpx
 from datetime import date, timedelta
 
 from config import Config
+from parsing.extractors import has_timetable
+from parsing.health import get_source_health, govern
 from utils.diag import write_blob
+from utils.time import today_kiev
 
 
 def _has_select_with_options(html: str, select_name_or_id: str) -> bool:
@@ -35,7 +38,9 @@ class SourceClient:
         self._last_url: str | None = None
 
     async def __aenter__(self):
-        self._client = httpx.AsyncClient(
+        # кожен запит — через обмежувач паралельності та запобіжник (parsing/health.py);
+        # проксі (HTTP_PROXY та ін. з оточення / .env) налаштовує сам httpx
+        self._client = govern(httpx.AsyncClient(
             timeout=30.0,
             follow_redirects=True,
             headers={
@@ -45,7 +50,7 @@ class SourceClient:
                 "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
                 "Accept-Language": "uk-UA,uk;q=0.9,en-US;q=0.8,en;q=0.7",
             },
-        )
+        ), get_source_health())
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
@@ -86,7 +91,7 @@ class SourceClient:
         return h
 
     def _contains_time_table(self, html: str) -> bool:
-        return bool(re.search(r'id=["\']timeTable["\']', html, re.I))
+        return has_timetable(html)
 
     async def _ensure_group_session(self) -> str:
         """Гарантовано отримати куки+CSRF для сторінки груп перед POST."""
@@ -142,7 +147,7 @@ class SourceClient:
         await self._ensure_group_session()
 
         if dstart is None:
-            dstart = date.today()
+            dstart = today_kiev().date()
         if dend is None:
             dend = dstart + timedelta(days=28)
 
@@ -187,7 +192,7 @@ class SourceClient:
         await self._ensure_group_session()
 
         if dstart is None:
-            dstart = date.today()
+            dstart = today_kiev().date()
         if dend is None:
             dend = dstart + timedelta(days=28)
 
@@ -229,7 +234,7 @@ class SourceClient:
 
         url = f"{self.cfg.base_url}/time-table/group?type=0"
         if dstart is None:
-            dstart = date.today()
+            dstart = today_kiev().date()
         if dend is None:
             dend = dstart + timedelta(days=28)
 
@@ -286,7 +291,7 @@ class SourceClient:
         await self._ensure_teacher_session()
 
         if dstart is None:
-            dstart = date.today()
+            dstart = today_kiev().date()
         if dend is None:
             dend = dstart + timedelta(days=28)
 
@@ -324,7 +329,7 @@ class SourceClient:
         await self._ensure_teacher_session()
 
         if dstart is None:
-            dstart = date.today()
+            dstart = today_kiev().date()
         if dend is None:
             dend = dstart + timedelta(days=28)
 
@@ -7,6 +7,22 @@ from datetime import datetime, date, time
 from bs4 import BeautifulSoup
 
 
+# ───────────── НАЗВА ЗВО (головна сторінка) ─────────────
+
+def parse_institution_name(html: str) -> str:
+    """Назва ЗВО: з елемента з класом 'header', запасний варіант — тег <title>; "" — не знайдено."""
+    for pattern in (
+        r'<div[^>]*class="[^"]*\bheader\b[^"]*"[^>]*>(.*?)</div>',
+        r'<title[^>]*>(.*?)</title>',
+    ):
+        m = re.search(pattern, html or "", re.I | re.S)
+        if m:
+            name = re.sub(r'\s+', ' ', re.sub(r'<[^>]+>', '', m.group(1))).strip()
+            if name:
+                return name
+    return ""
+
+
 # ───────────── BASIC SELECT PARSERS (студент) ─────────────
 
 def parse_faculties(html: str) -> list[tuple[int, str]]:
@@ -133,6 +149,11 @@ def _extract_row_times(soup: BeautifulSoup) -> dict[int, tuple[time | None, time
     return row_times
 
 
+def has_timetable(html: str) -> bool:
+    """Чи є на сторінці таблиця розкладу (#timeTable), навіть порожня."""
+    return bool(re.search(r'id=["\']timeTable["\']', html or "", re.I))
+
+
 # ───────────── MAIN: STUDENT ─────────────
 
 def parse_timetable(
@@ -0,0 +1,287 @@
+"""
+Стан джерела (сайт розкладу) і керування навантаженням на нього.
+
+Усі HTTP-запити SourceClient ідуть через GovernedTransport:
+  • AIMD-обмежувач паралельності: після вдалого швидкого запиту ліміт росте на 1/ліміт
+    (≈ +1 за «вікно»), після помилки чи повільної відповіді — ділиться навпіл
+    (не частіше ніж раз на середню затримку, щоб одна хвиля помилок не обвалила його до мінімуму);
+  • глобальний запобіжник (circuit breaker): після SOURCE_BREAKER_FAILURES помилок поспіль
+    запити не надсилаються SOURCE_BREAKER_COOLDOWN_SECONDS; потім пропускається один
+    пробний запит — успіх закриває запобіжник, невдача подвоює паузу (до SOURCE_BREAKER_MAX_COOLDOWN_SECONDS);
+  • backoff окремої групи/викладача — за лічильником невдач у refresh_state (entity_backoff).
+
+Помилка для governor'а — мережевий збій/тайм-аут або відповідь 429/5xx.
+Стан видно адміністраторам (/status) і в логах (перемикання запобіжника).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from config import Config
+from utils.metrics import SOURCE_BYTES, SOURCE_REQUESTS, SOURCE_SECONDS
+
+log = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class SourceUnavailable(Exception):
+    """Запобіжник відкритий: запит до джерела не надсилався."""
+
+
+class AIMDLimiter:
+    def __init__(self, min_limit: int, max_limit: int, latency_target: float):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_target = latency_target
+        self.limit = float(self.min_limit)
+        self.in_flight = 0
+        self.latency_ewma: float | None = None
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: float, ok: bool) -> None:
+        async with self._cond:
+            self.in_flight -= 1
+            self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+            now = time.monotonic()
+            if ok and latency <= self.latency_target:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            elif now - self._last_decrease >= (self.latency_ewma or 0):
+                self.limit = max(float(self.min_limit), self.limit / 2)
+                self._last_decrease = now
+            self._cond.notify_all()
+
+    async def abandon(self) -> None:
+        """Звільняє місце скасованого запиту: про джерело він нічого не каже, ліміт не змінюється."""
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, cooldown: float, max_cooldown: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_cooldown = max(1.0, cooldown)
+        self.max_cooldown = max(self.base_cooldown, max_cooldown)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.cooldown = self.base_cooldown
+        self.opened_at: float | None = None
+        self.opened_wall: datetime | None = None
+        self.trips = 0
+        self._probe_in_flight = False
+
+    def retry_in(self) -> float:
+        if self.state != OPEN or self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def should_probe(self) -> bool:
+        """Пауза минула, а пробний запит ще не йде."""
+        return self.state != CLOSED and not self._probe_in_flight and self.retry_in() == 0
+
+    def before_request(self) -> bool:
+        """Чи можна надсилати запит. Повертає True для пробного запиту в half-open."""
+        if self.state == CLOSED:
+            return False
+        if self.should_probe():
+            self.state = HALF_OPEN
+            self._probe_in_flight = True
+            return True
+        raise SourceUnavailable(f"source circuit is {self.state}, retry in {self.retry_in():.0f}s")
+
+    def record(self, ok: bool, probe: bool) -> None:
+        if probe:
+            self._probe_in_flight = False
+        if ok:
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                log.warning("source circuit closed after %s", self._open_for())
+                self.state = CLOSED
+                self.cooldown = self.base_cooldown
+                self.opened_at = self.opened_wall = None
+            return
+        self.consecutive_failures += 1
+        if probe:
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+            self._open("probe failed")
+        elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._open(f"{self.consecutive_failures} consecutive failures")
+
+    def abandon(self, probe: bool) -> None:
+        """Запит скасовано (зупинка, таймаут обробника): не успіх і не невдача; проба — знову вільна."""
+        if probe:
+            self._probe_in_flight = False
+
+    def _open(self, reason: str) -> None:
+        if self.state == CLOSED:
+            self.trips += 1
+            self.opened_wall = datetime.utcnow()
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        log.warning("source circuit open (%s), next probe in %.0fs", reason, self.cooldown)
+
+    def _open_for(self) -> str:
+        if not self.opened_wall:
+            return "0s"
+        return f"{(datetime.utcnow() - self.opened_wall).total_seconds():.0f}s"
+
+
+class SourceHealth:
+    def __init__(self, cfg: Config):
+        self.cfg = cfg
+        self.limiter = AIMDLimiter(
+            cfg.source_min_concurrency, cfg.source_max_concurrency, cfg.source_latency_target_ms / 1000
+        )
+        self.breaker = CircuitBreaker(
+            cfg.source_breaker_failures, cfg.source_breaker_cooldown_seconds, cfg.source_breaker_max_cooldown_seconds
+        )
+        # Лічильники для діагностики
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.last_error: str | None = None
+        self.last_error_at: datetime | None = None
+
+    @staticmethod
+    def is_error_status(status: int) -> bool:
+        return status == 429 or status >= 500
+
+    async def send(self, send, request: httpx.Request) -> httpx.Response:
+        """Виконує send(request) під запобіжником і обмежувачем."""
+        endpoint = request.url.path
+        try:
+            probe = self.breaker.before_request()
+        except SourceUnavailable:
+            self.rejected += 1
+            SOURCE_REQUESTS.inc(endpoint=endpoint, status="rejected")
+            raise
+        ok = False
+        status = "error"
+        try:
+            await self.limiter.acquire()
+        except asyncio.CancelledError:
+            self.breaker.abandon(probe)
+            raise
+        # затримка джерела — без часу очікування в черзі обмежувача
+        started = time.monotonic()
+        try:
+            response = await send(request)
+            status = str(response.status_code)
+            ok = not self.is_error_status(response.status_code)
+            if not ok:
+                self._note_error(f"HTTP {response.status_code} {request.url.path}")
+            return response
+        except asyncio.CancelledError:
+            # скасування — не відмова джерела: не зменшує ліміт і не наближає запобіжник
+            status = "cancelled"
+            await self.limiter.abandon()
+            self.breaker.abandon(probe)
+            raise
+        except Exception as exc:
+            self._note_error(f"{type(exc).__name__} {request.url.path}")
+            raise
+        finally:
+            self.requests += 1
+            latency = time.monotonic() - started
+            SOURCE_REQUESTS.inc(endpoint=endpoint, status=status)
+            SOURCE_SECONDS.observe(latency, endpoint=endpoint)
+            if status != "cancelled":
+                await self.limiter.release(latency, ok)
+                self.breaker.record(ok, probe)
+
+    def _note_error(self, text: str) -> None:
+        self.errors += 1
+        self.last_error = text
+        self.last_error_at = datetime.utcnow()
+
+    def entity_backoff(self, failure_count: int) -> timedelta:
+        """Пауза перед повторним оновленням сутності після failure_count невдач поспіль."""
+        if failure_count <= 0:
+            return timedelta(0)
+        base = max(1, self.cfg.source_backoff_base_seconds)
+        return timedelta(seconds=min(self.cfg.source_backoff_max_seconds, base * 2 ** min(failure_count - 1, 16)))
+
+    def snapshot(self) -> dict:
+        b, lim = self.breaker, self.limiter
+        return {
+            "circuit": b.state,
+            "consecutive_failures": b.consecutive_failures,
+            "trips": b.trips,
+            "retry_in_s": round(b.retry_in()),
+            "limit": round(lim.limit, 2),
+            "in_flight": lim.in_flight,
+            "latency_ms": round(lim.latency_ewma * 1000) if lim.latency_ewma is not None else None,
+            "requests": self.requests,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+        }
+
+
+class GovernedTransport(httpx.AsyncBaseTransport):
+    """httpx-транспорт, що пропускає кожен запит через SourceHealth."""
+
+    def __init__(self, health: SourceHealth, inner: httpx.AsyncBaseTransport | None = None):
+        self.health = health
+        self.inner = inner or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self.health.send(self.inner.handle_async_request, request)
+        response.stream = _CountingStream(response.stream, request.url.path)
+        return response
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+def govern(client: httpx.AsyncClient, health: SourceHealth) -> httpx.AsyncClient:
+    """
+    Пропускає всі транспорти клієнта через GovernedTransport. Клієнт будується без transport=,
+    тож httpx сам налаштовує проксі з оточення (HTTP_PROXY / HTTPS_PROXY / ALL_PROXY / NO_PROXY);
+    обгортаються і основний транспорт, і змонтовані проксі-транспорти.
+    """
+    client._transport = GovernedTransport(health, inner=client._transport)
+    client._mounts = {
+        pattern: None if transport is None else GovernedTransport(health, inner=transport)
+        for pattern, transport in client._mounts.items()
+    }
+    return client
+
+
+class _CountingStream(httpx.AsyncByteStream):
+    """Тіло відповіді з підрахунком байтів (як прийшли мережею) для метрик за endpoint."""
+
+    def __init__(self, inner, endpoint: str):
+        self.inner = inner
+        self.endpoint = endpoint
+
+    async def __aiter__(self):
+        async for chunk in self.inner:
+            SOURCE_BYTES.inc(len(chunk), endpoint=self.endpoint)
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+_source_health: SourceHealth | None = None
+
+
+def get_source_health() -> SourceHealth:
+    global _source_health
+    if _source_health is None:
+        _source_health = SourceHealth(Config.load())
+    return _source_health
@@ -0,0 +1,124 @@
+"""
+PostgreSQL: помісячне секціонування notification_log.
+
+Журнал розсилки росте з кожним нагадуванням, а зберігається лише
+NOTIFICATION_RETENTION_DAYS днів. Замість масового DELETE старі місяці
+відкріплюються й видаляються цілими секціями (DROP TABLE), що миттєво
+повертає місце і не навантажує WAL/автовакуум.
+
+Таблицю створюємо власним DDL (до metadata.create_all), бо в PostgreSQL
+ключ секціонування має входити в первинний ключ та унікальні індекси:
+  • PRIMARY KEY (id, scheduled_for);
+  • UNIQUE (user_id, event_id, scheduled_for) замість (user_id, event_id).
+Зовнішнього ключа на timetable_events немає: події перезаписуються при оновленні
+розкладу, а журнал має їх переживати.
+"""
+from __future__ import annotations
+
+import re
+from datetime import date, datetime
+
+from sqlalchemy import Connection, inspect, text
+
+NOTIF_TABLE = "notification_log"
+_PART_RE = re.compile(rf"^{NOTIF_TABLE}_p(\d{{4}})(\d{{2}})$")
+
+
+def _month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _add_months(d: date, n: int) -> date:
+    y, m = divmod(d.month - 1 + n, 12)
+    return date(d.year + y, m + 1, 1)
+
+
+def _partition_name(month: date) -> str:
+    return f"{NOTIF_TABLE}_p{month.year:04d}{month.month:02d}"
+
+
+def create_partitioned_tables(conn: Connection) -> None:
+    """Створює секціоновану notification_log, якщо її ще немає (лише PostgreSQL)."""
+    if conn.dialect.name != "postgresql" or inspect(conn).has_table(NOTIF_TABLE):
+        return
+    conn.execute(text(f"""
+        CREATE TABLE {NOTIF_TABLE} (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+            user_id BIGINT NOT NULL,
+            group_id INTEGER,
+            event_id INTEGER NOT NULL,
+            scheduled_for TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            sent_at TIMESTAMP WITHOUT TIME ZONE,
+            status VARCHAR(16) NOT NULL,
+            error TEXT,
+            PRIMARY KEY (id, scheduled_for)
+        ) PARTITION BY RANGE (scheduled_for)
+    """))
+    conn.execute(text(
+        f"CREATE UNIQUE INDEX ux_notif_user_event ON {NOTIF_TABLE} (user_id, event_id, scheduled_for)"
+    ))
+    conn.execute(text(f"CREATE INDEX ix_notif_sent_at ON {NOTIF_TABLE} (sent_at)"))
+    conn.execute(text(f"CREATE INDEX ix_notif_scheduled_for ON {NOTIF_TABLE} (scheduled_for)"))
+    # Страховка: рядки поза створеними місяцями не падають, а потрапляють сюди
+    conn.execute(text(f"CREATE TABLE {NOTIF_TABLE}_default PARTITION OF {NOTIF_TABLE} DEFAULT"))
+
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :t"
+    ), {"t": NOTIF_TABLE}).scalar())
+
+
+def ensure_notification_partitions(conn: Connection, today: date, months_ahead: int = 2) -> list[str]:
+    """Створює секції для поточного та наступних months_ahead місяців. Повертає нові назви."""
+    if not is_partitioned(conn):
+        return []
+    existing = set(list_partitions(conn))
+    created: list[str] = []
+    start = _month_start(today)
+    for i in range(0, months_ahead + 1):
+        lo = _add_months(start, i)
+        hi = _add_months(lo, 1)
+        name = _partition_name(lo)
+        if name in existing:
+            continue
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {NOTIF_TABLE} "
+            f"FOR VALUES FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+        ))
+        created.append(name)
+    return created
+
+
+def list_partitions(conn: Connection) -> list[str]:
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :t ORDER BY c.relname"
+    ), {"t": NOTIF_TABLE})
+    return [name for (name,) in rows]
+
+
+def drop_expired_notification_partitions(conn: Connection, cutoff: datetime) -> list[str]:
+    """
+    Відкріплює й видаляє місячні секції, що повністю старші за cutoff
+    (верхня межа секції <= cutoff). Повертає назви видалених секцій.
+    """
+    if not is_partitioned(conn):
+        return []
+    dropped: list[str] = []
+    for name in list_partitions(conn):
+        m = _PART_RE.match(name)
+        if not m:
+            continue  # default-секція
+        month = date(int(m.group(1)), int(m.group(2)), 1)
+        upper = _add_months(month, 1)
+        if datetime(upper.year, upper.month, upper.day) <= cutoff:
+            conn.execute(text(f"ALTER TABLE {NOTIF_TABLE} DETACH PARTITION {name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    return dropped
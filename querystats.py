@@ -0,0 +1,147 @@
+"""
+Скільки SQL-інструкцій і часу в БД коштує обробник (або крок фонового завдання).
+
+Слухачі подій SQLAlchemy (before/after_cursor_execute на всіх рушіях) додають кожну інструкцію
+до поточної «області» — contextvar, який ставить track(name): middlewares/db_session.py — на
+кожне оновлення Telegram з ім'ям обробника, планувальник — на кожного користувача в scan_upcoming
+і на кожен запис журналу нагадувань (scan_upcoming_log).
+Записи через письменника (writer.py) зараховуються області, що їх поставила в чергу.
+
+Бюджет області — QUERY_BUDGETS (ім'я=кількість) або QUERY_BUDGET_DEFAULT (0 — без перевірки).
+Перевищення логуються попередженням; з QUERY_BUDGET_STRICT=1 (тести, локальні прогони)
+track() піднімає QueryBudgetExceeded. Підсумки за іменами — у /status.
+"""
+from __future__ import annotations
+
+import contextvars
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import Config
+
+log = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+class Scope:
+    __slots__ = ("name", "statements", "seconds")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.statements = 0
+        self.seconds = 0.0
+
+
+_current: contextvars.ContextVar[Scope | None] = contextvars.ContextVar("query_scope", default=None)
+
+
+def current() -> Scope | None:
+    return _current.get()
+
+
+@contextmanager
+def attach(scope: Scope | None) -> Iterator[None]:
+    """Зараховує інструкції всередині блоку вже відкритій області (письменник виконує чужі операції)."""
+    token = _current.set(scope)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class QueryStats:
+    def __init__(self, cfg: Config):
+        self.default_budget = cfg.query_budget_default
+        self.budgets = dict(cfg.query_budgets)
+        self.strict = cfg.query_budget_strict
+        # Лічильники для діагностики: ім'я -> [викликів, інструкцій, секунд, макс. інструкцій, понад бюджет]
+        self.by_name: dict[str, list] = defaultdict(lambda: [0, 0, 0.0, 0, 0])
+
+    def budget(self, name: str) -> int:
+        return self.budgets.get(name, self.default_budget)
+
+    def record(self, scope: Scope, *, enforce: bool = True) -> None:
+        row = self.by_name[scope.name]
+        row[0] += 1
+        row[1] += scope.statements
+        row[2] += scope.seconds
+        row[3] = max(row[3], scope.statements)
+        budget = self.budget(scope.name)
+        if budget <= 0 or scope.statements <= budget:
+            return
+        row[4] += 1
+        msg = f"{scope.name}: {scope.statements} SQL statements (budget {budget}), {scope.seconds * 1000:.0f} ms in DB"
+        if self.strict and enforce:
+            raise QueryBudgetExceeded(msg)
+        log.warning("query budget exceeded: %s", msg)
+
+    def snapshot(self, top: int = 5) -> list[dict]:
+        """Найдорожчі за середньою кількістю інструкцій."""
+        rows = sorted(self.by_name.items(), key=lambda kv: kv[1][1] / kv[1][0], reverse=True)[:top]
+        return [
+            {
+                "name": name,
+                "calls": calls,
+                "avg_statements": round(statements / calls, 1),
+                "max_statements": max_statements,
+                "avg_ms": round(seconds / calls * 1000, 1),
+                "over_budget": over,
+            }
+            for name, (calls, statements, seconds, max_statements, over) in rows
+        ]
+
+
+_stats: QueryStats | None = None
+
+
+def get_query_stats() -> QueryStats:
+    global _stats
+    if _stats is None:
+        _stats = QueryStats(Config.load())
+    return _stats
+
+
+@contextmanager
+def track(name: str) -> Iterator[Scope]:
+    """Рахує інструкції всередині блоку під іменем name і звіряє з бюджетом на виході."""
+    scope = Scope(name)
+    token = _current.set(scope)
+    failed = True
+    try:
+        yield scope
+        failed = False
+    finally:
+        _current.reset(token)
+        # якщо блок упав — лише попередження: його помилка важливіша за перевищення бюджету
+        get_query_stats().record(scope, enforce=not failed)
+
+
+def install_query_hooks() -> None:
+    """Слухачі на клас Engine — діють для рушіїв запису й читання. Викликати один раз на старті."""
+    if event.contains(Engine, "before_cursor_execute", _before_execute):
+        return
+    event.listen(Engine, "before_cursor_execute", _before_execute)
+    event.listen(Engine, "after_cursor_execute", _after_execute)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    scope = _current.get()
+    started = conn.info.get("query_started")
+    if scope is None or not started:
+        return
+    scope.statements += 1
+    scope.seconds += time.perf_counter() - started.pop()
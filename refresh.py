@@ -0,0 +1,397 @@
+"""
+Оновлення розкладу однієї групи/викладача: завантаження → розбір → синхронізація
+→ позначка свіжості (refresh_state). Спільне для планувальника та онбордингу.
+
+Розклади викладачів частково виводяться з розкладів груп (ПІБ у клітинці групи
+зіставляється з довідником Teacher). Якщо всі групи викладача щойно оновлені,
+окремий запит його сторінки пропускається — але не довше за TEACHER_DERIVED_MAX_HOURS
+від останнього власного завантаження (нові групи викладача видно лише на його сторінці).
+
+Single-flight: одночасні оновлення того самого (вид, id, діапазон дат) — планувальник,
+онбординг кількох одногрупників, фонові revalidate — виконують один запит і одну
+синхронізацію, решта викликів отримують той самий результат.
+
+Stale-while-revalidate: команди відповідають з БД одразу, а revalidate() у фоні
+оновлює розклад, старший за SWR_STALE_MINUTES, і викликає on_change, якщо він змінився.
+
+Запити до джерела проходять через governor (parsing/health.py). Поки запобіжник відкритий,
+оновлення завершуються SourceUnavailable без запиту і без невдачі в refresh_state; сутність,
+що сама раз у раз падає, пропускається до кінця свого backoff (force=True — дія користувача — ні).
+
+Негативний кеш: сторінка без таблиці розкладу (група в архіві, викладач звільнився), порожній
+розклад або сторінка, що не розбирається, фіксуються в refresh_state з TTL, що росте з кожним
+повтором (NEGATIVE_TTL_*). До кінця TTL сутність не запитується; перший непорожній розклад
+скидає запис. Порожній розклад при цьому синхронізується як є (канікули — теж розклад).
+
+Два горизонти: зазвичай запитуються лише найближчі REFRESH_NEAR_DAYS днів; якщо все вікно
+(до REFRESH_FAR_DAYS) не завантажувалось довше за REFRESH_INTERVAL_HOURS — запит бере його
+цілим (один запит замість двох). Синхронізація замінює лише завантажений діапазон дат.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import Config
+from db import get_read_sessionmaker
+from models import Group, Teacher, RefreshState
+from parsing.client import SourceClient
+from parsing.health import SourceUnavailable, get_source_health
+from parsing.extractors import has_timetable, parse_timetable, parse_timetable_teacher
+from querystats import attach
+from repositories import (
+    events_from_dicts,
+    get_refresh_state,
+    mark_refresh_failed,
+    mark_refresh_negative,
+    mark_refreshed,
+    sync_events_for_group,
+    sync_events_for_teacher,
+    teacher_covered_by_groups,
+)
+from utils.metrics import PARSE_SECONDS, REFRESH_SECONDS, SYNC_ROWS
+from utils.singleflight import SingleFlight
+from utils.time import today_kiev
+from writer import write
+
+log = logging.getLogger(__name__)
+
+
+class RefreshEngine:
+    def __init__(self, cfg: Config):
+        self.cfg = cfg
+        # Лічильники для діагностики
+        self.fetches = 0
+        self.far_fetches = 0
+        self.fetched_bytes = 0
+        self.derived_skips = 0
+        self.revalidations = 0
+        self.backoff_skips = 0
+        self.negative_skips = 0
+        self.negatives = 0
+        self.flights = SingleFlight()
+        # фонові задачі revalidate() — тримаємо посилання, доки не завершаться
+        self._background: set[asyncio.Task] = set()
+
+    @staticmethod
+    def flight_key(kind: str, entity_id: int, date_range: tuple | None = None, force: bool = False) -> tuple:
+        # date_range=None — весь розклад, який віддає сторінка джерела; force — окремий політ:
+        # звичайне оновлення може бути пропущене (backoff, негативний кеш) і повернути None
+        return (kind, entity_id, date_range, force)
+
+    def window(self, st: RefreshState | None, now: datetime, *, force: bool = False) -> tuple[tuple[date, date], bool]:
+        """
+        Діапазон дат наступного завантаження (включно) і чи це все вікно з далеким горизонтом.
+        Усе вікно — для нової сутності, за force=True, коли ближній горизонт вимкнено
+        або далекий не оновлювався довше за REFRESH_INTERVAL_HOURS.
+        """
+        cfg = self.cfg
+        today = today_kiev().date()
+        near_days = cfg.refresh_near_days
+        full = (
+            force or near_days <= 0 or near_days >= cfg.refresh_far_days
+            or st is None or st.far_fetched_at is None
+            or st.far_fetched_at < now - timedelta(hours=max(1, cfg.refresh_interval_hours))
+        )
+        end = today + timedelta(days=max(1, cfg.refresh_far_days) if full else near_days - 1)
+        return (today, end), full
+
+    async def _window(self, kind: str, entity_id: int, force: bool) -> tuple[tuple[date, date], bool]:
+        async with get_read_sessionmaker()() as rs:
+            st = await get_refresh_state(rs, kind, entity_id)
+        return self.window(st, datetime.utcnow(), force=force)
+
+    async def refresh_group(self, group_id: int, *, force: bool = False) -> Tuple[int, int, int] | None:
+        """
+        Завантажує розклад групи (ближній горизонт або все вікно — див. window()).
+        Повертає (додано, прибрано, змінено); None — групи немає в довіднику або оновлення
+        пропущено (force=False): backoff чи негативний кеш.
+        """
+        date_range, full = await self._window("group", group_id, force)
+        return await self.flights.do(
+            self.flight_key("group", group_id, date_range, force),
+            lambda: self._measured("group", self._refresh_group(group_id, date_range, full, force=force)),
+        )
+
+    async def refresh_teacher(self, teacher_id: int, *, force: bool = False) -> Tuple[int, int, int] | None:
+        """
+        Завантажує розклад викладача. Повертає (додано, прибрано, змінено); None — викладача немає
+        в довіднику або запит пропущено (force=False): розклад покритий розкладами груп, backoff
+        чи негативний кеш. Виклик під час уже запущеного оновлення того ж викладача (того ж
+        діапазону дат і з тим самим force) отримує його результат.
+        """
+        date_range, full = await self._window("teacher", teacher_id, force)
+        return await self.flights.do(
+            self.flight_key("teacher", teacher_id, date_range, force),
+            lambda: self._measured("teacher", self._refresh_teacher(teacher_id, date_range, full, force=force)),
+        )
+
+    @staticmethod
+    async def _measured(kind: str, work: Awaitable[Tuple[int, int, int] | None]) -> Tuple[int, int, int] | None:
+        """Тривалість оновлення в метриках — один раз на запит до джерела, не на кожного, хто приєднався."""
+        started = time.perf_counter()
+        result_label = "error"
+        try:
+            result = await work
+            result_label = "skipped" if result is None else "changed" if any(result) else "unchanged"
+            return result
+        except SourceUnavailable:
+            result_label = "unavailable"
+            raise
+        finally:
+            REFRESH_SECONDS.observe(time.perf_counter() - started, kind=kind, result=result_label)
+
+    async def _refresh_group(
+        self, group_id: int, date_range: tuple[date, date], full: bool, *, force: bool
+    ) -> Tuple[int, int, int] | None:
+        cfg = self.cfg
+        # Читаємо довідник окремо: з'єднання письменника не тримаємо під час HTTP-запиту
+        async with get_read_sessionmaker()() as rs:
+            g = await rs.get(Group, group_id)
+        if not g:
+            return None
+        if not force and await self.holding_off("group", g.id):
+            return None
+        async with self._attempt("group", g.id):
+            async with SourceClient(cfg) as sc:
+                html = await sc.post_filter(
+                    faculty_id=g.faculty_id or 0, course=g.course or 1, group_id=g.id,
+                    dstart=date_range[0], dend=date_range[1],
+                )
+        self._count_fetch(html, full)
+        return await self._apply(
+            "group", g.id, html,
+            lambda: parse_timetable(html, group_id=g.id, cfg_times=cfg.lesson_times),
+            sync_events_for_group, date_range, full,
+        )
+
+    async def teacher_covered(self, teacher_id: int) -> bool:
+        """Чи можна не завантажувати сторінку викладача: його групи свіжі, а власне завантаження — не старе."""
+        cfg = self.cfg
+        if cfg.teacher_derived_max_hours <= 0:
+            return False
+        now = datetime.utcnow()
+        async with get_read_sessionmaker()() as rs:
+            st = await get_refresh_state(rs, "teacher", teacher_id)
+            if not st or not st.fetched_at or st.fetched_at < now - timedelta(hours=cfg.teacher_derived_max_hours):
+                return False
+            return await teacher_covered_by_groups(
+                rs, teacher_id, fresh_since=now - timedelta(hours=max(1, cfg.refresh_interval_hours))
+            )
+
+    async def _refresh_teacher(
+        self, teacher_id: int, date_range: tuple[date, date], full: bool, *, force: bool
+    ) -> Tuple[int, int, int] | None:
+        cfg = self.cfg
+        async with get_read_sessionmaker()() as rs:
+            t = await rs.get(Teacher, teacher_id)
+        if not t:
+            return None
+        if not force and await self.teacher_covered(t.id):
+            self.derived_skips += 1
+            log.debug("teacher %s: covered by fresh group timetables, fetch skipped", t.id)
+            await write(lambda s: mark_refreshed(s, "teacher", t.id, derived=True))
+            return None
+        if not force and await self.holding_off("teacher", t.id):
+            return None
+        async with self._attempt("teacher", t.id):
+            async with SourceClient(cfg) as sc:
+                html = await sc.post_teacher_filter(
+                    chair_id=t.chair_id or 0, teacher_id=t.id, dstart=date_range[0], dend=date_range[1]
+                )
+        self._count_fetch(html, full)
+        return await self._apply(
+            "teacher", t.id, html,
+            lambda: parse_timetable_teacher(
+                html, teacher_id=t.id, teacher_full_name=t.full_name, cfg_times=cfg.lesson_times
+            ),
+            sync_events_for_teacher, date_range, full,
+        )
+
+    def _count_fetch(self, html: str, full: bool) -> None:
+        self.fetches += 1
+        self.far_fetches += full
+        self.fetched_bytes += len(html.encode("utf-8"))
+
+    async def _apply(
+        self, kind: str, entity_id: int, html: str, parse, sync, date_range: tuple[date, date], full: bool
+    ) -> Tuple[int, int, int] | None:
+        """
+        Розбір і синхронізація завантаженої сторінки в межах date_range. Сторінка без розкладу
+        чи з помилкою розбору нічого не змінює в БД і потрапляє в негативний кеш; порожнє
+        все вікно синхронізується і теж кешується негативно (порожній ближній горизонт — ні).
+        """
+        if not has_timetable(html):
+            await self._negative(kind, entity_id, "missing")
+            return None
+        try:
+            with PARSE_SECONDS.time(page=f"timetable_{kind}"):
+                new_events = events_from_dicts(parse())
+        except Exception:
+            log.warning("refresh %s %s: timetable page not parsed", kind, entity_id, exc_info=True)
+            await self._negative(kind, entity_id, "parse_error")
+            return None
+
+        async def _op(s):
+            empty = full and not new_events
+            result = await sync(s, entity_id, new_events, date_range)
+            await mark_refreshed(s, kind, entity_id, full=full, changed=any(result), keep_negative=empty)
+            if empty:
+                await self._mark_negative(s, kind, entity_id, "empty")
+            return result
+
+        result = await write(_op)
+        SYNC_ROWS.observe(sum(result), kind=kind)
+        return result
+
+    async def _negative(self, kind: str, entity_id: int, negative_kind: str) -> None:
+        await write(lambda s: self._mark_negative(s, kind, entity_id, negative_kind))
+
+    async def _mark_negative(self, s, kind: str, entity_id: int, negative_kind: str) -> None:
+        cfg = self.cfg
+        max_hours = cfg.negative_empty_ttl_max_hours if negative_kind == "empty" else cfg.negative_ttl_max_hours
+        st = await mark_refresh_negative(
+            s, kind, entity_id, negative_kind,
+            ttl_base=timedelta(hours=max(1, cfg.negative_ttl_base_hours)),
+            ttl_max=timedelta(hours=max(1, max_hours)),
+        )
+        self.negatives += 1
+        log.info(
+            "%s %s: negative result '%s' (#%d), next fetch after %s UTC",
+            kind, entity_id, negative_kind, st.negative_count, st.negative_until.strftime("%d.%m %H:%M"),
+        )
+
+    async def holding_off(self, kind: str, entity_id: int) -> bool:
+        """
+        Чи оновлення сутності зараз пропускається: діє негативний кеш (NEGATIVE_TTL_*)
+        або backoff після невдалих спроб (SOURCE_BACKOFF_*).
+        """
+        async with get_read_sessionmaker()() as rs:
+            st = await get_refresh_state(rs, kind, entity_id)
+        if not st:
+            return False
+        now = datetime.utcnow()
+        if st.negative_until and st.negative_until > now:
+            self.negative_skips += 1
+            log.debug("%s %s: negative cache '%s' until %s, refresh skipped", kind, entity_id,
+                      st.negative_kind, st.negative_until)
+            return True
+        if not st.failure_count or not st.last_attempt_at:
+            return False
+        wait = get_source_health().entity_backoff(st.failure_count)
+        if st.last_attempt_at + wait <= now:
+            return False
+        self.backoff_skips += 1
+        log.debug("%s %s: backoff after %d failures, refresh skipped", kind, entity_id, st.failure_count)
+        return True
+
+    @asynccontextmanager
+    async def _attempt(self, kind: str, entity_id: int):
+        """
+        Запит до джерела: невдача фіксується в refresh_state і пробрасується далі.
+        Відмова запобіжника — не провал сутності: лічильник невдач не змінюється.
+        """
+        try:
+            yield
+        except SourceUnavailable:
+            raise
+        except Exception:
+            try:
+                await write(lambda s: mark_refresh_failed(s, kind, entity_id))
+            except Exception:
+                log.warning("refresh %s %s: failed to record failure", kind, entity_id, exc_info=True)
+            raise
+
+    # ---------- stale-while-revalidate ----------
+    def is_stale(self, st: RefreshState | None, now: datetime) -> bool:
+        """
+        Розклад застарів, якщо востаннє був свіжим раніше за SWR_STALE_MINUTES.
+        Після невдач повтор — не раніше ніж через SWR_RETRY_SECONDS * 2^невдач (але не довше за поріг).
+        Поки діє негативний кеш, розклад не вважається застарілим.
+        """
+        stale_after = timedelta(minutes=max(1, self.cfg.swr_stale_minutes))
+        if st is None:
+            return True
+        if st.negative_until and st.negative_until > now:
+            return False
+        if st.last_success_at and st.last_success_at >= now - stale_after:
+            return False
+        if st.last_attempt_at:
+            retry = timedelta(seconds=max(1, self.cfg.swr_retry_seconds) * 2 ** min(st.failure_count or 0, 16))
+            if st.last_attempt_at >= now - min(retry, stale_after):
+                return False
+        return True
+
+    @staticmethod
+    async def _state(kind: str, entity_id: int, session: AsyncSession | None) -> RefreshState | None:
+        if session is not None:
+            return await get_refresh_state(session, kind, entity_id)
+        async with get_read_sessionmaker()() as rs:
+            return await get_refresh_state(rs, kind, entity_id)
+
+    async def is_fresh(self, kind: str, entity_id: int, session: AsyncSession | None = None) -> bool:
+        """
+        Чи розклад успішно оновлювався (завантажено або виведено з груп) за останні SWR_STALE_MINUTES.
+        session — сесія читання оновлення (middlewares/db_session.py), інакше відкривається своя.
+        """
+        st = await self._state(kind, entity_id, session)
+        fresh_since = datetime.utcnow() - timedelta(minutes=max(1, self.cfg.swr_stale_minutes))
+        return bool(st and st.last_success_at and st.last_success_at >= fresh_since)
+
+    async def revalidate(
+        self, kind: str, entity_id: int, on_change: Callable[[], Awaitable[None]],
+        session: AsyncSession | None = None,
+    ) -> bool:
+        """
+        Якщо розклад застарів — запускає фонове оновлення і не чекає на нього.
+        on_change викликається після кожного успішного оновлення (і тоді, коли змінився лише час
+        чи аудиторія наявного заняття) — порівняти з уже показаним має сам on_change.
+        Кілька одночасних revalidate однієї сутності приєднуються до одного оновлення,
+        але кожен отримує власний on_change. Повертає True, якщо оновлення заплановано.
+        """
+        st = await self._state(kind, entity_id, session)
+        if not self.is_stale(st, datetime.utcnow()):
+            return False
+        if get_source_health().breaker.retry_in() > 0:
+            # джерело на паузі — відповідь з БД лишається як є
+            return False
+
+        async def _run():
+            # фонове оновлення не зараховується обробнику, що його запустив (querystats.py)
+            with attach(None):
+                await _refresh()
+
+        async def _refresh():
+            try:
+                if kind == "group":
+                    result = await self.refresh_group(entity_id)
+                else:
+                    result = await self.refresh_teacher(entity_id)
+                if result is not None:
+                    await on_change()
+            except SourceUnavailable:
+                log.debug("revalidate %s %s: source circuit open", kind, entity_id)
+            except Exception:
+                log.warning("revalidate %s %s failed", kind, entity_id, exc_info=True)
+
+        self.revalidations += 1
+        task = asyncio.create_task(_run(), name=f"revalidate-{kind}-{entity_id}")
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return True
+
+
+_refresh_engine: RefreshEngine | None = None
+
+
+def get_refresh_engine() -> RefreshEngine:
+    global _refresh_engine
+    if _refresh_engine is None:
+        _refresh_engine = RefreshEngine(Config.load())
+    return _refresh_engine
@@ -1,41 +1,113 @@
 from __future__ import annotations
+import hashlib
+import zlib
 from typing import Iterable, Sequence, Tuple
 from datetime import datetime, date, timedelta
 
-from sqlalchemy import select, delete, and_, or_, func
+from sqlalchemy import select, delete, update, and_, or_, func, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from config import Config
+from db import SUPPORTED_DIALECTS
 from models import (
-    User, Group, Faculty, Chair, Teacher, TimetableEvent, NotificationLog, ZoomLink
+    User, Group, Faculty, Chair, Teacher, TimetableEvent, EventGroup, EventTeacher, NotificationLog, ZoomLink,
+    TextValue, RawCell, RefreshState, FsmRecord, ClusterMember, ShardLease, INTERNED_EVENT_FIELDS,
 )
+from utils.time import today_kiev
 
 # ---------- Довідники ----------
-async def upsert_faculties(session: AsyncSession, pairs: list[tuple[int, str]]):
-    for fid, title in pairs:
-        f = await session.get(Faculty, fid)
-        if not f:
-            f = Faculty(id=fid, title=title)
-            session.add(f)
-
-async def upsert_groups(session: AsyncSession, faculty_id: int, course: int, pairs: list[tuple[int, str]]):
-    for gid, title in pairs:
-        g = await session.get(Group, gid)
-        if not g:
-            g = Group(id=gid, faculty_id=faculty_id, course=course, title=title)
-            session.add(g)
-        else:
-            if g.title != title:
-                g.title = title
-
-async def upsert_chairs(session: AsyncSession, pairs: list[tuple[int, str]]):
-    for cid, title in pairs:
-        c = await session.get(Chair, cid)
-        if not c:
-            c = Chair(id=cid, title=title)
-            session.add(c)
-        else:
-            if c.title != title:
-                c.title = title
+# SQLite (до 3.32) обмежує кількість параметрів у запиті до 999, PostgreSQL — до 32767.
+_SQLITE_MAX_VARIABLES = 999
+_PG_MAX_VARIABLES = 32767
+
+
+def _dialect_insert(session: AsyncSession):
+    """Повертає діалектний insert() з підтримкою ON CONFLICT для поточного з'єднання."""
+    name = session.get_bind().dialect.name
+    if name == "postgresql":
+        return pg_insert
+    if name == "sqlite":
+        return sqlite_insert
+    # db.init_engine не створює рушій для інших діалектів — сюди потрапляє лише чужа сесія
+    raise RuntimeError(f"upsert не підтримується для діалекту {name!r}; підтримуються: {', '.join(SUPPORTED_DIALECTS)}")
+
+
+def _chunks(rows: list[dict], n_cols: int, dialect_name: str) -> Iterable[list[dict]]:
+    limit = _PG_MAX_VARIABLES if dialect_name == "postgresql" else _SQLITE_MAX_VARIABLES
+    size = max(1, limit // max(1, n_cols))
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+async def _bulk_upsert(
+    session: AsyncSession,
+    model,
+    rows: list[dict],
+    update_values: dict,
+    changed,
+) -> Tuple[int, int]:
+    """
+    Set-based upsert: INSERT ... ON CONFLICT (id) DO UPDATE SET ... WHERE <changed>.
+      • update_values — {колонка: вираз}, вирази можуть посилатися на `excluded`;
+      • changed(excluded) — умова, за якої існуючий рядок справді оновлюється.
+    Повертає (inserted, updated). Дублікати id у вхідних даних — виграє останній.
+    """
+    if not rows:
+        return 0, 0
+    rows = list({r["id"]: r for r in rows}.values())
+
+    insert = _dialect_insert(session)
+    dialect_name = session.get_bind().dialect.name
+    table = model.__table__
+    inserted = updated = 0
+
+    for chunk in _chunks(rows, len(rows[0]), dialect_name):
+        ids = [r["id"] for r in chunk]
+        existing = set((await session.scalars(select(table.c.id).where(table.c.id.in_(ids)))).all())
+
+        stmt = insert(table).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.id],
+            set_={k: v(stmt.excluded) for k, v in update_values.items()},
+            where=changed(stmt.excluded),
+        )
+        res = await session.execute(stmt)
+
+        n_new = len(ids) - len(existing)
+        inserted += n_new
+        updated += max(0, (res.rowcount or 0) - n_new)
+    return inserted, updated
+
+
+async def upsert_faculties(session: AsyncSession, pairs: list[tuple[int, str]]) -> Tuple[int, int]:
+    t = Faculty.__table__
+    return await _bulk_upsert(
+        session, Faculty,
+        [{"id": fid, "title": title} for fid, title in pairs],
+        {"title": lambda ex: ex.title},
+        lambda ex: t.c.title.is_distinct_from(ex.title),
+    )
+
+async def upsert_groups(session: AsyncSession, faculty_id: int, course: int, pairs: list[tuple[int, str]]) -> Tuple[int, int]:
+    # Як і раніше, для існуючої групи оновлюється лише назва
+    t = Group.__table__
+    return await _bulk_upsert(
+        session, Group,
+        [{"id": gid, "faculty_id": faculty_id, "course": course, "title": title} for gid, title in pairs],
+        {"title": lambda ex: ex.title},
+        lambda ex: t.c.title.is_distinct_from(ex.title),
+    )
+
+async def upsert_chairs(session: AsyncSession, pairs: list[tuple[int, str]]) -> Tuple[int, int]:
+    t = Chair.__table__
+    return await _bulk_upsert(
+        session, Chair,
+        [{"id": cid, "title": title} for cid, title in pairs],
+        {"title": lambda ex: ex.title},
+        lambda ex: t.c.title.is_distinct_from(ex.title),
+    )
 
 def _short_from_full(full: str) -> str | None:
     parts = full.strip().split()
@@ -46,20 +118,54 @@ def _short_from_full(full: str) -> str | None:
             return None
     return None
 
-async def upsert_teachers(session: AsyncSession, chair_id: int, pairs: list[tuple[int, str]]):
-    for tid, fio in pairs:
-        t = await session.get(Teacher, tid)
-        if not t:
-            t = Teacher(id=tid, chair_id=chair_id, full_name=fio, short_name=_short_from_full(fio))
-            session.add(t)
-        else:
-            changed = False
-            if t.full_name != fio:
-                t.full_name = fio; changed = True
-            if t.chair_id != chair_id:
-                t.chair_id = chair_id; changed = True
-            if changed:
-                t.short_name = t.short_name or _short_from_full(t.full_name)
+async def upsert_teachers(session: AsyncSession, chair_id: int, pairs: list[tuple[int, str]]) -> Tuple[int, int]:
+    t = Teacher.__table__
+    return await _bulk_upsert(
+        session, Teacher,
+        [
+            {"id": tid, "chair_id": chair_id, "full_name": fio, "short_name": _short_from_full(fio)}
+            for tid, fio in pairs
+        ],
+        {
+            "full_name": lambda ex: ex.full_name,
+            "chair_id": lambda ex: ex.chair_id,
+            # існуюче коротке ім'я не перетираємо
+            "short_name": lambda ex: func.coalesce(t.c.short_name, ex.short_name),
+        },
+        lambda ex: or_(
+            t.c.full_name.is_distinct_from(ex.full_name),
+            t.c.chair_id.is_distinct_from(ex.chair_id),
+        ),
+    )
+
+# ---------- Довідники з БД (запасний варіант, коли джерело недоступне) ----------
+async def list_faculties(session: AsyncSession) -> list[tuple[int, str]]:
+    rows = await session.execute(select(Faculty.id, Faculty.title).order_by(Faculty.title))
+    return [(fid, title) for fid, title in rows]
+
+async def list_courses(session: AsyncSession, faculty_id: int) -> list[int]:
+    rows = await session.execute(
+        select(Group.course).where(Group.faculty_id == faculty_id, Group.course.is_not(None))
+        .distinct().order_by(Group.course)
+    )
+    return [c for (c,) in rows]
+
+async def list_groups(session: AsyncSession, faculty_id: int, course: int) -> list[tuple[int, str]]:
+    rows = await session.execute(
+        select(Group.id, Group.title).where(Group.faculty_id == faculty_id, Group.course == course)
+        .order_by(Group.title)
+    )
+    return [(gid, title) for gid, title in rows]
+
+async def list_chairs(session: AsyncSession) -> list[tuple[int, str]]:
+    rows = await session.execute(select(Chair.id, Chair.title).order_by(Chair.title))
+    return [(cid, title) for cid, title in rows]
+
+async def list_teachers(session: AsyncSession, chair_id: int) -> list[tuple[int, str]]:
+    rows = await session.execute(
+        select(Teacher.id, Teacher.full_name).where(Teacher.chair_id == chair_id).order_by(Teacher.full_name)
+    )
+    return [(tid, fio) for tid, fio in rows]
 
 # ---------- Списки для планувальника ----------
 async def distinct_group_ids_in_users(session: AsyncSession) -> set[int]:
@@ -70,62 +176,526 @@ async def distinct_teacher_ids_in_users(session: AsyncSession) -> set[int]:
     rows = await session.execute(select(User.teacher_id).where(User.teacher_id.is_not(None)))
     return set([tid for (tid,) in rows if tid is not None])
 
+async def subscriber_counts(session: AsyncSession) -> tuple[dict[int, int], dict[int, int]]:
+    """Кількість користувачів на кожну групу та кожного викладача: ({group_id: n}, {teacher_id: n})."""
+    groups = await session.execute(
+        select(User.group_id, func.count()).where(User.group_id.is_not(None)).group_by(User.group_id)
+    )
+    teachers = await session.execute(
+        select(User.teacher_id, func.count()).where(User.teacher_id.is_not(None)).group_by(User.teacher_id)
+    )
+    return dict(groups.all()), dict(teachers.all())
+
+async def next_lesson_dates(session: AsyncSession, kind: str, ids: Sequence[int], since: date) -> dict[int, date]:
+    """Дата найближчого заняття (від since) у розкладі кожної групи/викладача з ids."""
+    link, owner_col = (EventGroup, EventGroup.group_id) if kind == "group" else (EventTeacher, EventTeacher.teacher_id)
+    out: dict[int, date] = {}
+    ids = list(ids)
+    for i in range(0, len(ids), _SQLITE_MAX_VARIABLES):
+        rows = await session.execute(
+            select(owner_col, func.min(link.date))
+            .where(owner_col.in_(ids[i:i + _SQLITE_MAX_VARIABLES]), link.date >= since)
+            .group_by(owner_col)
+        )
+        out.update(rows.all())
+    return out
+
+async def users_with_subscription(session: AsyncSession) -> list[User]:
+    """Користувачі з обраною групою або викладачем (кандидати для нагадувань)."""
+    rows = await session.execute(select(User).where(
+        (User.group_id.is_not(None)) | (User.teacher_id.is_not(None))
+    ))
+    return list(rows.scalars())
+
+# ---------- Словник рядків ----------
+async def intern_texts(session: AsyncSession, values: Iterable[str | None]) -> dict[str, int]:
+    """
+    Повертає {рядок: id} з text_values, додаючи відсутні рядки
+    (INSERT ... ON CONFLICT DO NOTHING, порціями під ліміт параметрів).
+    """
+    wanted = sorted({v for v in values if v})
+    if not wanted:
+        return {}
+    insert = _dialect_insert(session)
+    dialect_name = session.get_bind().dialect.name
+    t = TextValue.__table__
+    out: dict[str, int] = {}
+    for chunk in _chunks([{"value": v} for v in wanted], 1, dialect_name):
+        await session.execute(insert(t).values(chunk).on_conflict_do_nothing(index_elements=[t.c.value]))
+        rows = await session.execute(select(t.c.id, t.c.value).where(t.c.value.in_([r["value"] for r in chunk])))
+        out.update({v: i for i, v in rows})
+    return out
+
+async def _store_raw_cells(session: AsyncSession, cells: dict[str, bytes]) -> None:
+    if not cells:
+        return
+    insert = _dialect_insert(session)
+    t = RawCell.__table__
+    rows = [{"hash": h, "data": d} for h, d in cells.items()]
+    for chunk in _chunks(rows, 2, session.get_bind().dialect.name):
+        await session.execute(insert(t).values(chunk).on_conflict_do_nothing(index_elements=[t.c.hash]))
+
+
 # ---------- Синхронізація подій ----------
-async def sync_events_for_group(session: AsyncSession, group_id: int, new_events: Sequence[TimetableEvent]):
+_EVENT_COLUMNS = [c.name for c in TimetableEvent.__table__.columns if c.name != "id"]
+_INTERNED_ID_COLUMNS = {f"{f}_id" for f in INTERNED_EVENT_FIELDS}
+# Колонки, які уточнюються даними з іншого розкладу того ж заняття (NULL не перетирає значення).
+# source_hash лишається від першого джерела: HTML клітинки групи й викладача різний.
+_MERGED_COLUMNS = [c for c in _EVENT_COLUMNS if c not in ("lesson_key", "date", "lesson_number", "source_hash")]
+# Поля розібраного словника, які тепер живуть у таблицях зв'язків
+_OWNER_KEYS = ("group_id", "teacher_id")
+
+
+def events_from_dicts(dicts: Iterable[dict]) -> list[TimetableEvent]:
+    """Події з результатів парсера; власника (group_id/teacher_id) задає sync_events_for_*."""
+    return [TimetableEvent(**{k: v for k, v in d.items() if k not in _OWNER_KEYS}) for d in dicts]
+
+
+def _norm(value: str | None) -> str:
+    return " ".join((value or "").split()).casefold()
+
+
+def lesson_key(e: TimetableEvent) -> str:
     """
-    Простий підхід: видаляємо всі майбутні події групи (від "сьогодні - 1 день"), вставляємо нові.
+    Ключ канонічного заняття: (дата, номер пари, викладач, аудиторія, предмет).
+    Викладача порівнюємо за коротким ПІБ: у розкладі групи часто є лише "Прізвище І.П.",
+    а в розкладі викладача — повне ім'я з довідника.
     """
-    cutoff = date.today() - timedelta(days=1)
-    await session.execute(
-        delete(TimetableEvent).where(
-            and_(TimetableEvent.group_id == group_id, TimetableEvent.date >= cutoff)
-        )
+    teacher = e.teacher_short or (_short_from_full(e.teacher_full) if e.teacher_full else None)
+    parts = (
+        e.date.isoformat(), str(e.lesson_number or ""),
+        _norm(teacher), _norm(e.auditory), _norm(e.subject_full or e.subject_code),
     )
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def _cell_hash(e: TimetableEvent) -> str | None:
+    """sha1 сирого HTML клітинки (ключ RawCell)."""
+    return hashlib.sha1(e.raw_html.encode("utf-8")).hexdigest() if e.raw_html else None
+
+
+async def _event_rows(session: AsyncSession, new_events: Sequence[TimetableEvent]) -> list[dict]:
+    """
+    Перетворює розібрані події на рядки timetable_events: рядки → id з text_values,
+    сирий HTML → sha1 у source_hash (і стиснутий RawCell, якщо STORE_RAW_HTML=1).
+    Події з однаковим lesson_key зливаються в один рядок.
+    """
+    ids = await intern_texts(
+        session, (getattr(e, f) for e in new_events for f in INTERNED_EVENT_FIELDS)
+    )
+    store_raw = Config.load().store_raw_html
+    raw_cells: dict[str, bytes] = {}
+    rows: dict[str, dict] = {}
     for e in new_events:
-        e.group_id = group_id
-        session.add(e)
+        row = {c: getattr(e, c) for c in _EVENT_COLUMNS if c not in _INTERNED_ID_COLUMNS}
+        row["lesson_key"] = lesson_key(e)
+        for f in INTERNED_EVENT_FIELDS:
+            v = getattr(e, f)
+            row[f"{f}_id"] = ids[v] if v else None
+        h = row["source_hash"] = _cell_hash(e)
+        if h and store_raw and h not in raw_cells:
+            raw_cells[h] = zlib.compress(e.raw_html.encode("utf-8"), 6)
+        prev = rows.get(row["lesson_key"])
+        if prev is not None:
+            row = {c: prev[c] if row[c] is None else row[c] for c in _EVENT_COLUMNS}
+            # як і в БД, хеш заняття — від першої клітинки; решта — на зв'язках (_sync_links)
+            row["source_hash"] = prev["source_hash"] or row["source_hash"]
+        rows[row["lesson_key"]] = row
+    await _store_raw_cells(session, raw_cells)
+    return list(rows.values())
 
-async def sync_events_for_teacher(session: AsyncSession, teacher_id: int, new_events: Sequence[TimetableEvent]):
-    cutoff = date.today() - timedelta(days=1)
-    await session.execute(
-        delete(TimetableEvent).where(
-            and_(TimetableEvent.teacher_id == teacher_id, TimetableEvent.date >= cutoff)
+async def _bulk_insert_events(session: AsyncSession, rows: list[dict]) -> int:
+    """
+    Масова вставка подій: у PostgreSQL — COPY (asyncpg), інакше — один executemany INSERT.
+    """
+    if not rows:
+        return 0
+    if session.get_bind().dialect.name == "postgresql":
+        conn = await session.connection()
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            TimetableEvent.__tablename__,
+            records=[tuple(r[c] for c in _EVENT_COLUMNS) for r in rows],
+            columns=_EVENT_COLUMNS,
         )
+    else:
+        await session.execute(TimetableEvent.__table__.insert(), rows)
+    return len(rows)
+
+async def _lesson_ids(session: AsyncSession, keys: list[str], columns=()) -> dict[str, tuple]:
+    """{lesson_key: (id, *columns)} для наявних занять."""
+    t = TimetableEvent.__table__
+    out: dict[str, tuple] = {}
+    for i in range(0, len(keys), _SQLITE_MAX_VARIABLES):
+        rows = await session.execute(
+            select(t.c.lesson_key, t.c.id, *(t.c[c] for c in columns))
+            .where(t.c.lesson_key.in_(keys[i:i + _SQLITE_MAX_VARIABLES]))
+        )
+        out.update({row[0]: tuple(row[1:]) for row in rows})
+    return out
+
+async def upsert_lessons(session: AsyncSession, new_events: Sequence[TimetableEvent]) -> dict[str, int]:
+    """
+    Записує канонічні заняття і повертає {lesson_key: id}.
+      • нові — масовою вставкою;
+      • наявні — UPDATE лише тих, де нове джерело справді щось уточнює
+        (непорожнє значення, відмінне від збереженого).
+    """
+    ids, _n_updated = await _upsert_lessons(session, new_events)
+    return ids
+
+async def _upsert_lessons(session: AsyncSession, new_events: Sequence[TimetableEvent]) -> tuple[dict[str, int], int]:
+    """upsert_lessons, що ще й повертає кількість змінених наявних занять (час, тип, аудиторія…)."""
+    rows = await _event_rows(session, new_events)
+    if not rows:
+        return {}, 0
+    keys = [r["lesson_key"] for r in rows]
+    existing = await _lesson_ids(session, keys, _MERGED_COLUMNS)
+
+    to_insert, to_update = [], []
+    for r in rows:
+        stored = existing.get(r["lesson_key"])
+        if stored is None:
+            to_insert.append(r)
+            continue
+        current = dict(zip(_MERGED_COLUMNS, stored[1:]))
+        merged = {c: current[c] if r[c] is None else r[c] for c in _MERGED_COLUMNS}
+        if merged != current:
+            to_update.append({"b_id": stored[0], **merged})
+
+    await _bulk_insert_events(session, to_insert)
+    if to_update:
+        t = TimetableEvent.__table__
+        await session.execute(
+            update(t).where(t.c.id == bindparam("b_id")).values({c: bindparam(c) for c in _MERGED_COLUMNS}),
+            to_update,
+        )
+    ids = {k: v[0] for k, v in existing.items()}
+    if to_insert:
+        inserted = await _lesson_ids(session, [r["lesson_key"] for r in to_insert])
+        ids.update({k: v[0] for k, v in inserted.items()})
+    return ids, len(to_update)
+
+async def _delete_orphan_lessons(session: AsyncSession, event_ids: list[int]) -> int:
+    """Видаляє з event_ids заняття, що не лишилися в жодному розкладі."""
+    n = 0
+    for i in range(0, len(event_ids), _SQLITE_MAX_VARIABLES):
+        res = await session.execute(delete(TimetableEvent).where(
+            TimetableEvent.id.in_(event_ids[i:i + _SQLITE_MAX_VARIABLES]),
+            ~select(EventGroup.event_id).where(EventGroup.event_id == TimetableEvent.id).exists(),
+            ~select(EventTeacher.event_id).where(EventTeacher.event_id == TimetableEvent.id).exists(),
+        ))
+        n += res.rowcount or 0
+    return n
+
+async def _derive_teacher_links(session: AsyncSession, new_events: Sequence[TimetableEvent], ids: dict[str, int]) -> int:
+    """
+    Розклад групи → розклади викладачів: заняття прив'язується (derived) до Teacher,
+    чий ПІБ збігся з викладачем у клітинці — повним ім'ям, або коротким, якщо воно однозначне.
+    """
+    fulls = {e.teacher_full.strip() for e in new_events if e.teacher_full}
+    shorts = {
+        s.strip() for e in new_events
+        if (s := e.teacher_short or (_short_from_full(e.teacher_full) if e.teacher_full else None))
+    }
+    if not fulls and not shorts:
+        return 0
+    rows = await session.execute(
+        select(Teacher.id, Teacher.full_name, Teacher.short_name)
+        .where(or_(Teacher.full_name.in_(fulls), Teacher.short_name.in_(shorts)))
     )
+    by_full: dict[str, int] = {}
+    by_short: dict[str, set[int]] = {}
+    for tid, full, short in rows:
+        by_full[_norm(full)] = tid
+        if short or _short_from_full(full):
+            by_short.setdefault(_norm(short or _short_from_full(full)), set()).add(tid)
+
+    links = set()
+    for e in new_events:
+        tid = by_full.get(_norm(e.teacher_full)) if e.teacher_full else None
+        if tid is None:
+            short = e.teacher_short or (_short_from_full(e.teacher_full) if e.teacher_full else None)
+            candidates = by_short.get(_norm(short)) if short else None
+            if candidates and len(candidates) == 1:
+                tid = next(iter(candidates))
+        if tid is not None:
+            links.add((tid, e.date, ids[lesson_key(e)]))
+    if not links:
+        return 0
+
+    insert = _dialect_insert(session)
+    t = EventTeacher.__table__
+    rows = [{"teacher_id": tid, "date": d, "event_id": ev_id, "derived": True} for tid, d, ev_id in links]
+    for chunk in _chunks(rows, 4, session.get_bind().dialect.name):
+        await session.execute(insert(t).values(chunk).on_conflict_do_nothing())
+    return len(rows)
+
+async def _drop_derived_teacher_links(session: AsyncSession, event_ids: list[int]) -> None:
+    """Виведені зв'язки з викладачем живуть, доки заняття є в розкладі хоч однієї групи."""
+    for i in range(0, len(event_ids), _SQLITE_MAX_VARIABLES):
+        await session.execute(delete(EventTeacher).where(
+            EventTeacher.event_id.in_(event_ids[i:i + _SQLITE_MAX_VARIABLES]),
+            EventTeacher.derived.is_(True),
+            ~select(EventGroup.event_id).where(EventGroup.event_id == EventTeacher.event_id).exists(),
+        ))
+
+def _sync_window(date_range: tuple[date, date] | None) -> tuple[date, date | None]:
+    return date_range or (today_kiev().date() - timedelta(days=1), None)
+
+async def _sync_links(
+    session: AsyncSession, link, owner_col, owner_id: int, new_events: Sequence[TimetableEvent],
+    date_range: tuple[date, date] | None = None,
+):
+    """
+    Синхронізує розклад власника (групи/викладача) в межах завантаженого вікна дат
+    date_range (включно; None — від "сьогодні - 1 день" без верхньої межі):
+    заняття записуються в спільну таблицю (upsert_lessons), а розклад власника —
+    це набір зв'язків, з якого видаляються/додаються лише змінені. Дні поза вікном не чіпаються.
+    Повертає (події в межах вікна, {lesson_key: id}, к-сть доданих, id прибраних, к-сть змінених занять).
+    """
+    start, end = _sync_window(date_range)
+    new_events = [e for e in new_events if e.date >= start and (end is None or e.date <= end)]
+    ids, n_updated = await _upsert_lessons(session, new_events)
+    # (заняття, дата) -> хеш клітинки саме цієї сторінки
+    wanted: dict[tuple[int, date], str | None] = {}
     for e in new_events:
-        e.teacher_id = teacher_id
-        session.add(e)
+        k = (ids[lesson_key(e)], e.date)
+        wanted[k] = wanted.get(k) or _cell_hash(e)
+
+    in_window = and_(owner_col == owner_id, link.date >= start)
+    if end is not None:
+        in_window = and_(in_window, link.date <= end)
+    existing = {
+        (event_id, d): h
+        for event_id, d, h in await session.execute(select(link.event_id, link.date, link.source_hash).where(in_window))
+    }
+    stale = [event_id for event_id, d in existing.keys() - wanted.keys()]
+    added = [
+        {owner_col.key: owner_id, "event_id": event_id, "date": d, "source_hash": wanted[(event_id, d)]}
+        for event_id, d in wanted.keys() - existing.keys()
+    ]
+    rehashed = [
+        {"b_event_id": event_id, "b_date": d, "b_hash": h}
+        for (event_id, d), h in wanted.items() if h and (event_id, d) in existing and existing[(event_id, d)] != h
+    ]
+
+    for i in range(0, len(stale), _SQLITE_MAX_VARIABLES):
+        await session.execute(delete(link).where(
+            and_(owner_col == owner_id, link.event_id.in_(stale[i:i + _SQLITE_MAX_VARIABLES]))
+        ))
+    if added:
+        await session.execute(link.__table__.insert(), added)
+    if rehashed:
+        t = link.__table__
+        await session.execute(
+            update(t)
+            .where(t.c[owner_col.key] == owner_id, t.c.event_id == bindparam("b_event_id"), t.c.date == bindparam("b_date"))
+            .values(source_hash=bindparam("b_hash")),
+            rehashed,
+        )
+    return new_events, ids, len(added), stale, n_updated
+
+async def sync_events_for_group(
+    session: AsyncSession, group_id: int, new_events: Sequence[TimetableEvent],
+    date_range: tuple[date, date] | None = None,
+) -> Tuple[int, int, int]:
+    """
+    Повертає (додано, прибрано, змінено) занять у розкладі групи в межах date_range. Заодно
+    оновлює виведені розклади викладачів; заняття, що випали з усіх розкладів, видаляються.
+    """
+    new_events, ids, n_added, stale, n_updated = await _sync_links(
+        session, EventGroup, EventGroup.group_id, group_id, new_events, date_range
+    )
+    await _derive_teacher_links(session, new_events, ids)
+    await _drop_derived_teacher_links(session, stale)
+    await _delete_orphan_lessons(session, stale)
+    return n_added, len(stale), n_updated
+
+async def sync_events_for_teacher(
+    session: AsyncSession, teacher_id: int, new_events: Sequence[TimetableEvent],
+    date_range: tuple[date, date] | None = None,
+) -> Tuple[int, int, int]:
+    """Повертає (додано, прибрано, змінено) занять у розкладі викладача в межах date_range."""
+    events, ids, n_added, stale, n_updated = await _sync_links(
+        session, EventTeacher, EventTeacher.teacher_id, teacher_id, new_events, date_range
+    )
+    # власна сторінка підтвердила виведені зв'язки — тепер вони не залежать від груп;
+    # лише ті, що вона справді повернула (у завантаженому вікні), далекий горизонт лишається за групами
+    start, end = _sync_window(date_range)
+    confirmed = sorted({ids[lesson_key(e)] for e in events})
+    in_window = EventTeacher.date >= start if end is None else EventTeacher.date.between(start, end)
+    for i in range(0, len(confirmed), _SQLITE_MAX_VARIABLES):
+        await session.execute(
+            update(EventTeacher)
+            .where(
+                EventTeacher.teacher_id == teacher_id, EventTeacher.derived.is_(True), in_window,
+                EventTeacher.event_id.in_(confirmed[i:i + _SQLITE_MAX_VARIABLES]),
+            )
+            .values(derived=False)
+        )
+    await _delete_orphan_lessons(session, stale)
+    return n_added, len(stale), n_updated
+
+# ---------- Свіжість розкладів ----------
+# вага останнього оновлення в change_rate (експоненційне середнє)
+CHANGE_RATE_ALPHA = 0.2
+
+async def mark_refreshed(
+    session: AsyncSession, kind: str, entity_id: int, *,
+    derived: bool = False, full: bool = False, changed: bool | None = None, keep_negative: bool = False,
+) -> None:
+    """
+    Позначає розклад свіжим: fetched_at (власне завантаження) або derived_at (покрито групами);
+    full=True — завантажено все вікно, включно з далеким горизонтом (far_fetched_at).
+    changed — чи змінився розклад; оновлює change_rate (перше завантаження історії не має).
+    keep_negative — не скидати негативний кеш (порожнє вікно: далі mark_refresh_negative подвоїть TTL).
+    """
+    cols = ["derived_at"] if derived else ["fetched_at"] + (["far_fetched_at"] if full else [])
+    now = datetime.utcnow()
+    insert = _dialect_insert(session)
+    t = RefreshState.__table__
+    stmt = insert(t).values(
+        kind=kind, entity_id=entity_id, last_attempt_at=now, failure_count=0, **{c: now for c in cols}
+    )
+    set_ = {c: stmt.excluded[c] for c in cols}
+    set_.update(last_attempt_at=stmt.excluded.last_attempt_at, failure_count=0)
+    if changed is not None:
+        set_["change_rate"] = t.c.change_rate * (1 - CHANGE_RATE_ALPHA) + (CHANGE_RATE_ALPHA if changed else 0.0)
+    if not derived and not keep_negative:
+        # сторінка віддала розклад — негативний кеш більше не діє
+        set_.update(negative_kind=None, negative_count=0, negative_until=None)
+    await session.execute(stmt.on_conflict_do_update(index_elements=[t.c.kind, t.c.entity_id], set_=set_))
+
+async def mark_refresh_failed(session: AsyncSession, kind: str, entity_id: int) -> None:
+    """Невдала спроба оновлення: last_attempt_at і +1 до failure_count."""
+    insert = _dialect_insert(session)
+    t = RefreshState.__table__
+    stmt = insert(t).values(kind=kind, entity_id=entity_id, last_attempt_at=datetime.utcnow(), failure_count=1)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=[t.c.kind, t.c.entity_id],
+        set_={"last_attempt_at": stmt.excluded.last_attempt_at, "failure_count": t.c.failure_count + 1},
+    ))
+
+async def get_refresh_state(session: AsyncSession, kind: str, entity_id: int) -> RefreshState | None:
+    return await session.get(RefreshState, (kind, entity_id))
+
+async def refresh_states(session: AsyncSession, kind: str, ids: Sequence[int]) -> dict[int, RefreshState]:
+    out: dict[int, RefreshState] = {}
+    ids = list(ids)
+    for i in range(0, len(ids), _SQLITE_MAX_VARIABLES):
+        rows = await session.scalars(select(RefreshState).where(
+            RefreshState.kind == kind, RefreshState.entity_id.in_(ids[i:i + _SQLITE_MAX_VARIABLES])
+        ))
+        out.update((st.entity_id, st) for st in rows)
+    return out
+
+async def mark_refresh_negative(
+    session: AsyncSession,
+    kind: str,
+    entity_id: int,
+    negative_kind: str,
+    ttl_base: timedelta,
+    ttl_max: timedelta,
+) -> RefreshState:
+    """
+    Негативний результат оновлення (немає розкладу, порожній, не розбирається).
+    Повтор того ж результату подвоює TTL (до ttl_max), інший результат починає з ttl_base.
+    """
+    now = datetime.utcnow()
+    # populate_existing: у цій же транзакції стан міг щойно змінити mark_refreshed (core upsert)
+    st = await session.get(RefreshState, (kind, entity_id), populate_existing=True)
+    if st is None:
+        st = RefreshState(kind=kind, entity_id=entity_id, failure_count=0, negative_count=0)
+        session.add(st)
+    st.negative_count = (st.negative_count or 0) + 1 if st.negative_kind == negative_kind else 1
+    st.negative_kind = negative_kind
+    st.negative_until = now + min(ttl_max, ttl_base * 2 ** min(st.negative_count - 1, 16))
+    st.last_attempt_at = now
+    await session.flush()
+    return st
+
+async def negative_refresh_states(session: AsyncSession, now: datetime, limit: int = 20) -> list[RefreshState]:
+    """Діючі записи негативного кешу (найдовші першими) — для /status."""
+    return list((await session.scalars(
+        select(RefreshState)
+        .where(RefreshState.negative_until > now)
+        .order_by(RefreshState.negative_until.desc())
+        .limit(limit)
+    )).all())
+
+def _group_names(groups_text: str | None) -> set[str]:
+    return {g.strip() for g in (groups_text or "").split(",") if g.strip()}
+
+async def teacher_covered_by_groups(session: AsyncSession, teacher_id: int, fresh_since: datetime) -> bool:
+    """
+    Чи покривають свіжі розклади груп увесь майбутній розклад викладача:
+    кожне заняття є в розкладі групи, оновленої після fresh_since, і кожна група
+    з переліку в клітинці (groups_text) відома та свіжа.
+    Без жодного заняття — False: нема з чим звіряти, потрібне власне завантаження.
+    """
+    rows = (await session.execute(
+        select(EventTeacher.event_id, TextValue.value)
+        .join(TimetableEvent, TimetableEvent.id == EventTeacher.event_id)
+        .outerjoin(TextValue, TextValue.id == TimetableEvent.groups_text_id)
+        .where(EventTeacher.teacher_id == teacher_id, EventTeacher.date >= today_kiev().date())
+    )).all()
+    if not rows:
+        return False
+
+    event_ids = [ev_id for ev_id, _ in rows]
+    linked: dict[int, set[int]] = {}
+    for i in range(0, len(event_ids), _SQLITE_MAX_VARIABLES):
+        res = await session.execute(
+            select(EventGroup.event_id, EventGroup.group_id)
+            .where(EventGroup.event_id.in_(event_ids[i:i + _SQLITE_MAX_VARIABLES]))
+        )
+        for ev_id, gid in res:
+            linked.setdefault(ev_id, set()).add(gid)
+
+    titles = set().union(*(_group_names(text) for _, text in rows))
+    by_title: dict[str, int] = {}
+    if titles:
+        res = await session.execute(select(Group.title, Group.id).where(Group.title.in_(titles)))
+        by_title = {title: gid for title, gid in res}
+    if len(by_title) < len(titles):
+        return False
+
+    group_ids = set(by_title.values()).union(*linked.values())
+    fresh = set(await session.scalars(
+        select(RefreshState.entity_id).where(
+            RefreshState.kind == "group",
+            RefreshState.entity_id.in_(group_ids),
+            RefreshState.fetched_at >= fresh_since,
+        )
+    ))
+    for ev_id, text in rows:
+        if not linked.get(ev_id, set()) & fresh:
+            return False
+        if any(by_title[name] not in fresh for name in _group_names(text)):
+            return False
+    return True
 
 # ---------- Витяг подій для команд ----------
-async def events_for_user_day(session: AsyncSession, u: User, target_date: date) -> list[TimetableEvent]:
+def _user_events(u: User, start: date, end: date):
+    """Заняття з розкладу користувача (група або викладач) за датами [start, end]."""
     if u.role == "teacher" and u.teacher_id:
-        q = select(TimetableEvent).where(
-            and_(TimetableEvent.teacher_id == u.teacher_id, TimetableEvent.date == target_date)
-        ).order_by(TimetableEvent.time_start, TimetableEvent.lesson_number)
+        link, owner = EventTeacher, EventTeacher.teacher_id == u.teacher_id
     else:
-        q = select(TimetableEvent).where(
-            and_(TimetableEvent.group_id == u.group_id, TimetableEvent.date == target_date)
-        ).order_by(TimetableEvent.time_start, TimetableEvent.lesson_number)
+        link, owner = EventGroup, EventGroup.group_id == u.group_id
+    return select(TimetableEvent).join(link, link.event_id == TimetableEvent.id).where(
+        and_(owner, link.date >= start, link.date <= end)
+    )
+
+async def events_for_user_day(session: AsyncSession, u: User, target_date: date) -> list[TimetableEvent]:
+    q = _user_events(u, target_date, target_date).order_by(TimetableEvent.time_start, TimetableEvent.lesson_number)
     rows = await session.execute(q)
     return list(rows.scalars())
 
 async def events_for_user_range(session: AsyncSession, u: User, start: date, end: date) -> list[TimetableEvent]:
-    if u.role == "teacher" and u.teacher_id:
-        q = select(TimetableEvent).where(
-            and_(
-                TimetableEvent.teacher_id == u.teacher_id,
-                TimetableEvent.date >= start,
-                TimetableEvent.date <= end
-            )
-        ).order_by(TimetableEvent.date, TimetableEvent.time_start, TimetableEvent.lesson_number)
-    else:
-        q = select(TimetableEvent).where(
-            and_(
-                TimetableEvent.group_id == u.group_id,
-                TimetableEvent.date >= start,
-                TimetableEvent.date <= end
-            )
-        ).order_by(TimetableEvent.date, TimetableEvent.time_start, TimetableEvent.lesson_number)
+    q = _user_events(u, start, end).order_by(
+        TimetableEvent.date, TimetableEvent.time_start, TimetableEvent.lesson_number
+    )
     rows = await session.execute(q)
     return list(rows.scalars())
 
@@ -141,22 +711,7 @@ async def upcoming_events_for_user(session: AsyncSession, u: User, now_local_dt,
     window_start = now_local_dt + timedelta(minutes=notify_offset_min)
     window_end = window_start + timedelta(seconds=60)
 
-    if u.role == "teacher" and u.teacher_id:
-        q = select(TimetableEvent).where(
-            and_(
-                TimetableEvent.teacher_id == u.teacher_id,
-                TimetableEvent.date >= window_start.date(),
-                TimetableEvent.date <= window_end.date(),
-            )
-        )
-    else:
-        q = select(TimetableEvent).where(
-            and_(
-                TimetableEvent.group_id == u.group_id,
-                TimetableEvent.date >= window_start.date(),
-                TimetableEvent.date <= window_end.date(),
-            )
-        )
+    q = _user_events(u, window_start.date(), window_end.date())
     rows = list((await session.execute(q)).scalars())
 
     out = []
@@ -178,7 +733,9 @@ async def has_notification(session: AsyncSession, user_id: int, event_id: int) -
 async def list_distinct_teachers(session: AsyncSession) -> list[str]:
     names = set()
     rows = await session.execute(
-        select(TimetableEvent.teacher_full).where(TimetableEvent.teacher_full.is_not(None))
+        select(TextValue.value).where(TextValue.id.in_(
+            select(TimetableEvent.teacher_full_id).where(TimetableEvent.teacher_full_id.is_not(None)).distinct()
+        ))
     )
     for (name,) in rows:
         if name:
@@ -219,43 +776,170 @@ async def set_zoom_link(session: AsyncSession, teacher_name: str, url: str):
 
 async def zoom_for_event(session: AsyncSession, e: TimetableEvent) -> str | None:
     """
-    Повертає Zoom-лінк для події: пріоритет — за повним ПІБ, далі за teacher_id.
+    Повертає Zoom-лінк для події: пріоритет — за повним ПІБ, далі за викладачем заняття.
     """
     # 1) за повним ПІБ
     if e.teacher_full:
         url = await session.scalar(select(ZoomLink.url).where(ZoomLink.teacher_name == e.teacher_full))
         if url:
             return url
-    # 2) за teacher_id (актуально для "режиму викладача")
-    if e.teacher_id:
-        url = await session.scalar(select(ZoomLink.url).where(ZoomLink.teacher_id == e.teacher_id))
-        if url:
-            return url
-    return None
+    # 2) за викладачем, у чиєму розкладі є це заняття
+    url = await session.scalar(
+        select(ZoomLink.url)
+        .join(EventTeacher, EventTeacher.teacher_id == ZoomLink.teacher_id)
+        .where(EventTeacher.event_id == e.id)
+        .limit(1)
+    )
+    return url
+
+# ---------- Стан діалогів (FSM) ----------
+async def get_fsm_record(session: AsyncSession, key: str, now: datetime) -> FsmRecord | None:
+    """Запис FSM за ключем; прострочений вважається відсутнім."""
+    return await session.scalar(select(FsmRecord).where(FsmRecord.key == key, FsmRecord.expires_at > now))
+
+async def save_fsm_record(
+    session: AsyncSession, key: str, state: str | None, data: str | None, expires_at: datetime
+) -> None:
+    """Upsert стану й даних FSM. Порожній стан без даних — видалення запису."""
+    if state is None and not data:
+        await session.execute(delete(FsmRecord).where(FsmRecord.key == key))
+        return
+    ins = _dialect_insert(session)(FsmRecord).values(key=key, state=state, data=data, expires_at=expires_at)
+    await session.execute(ins.on_conflict_do_update(
+        index_elements=[FsmRecord.key],
+        set_={"state": ins.excluded.state, "data": ins.excluded.data, "expires_at": ins.excluded.expires_at},
+    ))
+
+async def cleanup_expired_fsm(session: AsyncSession, now: datetime, limit: int) -> int:
+    """Видаляє до limit прострочених записів FSM (покинуті онбординги)."""
+    res = await session.execute(
+        delete(FsmRecord).where(FsmRecord.key.in_(
+            select(FsmRecord.key).where(FsmRecord.expires_at <= now).limit(limit)
+        ))
+    )
+    return res.rowcount or 0
+
+# ---------- Примірники й оренда шардів ----------
+async def heartbeat_member(session: AsyncSession, instance_id: str, started_at: datetime, now: datetime, expires_at: datetime) -> None:
+    ins = _dialect_insert(session)(ClusterMember).values(
+        instance_id=instance_id, started_at=started_at, heartbeat_at=now, expires_at=expires_at,
+    )
+    await session.execute(ins.on_conflict_do_update(
+        index_elements=[ClusterMember.instance_id],
+        set_={"heartbeat_at": ins.excluded.heartbeat_at, "expires_at": ins.excluded.expires_at},
+    ))
+
+async def live_members(session: AsyncSession, now: datetime) -> list[str]:
+    """Живі примірники; прострочені записи заодно видаляються."""
+    await session.execute(delete(ClusterMember).where(ClusterMember.expires_at <= now))
+    rows = await session.execute(select(ClusterMember.instance_id).where(ClusterMember.expires_at > now))
+    return sorted(i for (i,) in rows)
+
+async def ensure_shards(session: AsyncSession, shard_count: int) -> None:
+    ins = _dialect_insert(session)(ShardLease).values([{"shard": i} for i in range(shard_count)])
+    await session.execute(ins.on_conflict_do_nothing(index_elements=[ShardLease.shard]))
+
+async def claim_shards(
+    session: AsyncSession, instance_id: str, wanted: set[int], now: datetime, expires_at: datetime
+) -> set[int]:
+    """
+    Віддає чужим шарди, яких instance_id більше не хоче, продовжує свої й забирає бажані
+    вільні чи прострочені (шард, який ще тримає живий власник, — лише після того, як той його віддасть).
+    Повертає шарди, що тепер належать instance_id.
+    """
+    await session.execute(
+        update(ShardLease)
+        .where(ShardLease.owner == instance_id, ShardLease.shard.not_in(wanted))
+        .values(owner=None, expires_at=None)
+    )
+    if wanted:
+        await session.execute(
+            update(ShardLease)
+            .where(
+                ShardLease.shard.in_(wanted),
+                or_(ShardLease.owner == instance_id, ShardLease.owner.is_(None), ShardLease.expires_at <= now),
+            )
+            .values(owner=instance_id, expires_at=expires_at)
+        )
+    rows = await session.execute(select(ShardLease.shard).where(ShardLease.owner == instance_id))
+    return {shard for (shard,) in rows}
+
+async def leave_cluster(session: AsyncSession, instance_id: str) -> None:
+    await session.execute(
+        update(ShardLease).where(ShardLease.owner == instance_id).values(owner=None, expires_at=None)
+    )
+    await session.execute(delete(ClusterMember).where(ClusterMember.instance_id == instance_id))
 
 # ---------- Очищення БД ----------
-async def cleanup_old_records(session: AsyncSession, cutoff_event_date: date, cutoff_notif_dt: datetime) -> Tuple[int, int]:
+async def cleanup_old_records(
+    session: AsyncSession,
+    cutoff_event_date: date,
+    cutoff_notif_dt: datetime,
+    limit: int | None = None,
+) -> Tuple[int, int, int]:
     """
     Видаляє:
-      • TimetableEvent із датою < cutoff_event_date
+      • TimetableEvent із датою < cutoff_event_date та їхні зв'язки з розкладами
       • NotificationLog із sent_at/ scheduled_for < cutoff_notif_dt
-    Повертає (n_events, n_logs).
+    limit — не більше стількох рядків з кожної таблиці за виклик (пачка id, відібрана
+    за індексом дати), щоб нічний клінап ішов короткими транзакціями. None — без обмеження.
+    Повертає (n_events, n_logs, n_links).
     """
-    # Events
-    res1 = await session.execute(
-        delete(TimetableEvent).where(TimetableEvent.date < cutoff_event_date)
+    expired_events = TimetableEvent.date < cutoff_event_date
+    expired_logs = or_(
+        NotificationLog.sent_at.is_(None) & (NotificationLog.scheduled_for < cutoff_notif_dt),
+        NotificationLog.sent_at.is_not(None) & (NotificationLog.sent_at < cutoff_notif_dt),
     )
-    n_events = res1.rowcount or 0
+    if limit is not None:
+        # пачку подій фіксуємо заздалегідь: ті самі id мають піти і зі зв'язків, і з подій
+        event_ids = list(await session.scalars(select(TimetableEvent.id).where(expired_events).limit(limit)))
+        expired_events = TimetableEvent.id.in_(event_ids)
+        expired_links = [link.event_id.in_(event_ids) for link in (EventGroup, EventTeacher)]
+        expired_logs = NotificationLog.id.in_(
+            select(NotificationLog.id).where(expired_logs).limit(limit)
+        )
+    else:
+        expired_links = [link.date < cutoff_event_date for link in (EventGroup, EventTeacher)]
+
+    # Links + Events
+    n_links = n_events = 0
+    if limit is None or event_ids:
+        for link, cond in zip((EventGroup, EventTeacher), expired_links):
+            res = await session.execute(delete(link).where(cond))
+            n_links += res.rowcount or 0
+        res1 = await session.execute(delete(TimetableEvent).where(expired_events))
+        n_events = res1.rowcount or 0
 
     # Logs
-    res2 = await session.execute(
-        delete(NotificationLog).where(
-            or_(
-                NotificationLog.sent_at.is_(None) & (NotificationLog.scheduled_for < cutoff_notif_dt),
-                NotificationLog.sent_at.is_not(None) & (NotificationLog.sent_at < cutoff_notif_dt),
-            )
-        )
-    )
+    res2 = await session.execute(delete(NotificationLog).where(expired_logs))
     n_logs = res2.rowcount or 0
 
-    return n_events, n_logs
+    return n_events, n_logs, n_links
+
+async def cleanup_orphan_raw_cells(session: AsyncSession, limit: int) -> int:
+    """Видаляє до limit стиснутих клітинок (raw_cells), на які вже не посилається жодне заняття чи зв'язок."""
+    referenced = or_(
+        select(TimetableEvent.source_hash).where(TimetableEvent.source_hash == RawCell.hash).exists(),
+        select(EventGroup.source_hash).where(EventGroup.source_hash == RawCell.hash).exists(),
+        select(EventTeacher.source_hash).where(EventTeacher.source_hash == RawCell.hash).exists(),
+    )
+    res = await session.execute(
+        delete(RawCell).where(RawCell.hash.in_(select(RawCell.hash).where(~referenced).limit(limit)))
+    )
+    return res.rowcount or 0
+
+async def drop_notification_partitions(session: AsyncSession, cutoff_notif_dt: datetime) -> list[str]:
+    """PostgreSQL: видаляє цілі місячні секції notification_log, старші за cutoff. Для інших БД — нічого."""
+    if session.get_bind().dialect.name != "postgresql":
+        return []
+    from partitioning import drop_expired_notification_partitions
+    conn = await session.connection()
+    return await conn.run_sync(drop_expired_notification_partitions, cutoff_notif_dt)
+
+async def maintain_notification_partitions(session: AsyncSession, today: date, months_ahead: int) -> list[str]:
+    """PostgreSQL: створює місячні секції notification_log наперед. Для інших БД — нічого."""
+    if session.get_bind().dialect.name != "postgresql":
+        return []
+    from partitioning import ensure_notification_partitions
+    conn = await session.connection()
+    return await conn.run_sync(ensure_notification_partitions, today, months_ahead)
@@ -1,6 +1,10 @@
 from __future__ import annotations
 
+import asyncio
+import logging
 import random
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta, date
 from typing import Dict
 
@@ -11,31 +15,62 @@ from apscheduler.triggers.cron import CronTrigger
 from sqlalchemy import select
 from zoneinfo import ZoneInfo
 
-from db import get_sessionmaker
-from models import Group, TimetableEvent, NotificationLog, User, Teacher
-from parsing.client import SourceClient
-from parsing.extractors import parse_timetable, parse_timetable_teacher
+from db import get_read_sessionmaker, checkpoint, incremental_vacuum
+from writer import write, submit
+from models import TimetableEvent, NotificationLog, User
 from config import Config
-from utils.time import now_kiev, today_kiev
+from refresh import get_refresh_engine
+from cadence import RefreshPlan, collect_demand, plan_cadences, set_last_plan
+from subscriptions import get_subscriptions
+from leases import get_leases
+from parsing.client import SourceClient
+from parsing.health import SourceUnavailable, get_source_health
+from querystats import track
+from utils.metrics import REMINDER_LATENESS_SECONDS, REMINDER_SCAN_SECONDS, REMINDERS_DUE, REMINDERS_SENT
+from utils.profiling import profiled
+from utils.time import now_kiev, today_kiev, to_utc
 from utils.formatting import EntityBuilder
 from repositories import (
-    distinct_group_ids_in_users,
-    distinct_teacher_ids_in_users,
+    subscriber_counts,
+    users_with_subscription,
     upcoming_events_for_user,
     has_notification,
     zoom_for_event,
-    sync_events_for_group,
-    sync_events_for_teacher,
     cleanup_old_records,  # припускаю, що в тебе вже є ця утиліта
+    drop_notification_partitions,
+    cleanup_orphan_raw_cells,
+    cleanup_expired_fsm,
+    maintain_notification_partitions,
 )
 
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class CleanupReport:
+    events: int = 0
+    logs: int = 0
+    links: int = 0
+    raw_cells: int = 0
+    fsm: int = 0
+    partitions_dropped: int = 0
+    pages_reclaimed: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+
 class BotScheduler:
     """
     Завдання:
       • Фазовані оновлення розкладу для груп і для викладачів.
-      • Реконсиліація списку завдань.
+      • Пріоритети оновлень у межах бюджету запитів (cadence.py).
+      • Завдання оновлень за реєстром підписок (subscriptions.py): нова група/викладач
+        плануються одразу після онбордингу; рідка повна звірка з БД — лише страховка.
       • Щоденний клінап історії.
       • Сканер нагадувань.
+      • Пробний запит до джерела, поки запобіжник відкритий.
+      • Кілька примірників (leases.py): нагадування й оновлення — лише для своїх шардів,
+        клінап і WAL checkpoint — лише на власнику шарда 0.
     """
 
     def __init__(self, bot):
@@ -44,8 +79,24 @@ class BotScheduler:
         self.cfg = Config.load()
         self.group_jobs: Dict[int, str] = {}    # group_id -> job.id
         self.teacher_jobs: Dict[int, str] = {}  # teacher_id -> job.id
+        self.job_intervals: Dict[tuple[str, int], int] = {}  # (dest, id) -> інтервал, с
+        self.last_cleanup: CleanupReport | None = None
+        self._replan_lock = asyncio.Lock()
+        self._replan_task: asyncio.Task | None = None
+        get_subscriptions().add_listener(self._on_subscription)
+        self.leases = get_leases()
+        self.leases.add_listener(self._on_shards_changed)
 
     def start(self):
+        if self.leases.enabled:
+            self.scheduler.add_job(
+                self.leases.heartbeat,
+                IntervalTrigger(seconds=max(1, self.cfg.lease_heartbeat_seconds)),
+                next_run_time=datetime.utcnow(),
+                id="lease_heartbeat",
+                replace_existing=True,
+            )
+
         self.scheduler.add_job(
             self._init_refresh_jobs,
             DateTrigger(run_date=datetime.utcnow() + timedelta(seconds=1)),
@@ -53,6 +104,13 @@ class BotScheduler:
             replace_existing=True,
         )
 
+        self.scheduler.add_job(
+            self.replan,
+            IntervalTrigger(minutes=max(1, self.cfg.refresh_replan_minutes)),
+            id="replan_refresh_jobs",
+            replace_existing=True,
+        )
+
         self.scheduler.add_job(
             self.reconcile_jobs,
             IntervalTrigger(minutes=max(1, self.cfg.refresh_reconcile_minutes)),
@@ -78,201 +136,367 @@ class BotScheduler:
             replace_existing=True,
         )
 
+        self.scheduler.add_job(
+            self.probe_source_job,
+            IntervalTrigger(seconds=max(1, min(60, self.cfg.source_breaker_cooldown_seconds))),
+            id="probe_source",
+            replace_existing=True,
+        )
+
+        if self.cfg.sqlite_checkpoint_minutes > 0:
+            self.scheduler.add_job(
+                self.checkpoint_job,
+                IntervalTrigger(minutes=self.cfg.sqlite_checkpoint_minutes),
+                id="wal_checkpoint",
+                replace_existing=True,
+            )
+
         self.scheduler.start()
 
     # -------------------- ІНІЦІАЛІЗАЦІЯ --------------------
     async def _init_refresh_jobs(self):
-        sm = get_sessionmaker()
-        async with sm() as s:
-            group_ids = list(await distinct_group_ids_in_users(s))
-            teacher_ids = list(await distinct_teacher_ids_in_users(s))
-        await self._schedule_evenly(group_ids, dest="group")
-        await self._schedule_evenly(teacher_ids, dest="teacher")
-
-    async def _schedule_evenly(self, ids: list[int], dest: str):
-        # Відміняємо попередні
-        mapping = self.group_jobs if dest == "group" else self.teacher_jobs
-        for i, job_id in list(mapping.items()):
+        await self.reconcile_jobs()
+
+    def _refresh_every_seconds(self) -> int:
+        """
+        Однаковий для всіх період оновлення, коли бюджет запитів не задано (REFRESH_BUDGET_PER_HOUR=0):
+        ближній горизонт (REFRESH_NEAR_INTERVAL_MINUTES); чи брати все вікно, вирішує
+        RefreshEngine.window(). Без ближнього горизонту — REFRESH_INTERVAL_HOURS.
+        """
+        cfg = self.cfg
+        if 0 < cfg.refresh_near_days < cfg.refresh_far_days:
+            return max(60, cfg.refresh_near_interval_minutes * 60)
+        return max(3600, cfg.refresh_interval_hours * 3600)
+
+    def _jobs(self, dest: str) -> Dict[int, str]:
+        return self.group_jobs if dest == "group" else self.teacher_jobs
+
+    def _schedule_job(self, _id: int, next_run_time: datetime, dest: str, interval_s: int):
+        func, kwarg = (self.refresh_one_group, "group_id") if dest == "group" else (self.refresh_one_teacher, "teacher_id")
+        return self.scheduler.add_job(
+            func,
+            IntervalTrigger(seconds=max(1, interval_s), jitter=max(0, self.cfg.refresh_jitter_seconds)),
+            next_run_time=next_run_time,
+            id=f"refresh_{dest}_{_id}",
+            replace_existing=True,
+            kwargs={kwarg: _id},
+        )
+
+    def _unschedule(self, dest: str, _id: int) -> None:
+        self.job_intervals.pop((dest, _id), None)
+        job_id = self._jobs(dest).pop(_id, None)
+        if job_id:
+            try: self.scheduler.remove_job(job_id)
+            except Exception: pass
+
+    # -------------------- ПРІОРИТЕТИ ТА ПІДПИСКИ --------------------
+    async def replan(self) -> RefreshPlan:
+        """
+        Перераховує пріоритети (cadence.py) для всіх груп/викладачів з реєстру підписок і приводить
+        до них завдання: нові отримують випадкову фазу в межах свого інтервалу, зайві прибираються,
+        завдання з помітно зміненим інтервалом (більш ніж на 20%) переносяться.
+        """
+        async with self._replan_lock:
+            return await self._replan()
+
+    async def _replan(self) -> RefreshPlan:
+        cfg = self.cfg
+        now = datetime.utcnow()
+        today = today_kiev().date()
+        registry = get_subscriptions()
+        leases = self.leases
+        if leases.enabled:
+            # онбординг міг пройти на іншому примірнику — реєстр звіряємо з БД на кожному перерахунку
+            async with get_read_sessionmaker()() as s:
+                registry.load(*await subscriber_counts(s), warn=False)
+        groups = {i: n for i, n in registry.counts("group").items() if leases.owns(i)}
+        teachers = {i: n for i, n in registry.counts("teacher").items() if leases.owns(i)}
+        async with get_read_sessionmaker()() as s:
+            demands = await collect_demand(s, today, now, groups, teachers)
+        if cfg.refresh_budget_per_hour > 0:
+            # бюджет запитів до джерела спільний — кожен примірник бере частку своїх шардів
+            plan = plan_cadences(
+                demands, today, cfg.refresh_budget_per_hour * leases.share(),
+                min_interval_s=max(60, cfg.refresh_min_interval_minutes * 60),
+                max_interval_s=max(3600, cfg.refresh_interval_hours * 3600),
+            )
+        else:
+            every = self._refresh_every_seconds()
+            plan = plan_cadences(demands, today, 0, min_interval_s=every, max_interval_s=every)
+
+        wanted = {(c.demand.kind, c.demand.entity_id): c.interval_s for c in plan.cadences}
+        removed = set(self.job_intervals) - set(wanted)
+        for dest, _id in removed:
+            self._unschedule(dest, _id)
+
+        changed = 0
+        for (dest, _id), interval in wanted.items():
+            current = self.job_intervals.get((dest, _id))
+            if current is not None and abs(interval - current) <= 0.2 * current:
+                continue
+            next_run = now + timedelta(seconds=interval)
+            if current is None:
+                # фаза в межах інтервалу — щоб запити не йшли пачкою
+                next_run = now + timedelta(seconds=random.randint(0, max(0, interval - 1)))
+            else:
+                job = self.scheduler.get_job(self._jobs(dest)[_id])
+                if job and job.next_run_time:
+                    next_run = min(next_run, job.next_run_time.replace(tzinfo=None))
+            job = self._schedule_job(_id, next_run, dest, interval)
+            self._jobs(dest)[_id] = job.id
+            self.job_intervals[(dest, _id)] = interval
+            changed += 1
+
+        set_last_plan(plan)
+        if changed or removed:
+            log.info("refresh plan: %d scheduled/rescheduled, %d removed; %s", changed, len(removed), plan.report())
+        return plan
+
+    def _on_subscription(self, kind: str, entity_id: int, subscribers: int) -> None:
+        """Слухач реєстру: остання підписка зникла — завдання прибираємо, нова сутність — плануємо."""
+        if subscribers <= 0:
+            self._unschedule(kind, entity_id)
+        elif (kind, entity_id) not in self.job_intervals and self.leases.owns(entity_id):
+            self._replan_soon()
+
+    async def shutdown(self) -> None:
+        """
+        Зупинка бота: нові запуски завдань не плануються, а ті, що виконуються, скасовуються —
+        щоб після цього ніхто не ставив записи в зупинену чергу письменника і не звертався до БД.
+        """
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        task, self._replan_task = self._replan_task, None
+        if task and not task.done():
+            task.cancel()
             try:
-                self.scheduler.remove_job(job_id)
-            except Exception:
+                await task
+            except asyncio.CancelledError:
                 pass
-            mapping.pop(i, None)
 
-        if not ids:
+    def _on_shards_changed(self, gained: set[int], lost: set[int]) -> None:
+        """Слухач оренди: завдання переїхали між примірниками — перерахувати план."""
+        self._replan_soon()
+
+    def _replan_soon(self) -> None:
+        # кілька онбордингів поспіль — один перерахунок
+        if self._replan_task and not self._replan_task.done():
             return
 
-        interval_seconds = max(1, int(self.cfg.refresh_interval_hours * 3600))
-        spacing = max(1, interval_seconds // len(ids))
+        async def _run():
+            await asyncio.sleep(1)
+            try:
+                await self.replan()
+            except Exception:
+                log.warning("replan after subscription change failed", exc_info=True)
 
-        now = datetime.utcnow()
-        for idx, _id in enumerate(sorted(ids)):
-            offset = idx * spacing
-            jitter = random.randint(0, max(0, self.cfg.refresh_jitter_seconds))
-            next_run = now + timedelta(seconds=offset + jitter)
-            job = self._schedule_job(_id, next_run, dest)
-            mapping[_id] = job.id
-
-    def _schedule_job(self, _id: int, next_run_time: datetime, dest: str):
-        if dest == "group":
-            job = self.scheduler.add_job(
-                self.refresh_one_group,
-                IntervalTrigger(
-                    hours=max(1, self.cfg.refresh_interval_hours),
-                    jitter=max(0, self.cfg.refresh_jitter_seconds),
-                ),
-                next_run_time=next_run_time,
-                id=f"refresh_group_{_id}",
-                replace_existing=True,
-                kwargs={"group_id": _id},
-            )
-        else:
-            job = self.scheduler.add_job(
-                self.refresh_one_teacher,
-                IntervalTrigger(
-                    hours=max(1, self.cfg.refresh_interval_hours),
-                    jitter=max(0, self.cfg.refresh_jitter_seconds),
-                ),
-                next_run_time=next_run_time,
-                id=f"refresh_teacher_{_id}",
-                replace_existing=True,
-                kwargs={"teacher_id": _id},
-            )
-        return job
+        self._replan_task = asyncio.get_running_loop().create_task(_run(), name="replan-refresh-jobs")
 
-    # -------------------- РЕКОНСИЛІАЦІЯ --------------------
     async def reconcile_jobs(self):
-        sm = get_sessionmaker()
-        async with sm() as s:
-            curr_gids = set(await distinct_group_ids_in_users(s))
-            curr_tids = set(await distinct_teacher_ids_in_users(s))
-
-        # groups
-        sched_g = set(self.group_jobs.keys())
-        to_add_g = curr_gids - sched_g
-        to_remove_g = sched_g - curr_gids
-
-        for gid in to_remove_g:
-            job_id = self.group_jobs.pop(gid, None)
-            if job_id:
-                try: self.scheduler.remove_job(job_id)
-                except Exception: pass
-
-        if to_add_g:
-            interval_seconds = max(1, int(self.cfg.refresh_interval_hours * 3600))
-            now = datetime.utcnow()
-            for gid in sorted(to_add_g):
-                offset = random.randint(0, max(0, interval_seconds - 1)) if interval_seconds > 1 else 0
-                jitter = random.randint(0, max(0, self.cfg.refresh_jitter_seconds))
-                next_run = now + timedelta(seconds=offset + jitter)
-                job = self._schedule_job(gid, next_run, dest="group")
-                self.group_jobs[gid] = job.id
-
-        # teachers
-        sched_t = set(self.teacher_jobs.keys())
-        to_add_t = curr_tids - sched_t
-        to_remove_t = sched_t - curr_tids
-
-        for tid in to_remove_t:
-            job_id = self.teacher_jobs.pop(tid, None)
-            if job_id:
-                try: self.scheduler.remove_job(job_id)
-                except Exception: pass
-
-        if to_add_t:
-            interval_seconds = max(1, int(self.cfg.refresh_interval_hours * 3600))
-            now = datetime.utcnow()
-            for tid in sorted(to_add_t):
-                offset = random.randint(0, max(0, interval_seconds - 1)) if interval_seconds > 1 else 0
-                jitter = random.randint(0, max(0, self.cfg.refresh_jitter_seconds))
-                next_run = now + timedelta(seconds=offset + jitter)
-                job = self._schedule_job(tid, next_run, dest="teacher")
-                self.teacher_jobs[tid] = job.id
+        """Страховка: звіряє реєстр підписок з таблицею users (старт і раз на REFRESH_RECONCILE_MINUTES)."""
+        async with get_read_sessionmaker()() as s:
+            groups, teachers = await subscriber_counts(s)
+        # з шардами розбіжність очікувана: онбординг міг пройти на іншому примірнику
+        get_subscriptions().load(groups, teachers, warn=not self.leases.enabled)
+        await self.replan()
 
     # -------------------- ОНОВЛЕННЯ ОДНІЄЇ ГРУПИ/ВИКЛАДАЧА --------------------
+    @profiled("refresh_one_group")
     async def refresh_one_group(self, group_id: int):
-        sm = get_sessionmaker()
-        cfg = self.cfg
+        if not self.leases.owns(group_id):
+            # шард уже не наш, завдання прибере найближчий перерахунок
+            return
         try:
-            async with sm() as s, SourceClient(cfg) as sc:
-                g = await s.get(Group, group_id)
-                if not g:
-                    return
-                html = await sc.post_filter(faculty_id=g.faculty_id or 0, course=g.course or 1, group_id=g.id)
-                events_dicts = list(parse_timetable(html, group_id=g.id, cfg_times=cfg.lesson_times))
-                from models import TimetableEvent as E
-                new_events = [E(**d) for d in events_dicts]
-                await sync_events_for_group(s, g.id, new_events)
-                await s.commit()
+            await get_refresh_engine().refresh_group(group_id)
+        except SourceUnavailable:
+            # запобіжник відкритий — наступний запуск за розкладом
+            log.debug("refresh group %s postponed: source circuit open", group_id)
         except Exception:
-            pass
+            log.warning("refresh group %s failed", group_id, exc_info=True)
 
+    @profiled("refresh_one_teacher")
     async def refresh_one_teacher(self, teacher_id: int):
-        sm = get_sessionmaker()
+        if not self.leases.owns(teacher_id):
+            return
+        try:
+            await get_refresh_engine().refresh_teacher(teacher_id)
+        except SourceUnavailable:
+            log.debug("refresh teacher %s postponed: source circuit open", teacher_id)
+        except Exception:
+            log.warning("refresh teacher %s failed", teacher_id, exc_info=True)
+
+    # -------------------- ПРОБА ДЖЕРЕЛА --------------------
+    async def probe_source_job(self):
+        """
+        Поки запобіжник відкритий, оновлення не йдуть — самі вони його не закриють.
+        Коли пауза минула, головна сторінка стає пробним запитом: успіх відновлює оновлення.
+        """
+        if not get_source_health().breaker.should_probe():
+            return
+        try:
+            async with SourceClient(self.cfg) as sc:
+                await sc.get_home()
+        except Exception:
+            log.info("source probe failed", exc_info=True)
+
+    # -------------------- КЛІНАП --------------------
+    @profiled("cleanup_old_records_job")
+    async def cleanup_old_records_job(self) -> CleanupReport:
+        """
+        Нічний клінап короткими пачками через чергу письменника: між пачками
+        встигають пройти нагадування й оновлення розкладу.
+        """
         cfg = self.cfg
+        started = time.monotonic()
+        report = CleanupReport()
+        if not self.leases.is_leader():
+            return report
+        cutoff_event_date = today_kiev().date() - timedelta(days=max(1, cfg.event_retention_days))
+        cutoff_notif_dt = datetime.utcnow() - timedelta(days=max(1, cfg.notification_retention_days))
+        batch = max(1, cfg.cleanup_batch_size)
+        pause = max(0, cfg.cleanup_batch_pause_ms) / 1000
+
+        # PostgreSQL: старі місяці журналу — цілими секціями
+        report.partitions_dropped = len(await write(lambda s: drop_notification_partitions(s, cutoff_notif_dt)))
+
+        while True:
+            n_events, n_logs, n_links = await write(
+                lambda s: cleanup_old_records(s, cutoff_event_date, cutoff_notif_dt, limit=batch)
+            )
+            report.events += n_events
+            report.logs += n_logs
+            report.links += n_links
+            report.batches += 1
+            if n_events < batch and n_logs < batch:
+                break
+            await asyncio.sleep(pause)
+
+        while True:
+            n_cells = await write(lambda s: cleanup_orphan_raw_cells(s, batch))
+            report.raw_cells += n_cells
+            if n_cells < batch:
+                break
+            await asyncio.sleep(pause)
+
+        # покинуті діалоги (FSM) після FSM_TTL_HOURS
+        now = datetime.utcnow()
+        while True:
+            n_fsm = await write(lambda s: cleanup_expired_fsm(s, now, batch))
+            report.fsm += n_fsm
+            if n_fsm < batch:
+                break
+            await asyncio.sleep(pause)
+
+        # SQLite: повертаємо звільнені сторінки порціями
+        step = max(1, cfg.cleanup_vacuum_pages)
+        while True:
+            n_pages = await incremental_vacuum(step)
+            report.pages_reclaimed += n_pages
+            if n_pages < step:
+                break
+            await asyncio.sleep(pause)
+
+        await write(lambda s: maintain_notification_partitions(
+            s, today_kiev().date(), cfg.notification_partitions_ahead
+        ))
         try:
-            async with sm() as s, SourceClient(cfg) as sc:
-                t = await s.get(Teacher, teacher_id)
-                if not t:
-                    return
-                html = await sc.post_teacher_filter(chair_id=t.chair_id or 0, teacher_id=t.id)
-                events_dicts = list(parse_timetable_teacher(html, teacher_id=t.id, teacher_full_name=t.full_name, cfg_times=cfg.lesson_times))
-                from models import TimetableEvent as E
-                new_events = [E(**d) for d in events_dicts]
-                await sync_events_for_teacher(s, t.id, new_events)
-                await s.commit()
+            await checkpoint("TRUNCATE")
         except Exception:
             pass
 
-    # -------------------- КЛІНАП --------------------
-    async def cleanup_old_records_job(self):
-        sm = get_sessionmaker()
-        cutoff_event_date = today_kiev().date() - timedelta(days=max(1, self.cfg.event_retention_days))
-        cutoff_notif_dt = datetime.utcnow() - timedelta(days=max(1, self.cfg.notification_retention_days))
-        async with sm() as s:
-            _ = await cleanup_old_records(s, cutoff_event_date, cutoff_notif_dt)
-            await s.commit()
+        report.seconds = time.monotonic() - started
+        self.last_cleanup = report
+        log.info(
+            "cleanup: events=%d links=%d logs=%d raw_cells=%d fsm=%d partitions=%d pages=%d batches=%d in %.2fs",
+            report.events, report.links, report.logs, report.raw_cells, report.fsm, report.partitions_dropped,
+            report.pages_reclaimed, report.batches, report.seconds,
+        )
+        return report
+
+    # -------------------- WAL checkpoint --------------------
+    async def checkpoint_job(self):
+        if not self.leases.is_leader():
+            return
+        try:
+            await checkpoint("PASSIVE")
+        except Exception:
+            pass
 
     # -------------------- Нагадування --------------------
+    @profiled("scan_upcoming")
     async def scan_upcoming(self):
-        sm = get_sessionmaker()
+        with REMINDER_SCAN_SECONDS.time():
+            await self._scan_upcoming()
+
+    async def _scan_upcoming(self):
+        rsm = get_read_sessionmaker()
         kiev_now = now_kiev()
-        async with sm() as s:
-            users = list((await s.execute(select(User).where(
-                (User.group_id.is_not(None)) | (User.teacher_id.is_not(None))
-            ))).scalars())
-
-        for u in users:
-            async with sm() as s:
-                triples = await upcoming_events_for_user(s, u, kiev_now, u.notify_offset_min)
-                for (user, e, sched) in triples:
-                    if await has_notification(s, user.user_id, e.id):
-                        continue
-                    try:
-                        z = await zoom_for_event(s, e)
-                        text, entities = self._format_notif(u, u.notify_offset_min, e, zoom_url=z)
-                        await self.bot.send_message(chat_id=user.user_id, text=text, entities=entities)
-                        s.add(NotificationLog(
-                            user_id=user.user_id,
-                            group_id=e.group_id,
-                            event_id=e.id,
-                            scheduled_for=sched,
-                            sent_at=datetime.utcnow(),
-                            status="sent",
-                            error=None
-                        ))
-                        await s.commit()
-                    except Exception as ex:
-                        s.add(NotificationLog(
-                            user_id=user.user_id,
-                            group_id=e.group_id,
-                            event_id=e.id,
-                            scheduled_for=sched,
-                            sent_at=None,
-                            status="failed",
-                            error=str(ex)
-                        ))
-                        await s.commit()
+        # спершу все читання — в одній сесії, потім надсилання: з'єднання читача не чекає на Telegram.
+        # SQL рахується на користувача (querystats.py), бюджет — QUERY_BUDGETS[scan_upcoming]
+        due = []
+        # спільне заняття (потік, викладач) форматується один раз на скан:
+        # zoom — за id заняття, текст — за (заняття, роль, випередження)
+        zoom_cache: dict[int, str | None] = {}
+        async with rsm() as s:
+            users = [u for u in await users_with_subscription(s) if self.leases.owns(u.user_id)]
+            for u in users:
+                with track("scan_upcoming"):
+                    for (user, e, sched) in await upcoming_events_for_user(s, u, kiev_now, u.notify_offset_min):
+                        if await has_notification(s, user.user_id, e.id):
+                            continue
+                        if e.id not in zoom_cache:
+                            zoom_cache[e.id] = await zoom_for_event(s, e)
+                        due.append((u, user, e, sched))
+        REMINDERS_DUE.set(len(due))
+
+        # записи журналу йдуть у чергу письменника і комітяться пачками
+        pending = []
+        rendered: dict[tuple, tuple] = {}
+        for u, user, e, sched in due:
+            try:
+                key = (e.id, u.role, u.notify_offset_min)
+                if key not in rendered:
+                    rendered[key] = self._format_notif(u, u.notify_offset_min, e, zoom_url=zoom_cache[e.id])
+                text, entities = rendered[key]
+                await self.bot.send_message(chat_id=user.user_id, text=text, entities=entities)
+                # запізнення — від часу нагадування (початок пари мінус зсув); скан бере хвилину
+                # наперед, тож вчасне нагадування дає 0
+                due_at = sched - timedelta(minutes=u.notify_offset_min)
+                REMINDER_LATENESS_SECONDS.observe(max(0.0, (now_kiev() - due_at).total_seconds()))
+                REMINDERS_SENT.inc(status="sent")
+                log_row = NotificationLog(
+                    user_id=user.user_id,
+                    group_id=user.group_id,
+                    event_id=e.id,
+                    scheduled_for=to_utc(sched).replace(tzinfo=None),
+                    sent_at=datetime.utcnow(),
+                    status="sent",
+                    error=None
+                )
+            except Exception as ex:
+                REMINDERS_SENT.inc(status="failed")
+                log_row = NotificationLog(
+                    user_id=user.user_id,
+                    group_id=user.group_id,
+                    event_id=e.id,
+                    scheduled_for=to_utc(sched).replace(tzinfo=None),
+                    sent_at=None,
+                    status="failed",
+                    error=str(ex)
+                )
+            pending.append(asyncio.create_task(self._log_notification(log_row)))
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    @staticmethod
+    async def _log_notification(row: NotificationLog) -> None:
+        # запис чекаємо всередині області: письменник виконує його пізніше, ніж track() закрився б
+        # одразу після submit(), і інструкції лишилися б неврахованими
+        async def _op(s):
+            s.add(row)
+
+        with track("scan_upcoming_log"):
+            await submit(_op)
 
     # ---------- утиліти форматування ----------
     @staticmethod
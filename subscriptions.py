@@ -0,0 +1,97 @@
+"""
+Реєстр підписок у пам'яті процесу: скільки користувачів чекають розклад кожної групи/викладача.
+
+Онбординг оновлює реєстр одразу після запису вибору в БД (update(before, after)),
+а слухачі (планувальник) дізнаються про появу чи зникнення сутності без опитування
+таблиці users. Повна звірка з БД (load) — під час старту і зрідка як страховка.
+До першого load() зміни ігноруються: знімок з БД їх уже враховує.
+"""
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from typing import Callable
+
+from models import User
+
+log = logging.getLogger(__name__)
+
+Key = tuple[str, int]  # ('group' | 'teacher', id)
+Listener = Callable[[str, int, int], None]
+
+
+def subscriptions_of(u: User | None) -> set[Key]:
+    """Групи/викладачі, на які підписаний користувач (як їх рахує repositories.subscriber_counts)."""
+    if u is None:
+        return set()
+    keys: set[Key] = set()
+    if u.group_id is not None:
+        keys.add(("group", u.group_id))
+    if u.teacher_id is not None:
+        keys.add(("teacher", u.teacher_id))
+    return keys
+
+
+class SubscriptionRegistry:
+    def __init__(self):
+        self._counts: Counter[Key] = Counter()
+        self._listeners: list[Listener] = []
+        self.loaded = False
+
+    def add_listener(self, listener: Listener) -> None:
+        """listener(kind, id, subscribers) — після кожної зміни кількості підписників сутності."""
+        self._listeners.append(listener)
+
+    def subscribers(self, kind: str, entity_id: int) -> int:
+        return self._counts.get((kind, entity_id), 0)
+
+    def counts(self, kind: str) -> dict[int, int]:
+        return {i: n for (k, i), n in self._counts.items() if k == kind}
+
+    def load(self, groups: dict[int, int], teachers: dict[int, int], *, warn: bool = True) -> int:
+        """
+        Замінює лічильники знімком з БД. Повертає, скільки сутностей розійшлося з реєстром
+        (після першого завантаження має бути 0 — інакше десь оминули update();
+        з кількома примірниками розбіжність нормальна: онбординг міг пройти на іншому, тоді warn=False).
+        """
+        fresh: Counter[Key] = Counter()
+        fresh.update({("group", i): n for i, n in groups.items() if n > 0})
+        fresh.update({("teacher", i): n for i, n in teachers.items() if n > 0})
+        drift = [k for k in set(fresh) | set(self._counts) if fresh.get(k, 0) != self._counts.get(k, 0)]
+        was_loaded, self._counts, self.loaded = self.loaded, fresh, True
+        for kind, entity_id in drift:
+            self._notify(kind, entity_id)
+        if was_loaded and drift and warn:
+            log.warning("subscription registry drifted from DB for %d entities", len(drift))
+        return len(drift) if was_loaded else 0
+
+    def update(self, before: set[Key], after: set[Key]) -> None:
+        """Користувач перейшов з підписок before на after (результат subscriptions_of до і після запису)."""
+        if not self.loaded:
+            return
+        for key in before - after:
+            self._counts[key] -= 1
+            if self._counts[key] <= 0:
+                del self._counts[key]
+            self._notify(*key)
+        for key in after - before:
+            self._counts[key] += 1
+            self._notify(*key)
+
+    def _notify(self, kind: str, entity_id: int) -> None:
+        n = self.subscribers(kind, entity_id)
+        for listener in self._listeners:
+            try:
+                listener(kind, entity_id, n)
+            except Exception:
+                log.warning("subscription listener failed for %s %s", kind, entity_id, exc_info=True)
+
+
+_registry: SubscriptionRegistry | None = None
+
+
+def get_subscriptions() -> SubscriptionRegistry:
+    global _registry
+    if _registry is None:
+        _registry = SubscriptionRegistry()
+    return _registry
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+# модулі бота лежать у корені репозиторію (без пакування) — робимо їх імпортованими для тестів
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def anyio_backend():
+    # async-тести (pytest.mark.anyio) — лише на asyncio, як і бот
+    return "asyncio"
+
+
+@pytest.fixture
+async def database():
+    """Схема з models.py у SQLite в пам'яті; читання і запис — через один рушій (StaticPool)."""
+    import db
+    import models
+
+    db.init_engine("sqlite+aiosqlite:///:memory:")
+    await db.create_all(models)
+    yield db
+    await db.dispose()
+
+
+@pytest.fixture
+async def write_queue(database):
+    """Запущений письменник (writer.py) поверх БД у пам'яті."""
+    import writer as w
+
+    queue = w.start_writer()
+    yield queue
+    await w.stop_writer()
@@ -0,0 +1,76 @@
+"""Розподіл бюджету оновлень (cadence.plan_cadences): бюджет, нижня межа і стеля частоти."""
+from datetime import date, timedelta
+
+import pytest
+
+from cadence import Demand, plan_cadences, weight
+
+TODAY = date(2026, 10, 19)
+MIN_S, MAX_S = 600, 6 * 3600  # не частіше ніж раз на 10 хв, не рідше ніж раз на 6 год
+FLOOR, CAP = 3600 / MAX_S, 3600 / MIN_S
+
+
+def _hot(entity_id: int) -> Demand:
+    return Demand("group", entity_id, subscribers=500, next_lesson=TODAY, change_rate=1.0)
+
+
+def _idle(entity_id: int) -> Demand:
+    return Demand("group", entity_id, subscribers=0, next_lesson=None)
+
+
+def _plan(demands, budget):
+    return plan_cadences(demands, TODAY, budget, MIN_S, MAX_S)
+
+
+@pytest.mark.parametrize("demands, budget", [
+    ([_hot(1)], 3.0),
+    ([_hot(1), _idle(2)], 5.0),
+    ([_hot(i) for i in range(5)] + [_idle(i) for i in range(5, 50)], 40.0),
+    ([_idle(i) for i in range(20)], 30.0),
+    ([_hot(i) for i in range(3)], 1000.0),
+    ([], 10.0),
+])
+def test_plan_stays_within_budget(demands, budget):
+    plan = _plan(demands, budget)
+    assert len(plan.cadences) == len(demands)
+    # інтервали округлюються до секунд — допускаємо похибку округлення
+    assert plan.planned_per_hour <= budget * 1.001
+    assert all(MIN_S <= c.interval_s <= MAX_S for c in plan.cadences)
+
+
+@pytest.mark.parametrize("budget", [0.0, 1.0, 40.0, 500.0])
+def test_zero_demand_gets_floor(budget):
+    plan = _plan([_hot(1)] + [_idle(i) for i in range(2, 12)], budget)
+    idle = [c for c in plan.cadences if c.demand.subscribers == 0]
+    assert all(c.interval_s <= MAX_S for c in idle)
+    if budget <= FLOOR * 11:
+        # бюджету не вистачає навіть на нижню межу — усім max_interval_s, гарячій теж
+        assert {c.interval_s for c in plan.cadences} == {MAX_S}
+
+
+@pytest.mark.parametrize("budget, hot_interval", [
+    (CAP * 4, MIN_S),       # з надлишком — гарячі впираються у стелю
+    (FLOOR * 4 + 3, None),  # помірний бюджет — частіше за нижню межу, але не до стелі
+])
+def test_high_demand_capped_and_excess_redistributed(budget, hot_interval):
+    plan = _plan([_hot(1), _hot(2), _idle(3), _idle(4)], budget)
+    hot, idle = plan.cadences[:2], plan.cadences[2:]
+    if hot_interval is not None:
+        assert all(c.interval_s == hot_interval for c in hot)
+        # надлишок гарячих перерозподілено: неактивні теж отримали більше за нижню межу
+        assert all(c.interval_s < MAX_S for c in idle)
+    else:
+        assert all(MIN_S < c.interval_s < MAX_S for c in hot)
+        assert all(h.interval_s < i.interval_s for h in hot for i in idle)
+
+
+@pytest.mark.parametrize("demand, expected", [
+    (Demand("group", 1, 0, None), 0.25),
+    (Demand("group", 1, 1, TODAY + timedelta(days=1)), 2 * 3.0 * 0.5),
+    (Demand("group", 1, 3, TODAY + timedelta(days=3)), 3 * 2.0 * 0.5),
+    (Demand("group", 1, 0, TODAY + timedelta(days=5), change_rate=0.5), 1.0),
+    (Demand("group", 1, 0, TODAY + timedelta(days=8), change_rate=2.0), 0.75),
+    (Demand("group", 1, 1, TODAY, negative=True), 2 * 3.0 * 0.5 * 0.1),
+])
+def test_weight_factors(demand, expected):
+    assert weight(demand, TODAY) == pytest.approx(expected)
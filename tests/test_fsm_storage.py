@@ -0,0 +1,80 @@
+"""Сховище FSM у БД (fsm_storage.py): стан і дані, термін життя, записи через чергу письменника."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import func, select, update
+
+import repositories as r
+from fsm_storage import DBStorage
+from models import FsmRecord
+
+pytestmark = pytest.mark.anyio
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+OTHER = StorageKey(bot_id=1, chat_id=11, user_id=11)
+
+
+class Form(StatesGroup):
+    group = State()
+
+
+@pytest.fixture
+def storage(database):
+    return DBStorage(timedelta(hours=24))
+
+
+async def _rows(database) -> int:
+    async with database.get_read_sessionmaker()() as s:
+        return await s.scalar(select(func.count()).select_from(FsmRecord))
+
+
+async def test_state_and_data_round_trip(storage, database):
+    assert await storage.get_state(KEY) is None and await storage.get_data(KEY) == {}
+
+    await storage.set_state(KEY, Form.group)
+    await storage.set_data(KEY, {"faculty": 3, "page": 0, "назва": "ФІТ"})
+    assert await storage.get_state(KEY) == Form.group.state
+    assert await storage.get_data(KEY) == {"faculty": 3, "page": 0, "назва": "ФІТ"}
+
+    merged = await storage.update_data(KEY, {"page": 2, "course": 1})
+    assert merged == {"faculty": 3, "page": 2, "назва": "ФІТ", "course": 1}
+    merged["page"] = 99  # повернений словник — копія
+    assert (await storage.get_data(KEY))["page"] == 2
+    # зміна даних не скидає стан і навпаки
+    assert await storage.get_state(KEY) == Form.group.state
+    await storage.set_state(KEY, "StartFSM:notify")
+    assert (await storage.get_data(KEY))["course"] == 1
+    assert await storage.get_state(OTHER) is None
+
+    # порожній стан без даних — запис видаляється
+    await storage.set_state(KEY, None)
+    await storage.set_data(KEY, {})
+    assert await _rows(database) == 0
+
+
+async def test_expired_record_is_not_read(storage, database):
+    from writer import write
+
+    await storage.set_state(KEY, Form.group)
+    await storage.update_data(KEY, {"page": 1})
+    await write(lambda s: s.execute(update(FsmRecord).values(expires_at=datetime.utcnow() - timedelta(seconds=1))))
+    assert await storage.get_state(KEY) is None and await storage.get_data(KEY) == {}
+    # прострочені дані не «воскресають» при наступній зміні
+    assert await storage.update_data(KEY, {"course": 2}) == {"course": 2}
+    assert await storage.get_state(KEY) is None
+
+    await write(lambda s: s.execute(update(FsmRecord).values(expires_at=datetime.utcnow() - timedelta(seconds=1))))
+    assert await write(lambda s: r.cleanup_expired_fsm(s, datetime.utcnow(), 100)) == 1
+    assert await _rows(database) == 0
+
+
+async def test_concurrent_updates_go_through_writer(storage, write_queue):
+    # read-modify-write в одній операції письменника: жодне оновлення не губиться
+    await asyncio.gather(*(storage.update_data(KEY, {f"k{i}": i}) for i in range(20)))
+    assert await storage.get_data(KEY) == {f"k{i}": i for i in range(20)}
+    assert write_queue.ops == 20 and write_queue.batches < 20
+    await storage.set_state(KEY, Form.group)
+    assert await storage.get_state(KEY) == Form.group.state
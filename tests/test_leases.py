@@ -0,0 +1,111 @@
+"""Оренда шардів (leases.py): rendezvous-хешування і передача шардів між двома примірниками."""
+import logging
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from config import Config
+from leases import ShardLeases, rendezvous_owner
+from models import ClusterMember, ShardLease
+from subscriptions import SubscriptionRegistry
+
+pytestmark = pytest.mark.anyio
+
+SHARDS = 16
+
+
+def _owners(members: list[str], shards: int = 256) -> dict[int, str]:
+    return {s: rendezvous_owner(s, members) for s in range(shards)}
+
+
+def test_rendezvous_is_stable_and_moves_minimum():
+    before = _owners(["a", "b", "c"])
+    assert before == _owners(["c", "a", "b"])  # порядок примірників не важить
+    assert set(before.values()) == {"a", "b", "c"}
+
+    joined = _owners(["a", "b", "c", "d"])
+    moved = {s for s in before if before[s] != joined[s]}
+    # переїжджають лише шарди, які дісталися новому примірнику, — приблизно 1/4
+    assert all(joined[s] == "d" for s in moved)
+    assert 256 / 8 < len(moved) < 256 / 2
+
+    left = _owners(["a", "c"])
+    moved = {s for s in before if before[s] != left[s]}
+    # переїжджають лише шарди примірника, що зник
+    assert moved == {s for s, m in before.items() if m == "b"}
+    assert rendezvous_owner(0, []) is None
+
+
+@pytest.fixture
+def nodes(write_queue, monkeypatch):
+    monkeypatch.setenv("SHARD_COUNT", str(SHARDS))
+    monkeypatch.setenv("LEASE_TTL_SECONDS", "30")
+    cfg = Config.load()
+    return ShardLeases(cfg, "node-a"), ShardLeases(cfg, "node-b")
+
+
+async def test_join_hands_shards_over_without_overlap(nodes):
+    a, b = nodes
+    await a.heartbeat()
+    assert a.held == set(range(SHARDS)) and a.is_leader()
+
+    # b бачить a живим: бажані шарди ще тримає a — b їх не забирає, доки a не віддасть
+    await b.heartbeat()
+    assert b.held == set()
+    await a.heartbeat()
+    await b.heartbeat()
+    expected = {s for s in range(SHARDS) if rendezvous_owner(s, ["node-a", "node-b"]) == "node-b"}
+    assert b.held == expected
+    assert a.held == set(range(SHARDS)) - expected
+    assert a.share() + b.share() == 1.0
+    assert all(a.owns(i) != b.owns(i) for i in range(100))
+
+    # a зупиняється: шарди звільняються одразу, b забирає їх на найближчому heartbeat
+    await a.leave()
+    await b.heartbeat()
+    assert b.held == set(range(SHARDS))
+
+
+async def test_expired_lease_is_taken_over(nodes):
+    from writer import write
+
+    a, b = nodes
+    await a.heartbeat()
+    # a «помер» без leave(): його запис у cluster_members і оренди прострочені
+    past = datetime.utcnow() - timedelta(seconds=1)
+    await write(lambda s: s.execute(update(ClusterMember).values(expires_at=past)))
+    await write(lambda s: s.execute(update(ShardLease).values(expires_at=past)))
+
+    gained = []
+    b.add_listener(lambda g, lost: gained.append((g, lost)))
+    await b.heartbeat()
+    assert b.held == set(range(SHARDS)) and b.members == ["node-b"]
+    assert gained == [(set(range(SHARDS)), set())]
+
+
+async def test_failed_heartbeat_keeps_shards_only_until_ttl(nodes, monkeypatch):
+    import leases
+
+    a, _ = nodes
+    await a.heartbeat()
+    assert a.owns(1)
+
+    async def down(op):
+        raise ConnectionError("db down")
+
+    monkeypatch.setattr(leases, "write", down)
+    await a.heartbeat()
+    assert a.failures == 1 and a.owns(1)
+    a._valid_until = 0.0  # оренда могла спливти
+    assert not a.owns(1) and not a.is_leader() and a.share() == 0.0
+
+
+def test_drift_warning_suppressed_when_sharded(caplog):
+    reg = SubscriptionRegistry()
+    reg.load({1: 1}, {})
+    with caplog.at_level(logging.WARNING, logger="subscriptions"):
+        assert reg.load({1: 2, 2: 1}, {}, warn=False) == 2
+        assert not caplog.records
+        assert reg.load({1: 3}, {}) == 2
+    assert "drifted" in caplog.text
@@ -0,0 +1,107 @@
+"""Метрики (utils/metrics.py): точний текстовий формат Prometheus і запізнення нагадувань."""
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+import repositories as r
+from models import TimetableEvent, User
+from utils.metrics import REMINDER_LATENESS_SECONDS, Counter, Gauge, Histogram, Registry
+from utils.time import now_kiev
+
+pytestmark = pytest.mark.anyio
+
+GOLDEN = """\
+# HELP app_jobs_total Виконані задачі
+# TYPE app_jobs_total counter
+app_jobs_total 3
+# HELP app_queue_depth Глибина черги
+# TYPE app_queue_depth gauge
+app_queue_depth{queue="a\\"b\\\\c\\nd"} 2.5
+app_queue_depth{queue="main"} 7
+# HELP app_latency_seconds Затримка
+# TYPE app_latency_seconds histogram
+app_latency_seconds_bucket{le="0.1"} 1
+app_latency_seconds_bucket{le="1"} 3
+app_latency_seconds_bucket{le="+Inf"} 4
+app_latency_seconds_sum 6.55
+app_latency_seconds_count 4
+"""
+
+
+def test_render_golden_output():
+    reg = Registry()
+    jobs = Counter("app_jobs_total", "Виконані задачі", registry=reg)
+    depth = Gauge("app_queue_depth", "Глибина черги", ["queue"], registry=reg)
+    latency = Histogram("app_latency_seconds", "Затримка", buckets=(1, 0.1), registry=reg)
+
+    jobs.inc()
+    jobs.inc(2)
+    depth.set(7, queue="main")
+    depth.set(2.5, queue='a"b\\c\nd')
+    for value in (0.05, 0.5, 1.0, 5.0):  # межа кошика включна: 1.0 — у le="1"
+        latency.observe(value)
+    assert reg.render() == GOLDEN
+
+
+def test_collectors_render_after_metrics():
+    reg = Registry()
+    Counter("app_empty_total", "Без значень", registry=reg)
+    reg.add_collector(lambda: [("app_pending", "gauge", "Черга", [({}, 1), ({"kind": "x"}, 0.5)])])
+    assert reg.render().splitlines() == [
+        "# HELP app_empty_total Без значень",
+        "# TYPE app_empty_total counter",
+        "# HELP app_pending Черга",
+        "# TYPE app_pending gauge",
+        "app_pending 1",
+        'app_pending{kind="x"} 0.5',
+    ]
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, entities=None):
+        self.sent.append(chat_id)
+
+
+def _lateness_counts() -> list[int]:
+    series = REMINDER_LATENESS_SECONDS._values.get(())
+    return list(series[0]) if series else [0] * (len(REMINDER_LATENESS_SECONDS.buckets) + 1)
+
+
+@pytest.mark.parametrize("sent_after_due, bucket", [
+    (timedelta(seconds=-30), 0),  # скан бере хвилину наперед: вчасне нагадування — 0 с
+    (timedelta(seconds=90), REMINDER_LATENESS_SECONDS.buckets.index(120)),
+])
+async def test_reminder_lateness_counts_from_reminder_time(write_queue, monkeypatch, sent_after_due, bucket):
+    import scheduler
+    from writer import write
+
+    offset = 5
+    lesson = (now_kiev() + timedelta(hours=1)).replace(second=0, microsecond=0)
+    due_at = lesson - timedelta(minutes=offset)
+    event = TimetableEvent(
+        date=lesson.date(), lesson_number=1, time_start=lesson.time(), time_end=(lesson + timedelta(minutes=80)).time(),
+        subject_full="Математика", teacher_full="Іванов Іван Іванович", groups_text="Г",
+    )
+    await write(lambda s: r.upsert_groups(s, 1, 1, [(1, "Г")]))
+    await write(lambda s: r.sync_events_for_group(s, 1, [event]))
+
+    async def add_user(s):
+        s.add(User(user_id=1, role="student", group_id=1, notify_offset_min=offset))
+
+    await write(add_user)
+
+    # перший виклик — час скану (за 30 с до нагадування), далі — час надсилання
+    times = iter([due_at - timedelta(seconds=30)])
+    monkeypatch.setattr(scheduler, "now_kiev", lambda: next(times, due_at + sent_after_due))
+    bot = RecordingBot()
+    before = _lateness_counts()
+    await scheduler.BotScheduler(bot)._scan_upcoming()
+    await asyncio.sleep(0.05)  # журнал нагадувань пишеться фоновою задачею
+
+    after = _lateness_counts()
+    assert bot.sent == [1]
+    assert [a - b for a, b in zip(after, before)] == [int(i == bucket) for i in range(len(after))]
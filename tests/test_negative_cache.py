@@ -0,0 +1,94 @@
+"""Негативний кеш оновлень: подвоєння TTL, стеля, зміна причини і скидання після успішного завантаження."""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import refresh
+import repositories as r
+from config import Config
+from utils.time import today_kiev
+
+pytestmark = pytest.mark.anyio
+
+MISSING_PAGE = "<html><form></form></html>"
+EMPTY_PAGE = "<table id='timeTable'></table>"
+HOUR = timedelta(hours=1)
+
+
+@pytest.fixture
+async def engine(write_queue, monkeypatch):
+    from writer import write
+
+    monkeypatch.setenv("NEGATIVE_TTL_BASE_HOURS", "6")
+    monkeypatch.setenv("NEGATIVE_TTL_MAX_HOURS", "20")
+    monkeypatch.setenv("NEGATIVE_EMPTY_TTL_MAX_HOURS", "24")
+    await write(lambda s: r.upsert_groups(s, 1, 1, [(777, "Г")]))
+    return refresh.RefreshEngine(Config.load())
+
+
+async def _state(database):
+    async with database.get_read_sessionmaker()() as s:
+        return await r.get_refresh_state(s, "group", 777)
+
+
+def _ttl(st) -> int:
+    return round((st.negative_until - datetime.utcnow()) / HOUR)
+
+
+def _window() -> tuple[date, date]:
+    today = today_kiev().date()
+    return today, today + timedelta(days=30)
+
+
+async def _apply(engine, html: str, events=()):
+    return await engine._apply(
+        "group", 777, html, lambda: list(events), r.sync_events_for_group, _window(), True,
+    )
+
+
+async def test_missing_page_doubles_ttl_up_to_cap(engine, database):
+    seen = []
+    for _ in range(4):
+        assert await _apply(engine, MISSING_PAGE) is None
+        st = await _state(database)
+        seen.append((st.negative_kind, st.negative_count, _ttl(st)))
+    # 6 → 12 → 24, але стеля NEGATIVE_TTL_MAX_HOURS=20
+    assert seen == [("missing", 1, 6), ("missing", 2, 12), ("missing", 3, 20), ("missing", 4, 20)]
+
+
+async def test_repeated_empty_timetable_doubles_ttl(engine, database):
+    seen = []
+    for _ in range(3):
+        assert await _apply(engine, EMPTY_PAGE) == (0, 0, 0)
+        st = await _state(database)
+        seen.append((st.negative_kind, st.negative_count, _ttl(st)))
+    assert seen == [("empty", 1, 6), ("empty", 2, 12), ("empty", 3, 24)]
+    # свіжість при цьому оновлюється: порожнє вікно — теж успішне завантаження
+    assert st.fetched_at is not None and st.far_fetched_at is not None
+
+
+async def test_other_negative_kind_restarts_from_base(engine, database):
+    await _apply(engine, MISSING_PAGE)
+    await _apply(engine, MISSING_PAGE)
+    await _apply(engine, EMPTY_PAGE)
+    st = await _state(database)
+    assert (st.negative_kind, st.negative_count, _ttl(st)) == ("empty", 1, 6)
+
+
+async def test_successful_fetch_clears_negative_cache(engine, database):
+    await _apply(engine, MISSING_PAGE)
+    await _apply(engine, EMPTY_PAGE)
+    lesson = {
+        "date": today_kiev().date(), "lesson_number": 1, "subject_full": "Математика",
+        "teacher_full": "Іванов Іван Іванович", "groups_text": "Г",
+    }
+    assert await _apply(engine, EMPTY_PAGE, [lesson]) == (1, 0, 0)
+    st = await _state(database)
+    assert (st.negative_kind, st.negative_count, st.negative_until) == (None, 0, None)
+    assert not await engine.holding_off("group", 777)
+
+
+async def test_holding_off_while_negative(engine, database):
+    await _apply(engine, MISSING_PAGE)
+    assert await engine.holding_off("group", 777)
+    assert engine.negative_skips == 1
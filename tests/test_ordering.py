@@ -0,0 +1,92 @@
+"""Порядок оновлень (middlewares/ordering.py): один чат — по черзі, різні чати — паралельно, разом з ізоляцією FSM."""
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.memory import DisabledEventIsolation, MemoryStorage, SimpleEventIsolation
+from aiogram.types import Message, Update
+
+from middlewares.ordering import ChatOrderingMiddleware
+
+pytestmark = pytest.mark.anyio
+
+
+class Steps(StatesGroup):
+    picked = State()
+
+
+def _dispatcher(isolation, timeline: list) -> tuple[Dispatcher, ChatOrderingMiddleware]:
+    router = Router()
+
+    @router.message(StateFilter(Steps.picked))
+    async def second_step(message: Message, state: FSMContext):
+        timeline.append(("second_step", message.chat.id, message.text))
+        await state.clear()
+
+    @router.message()
+    async def first_step(message: Message, state: FSMContext):
+        timeline.append(("start", message.chat.id, message.text))
+        # «повільне» оновлення поступається циклом подій — наступне могло б його обігнати
+        await asyncio.sleep(0.05 if message.text == "slow" else 0)
+        timeline.append(("end", message.chat.id, message.text))
+        await state.set_state(Steps.picked)
+
+    dp = Dispatcher(storage=MemoryStorage(), events_isolation=isolation)
+    ordering = ChatOrderingMiddleware(max_concurrency=4)
+    dp.update.outer_middleware(ordering)
+    dp.include_router(router)
+    return dp, ordering
+
+
+@pytest.fixture
+async def bot():
+    bot = Bot("123456:TEST")
+    yield bot
+    await bot.session.close()
+
+
+def _update(bot: Bot, update_id: int, chat_id: int, text: str) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Тест"}, "text": text,
+        },
+    }, context={"bot": bot})
+
+
+async def _feed(dp: Dispatcher, bot: Bot, *updates: tuple[int, str]) -> None:
+    await asyncio.gather(*(
+        dp.feed_update(bot, _update(bot, n, chat_id, text)) for n, (chat_id, text) in enumerate(updates, 1)
+    ))
+
+
+async def test_same_chat_runs_in_arrival_order(bot):
+    timeline = []
+    dp, ordering = _dispatcher(SimpleEventIsolation(), timeline)
+    await _feed(dp, bot, (1, "slow"), (1, "fast"))
+    # друге оновлення не обганяє перше і бачить стан, який перше записало
+    assert timeline == [("start", 1, "slow"), ("end", 1, "slow"), ("second_step", 1, "fast")]
+    assert ordering.processed == 2 and ordering.snapshot()["in_flight"] == 0
+
+
+async def test_different_chats_run_concurrently(bot):
+    timeline = []
+    dp, ordering = _dispatcher(SimpleEventIsolation(), timeline)
+    await _feed(dp, bot, (1, "slow"), (2, "fast"), (2, "next"))
+    # чат 2 повністю обробився, поки чат 1 ще чекав на повільний обробник
+    assert timeline.index(("second_step", 2, "next")) < timeline.index(("end", 1, "slow"))
+    assert timeline.index(("end", 2, "fast")) < timeline.index(("second_step", 2, "next"))
+    assert ordering.max_wait_seconds < 0.05
+
+
+async def test_without_fsm_isolation_second_update_reads_stale_state(bot):
+    # стан читається до черги чату: без SimpleEventIsolation порядок зберігається,
+    # але друге оновлення маршрутизується за станом, прочитаним до завершення першого
+    timeline = []
+    dp, _ordering = _dispatcher(DisabledEventIsolation(), timeline)
+    await _feed(dp, bot, (1, "slow"), (1, "fast"))
+    assert [step for step, _chat, _text in timeline] == ["start", "end", "start", "end"]
@@ -0,0 +1,27 @@
+"""Запити repositories.py не читають таблиці повним скануванням (див. utils/queryplan.py)."""
+import asyncio
+
+from sqlalchemy import text
+
+import utils.queryplan as queryplan
+from utils.queryplan import collect_full_scans
+
+
+def test_no_full_table_scans():
+    bad = asyncio.run(collect_full_scans())
+    assert not bad, "\n".join(f"{name}: {statement}\n  {plan}" for name, statement, plan in bad)
+
+
+def test_executemany_and_cte_statements_are_checked(monkeypatch):
+    async def executemany_scan(s):
+        params = [{"role": "student", "offset": n} for n in (1, 5)]
+        await s.execute(text("UPDATE users SET role = :role WHERE notify_offset_min = :offset"), params)
+
+    async def cte_scan(s):
+        await s.execute(text("WITH u AS (SELECT user_id FROM users WHERE notify_offset_min = 5) SELECT * FROM u"))
+
+    monkeypatch.setattr(queryplan, "_calls", lambda: [("executemany", executemany_scan), ("cte", cte_scan)])
+    bad = asyncio.run(collect_full_scans())
+    assert [(name, statement.split()[0]) for name, statement, _plan in bad] == [
+        ("executemany", "UPDATE"), ("cte", "WITH"),
+    ]
@@ -0,0 +1,91 @@
+"""Бюджети SQL-інструкцій (querystats.py) у суворому режимі: гарячий шлях вкладається, перевищення падає."""
+from datetime import time
+
+import pytest
+
+import querystats
+import repositories as r
+from models import NotificationLog, TimetableEvent, User
+from utils.time import now_kiev, today_kiev
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def strict_stats(monkeypatch):
+    monkeypatch.setenv("QUERY_BUDGET_STRICT", "1")
+    monkeypatch.setenv("QUERY_BUDGET_DEFAULT", "20")
+    monkeypatch.setenv("QUERY_BUDGETS", "tiny=1")
+    monkeypatch.setattr(querystats, "_stats", None)
+    querystats.install_query_hooks()
+    stats = querystats.get_query_stats()
+    assert stats.strict
+    return stats
+
+
+async def _seed_day(write_queue, lessons: int = 6) -> User:
+    from writer import write
+
+    events = [
+        TimetableEvent(
+            date=today_kiev().date(), lesson_number=n, time_start=time(8 + n), time_end=time(9 + n),
+            subject_full=f"Предмет {n}", teacher_full="Іванов Іван Іванович", groups_text="Г",
+        )
+        for n in range(1, lessons + 1)
+    ]
+    await write(lambda s: r.upsert_groups(s, 1, 1, [(1, "Г")]))
+    await write(lambda s: r.sync_events_for_group(s, 1, events))
+    return User(user_id=1, role="student", group_id=1, notify_offset_min=5)
+
+
+async def test_today_render_stays_within_budget(database, write_queue, strict_stats):
+    from handlers.commands import _render_day
+
+    u = await _seed_day(write_queue)
+    async with database.get_read_sessionmaker()() as s:
+        with querystats.track("today") as scope:
+            text, _entities = await _render_day(s, u, 0)
+    assert "Предмет 6" in text
+    assert 0 < scope.statements <= strict_stats.budget("today")
+    assert strict_stats.by_name["today"][4] == 0
+
+
+async def test_over_budget_scope_raises(database, strict_stats):
+    u = User(user_id=1, role="student", group_id=1, notify_offset_min=5)
+    async with database.get_read_sessionmaker()() as s:
+        with pytest.raises(querystats.QueryBudgetExceeded):
+            with querystats.track("tiny"):
+                await r.events_for_user_day(s, u, today_kiev().date())
+                await r.events_for_user_day(s, u, today_kiev().date())
+    assert strict_stats.by_name["tiny"][4] == 1
+
+
+async def test_failing_block_only_warns(database, strict_stats):
+    u = User(user_id=1, role="student", group_id=1, notify_offset_min=5)
+    async with database.get_read_sessionmaker()() as s:
+        with pytest.raises(KeyError):
+            with querystats.track("tiny"):
+                await r.events_for_user_day(s, u, today_kiev().date())
+                await r.events_for_user_day(s, u, today_kiev().date())
+                raise KeyError("помилка обробника важливіша")
+    assert strict_stats.by_name["tiny"][4] == 1
+
+
+async def test_queued_writes_count_to_submitting_scope(database, write_queue, strict_stats):
+    from writer import write
+
+    with querystats.track("onboarding") as scope:
+        await write(lambda s: r.upsert_groups(s, 1, 1, [(1, "Г")]))
+    assert scope.statements > 0
+
+
+async def test_reminder_log_writes_are_attributed(database, write_queue, strict_stats):
+    from scheduler import BotScheduler
+
+    await _seed_day(write_queue, lessons=1)
+    row = NotificationLog(
+        user_id=1, group_id=1, event_id=1, scheduled_for=now_kiev().replace(tzinfo=None), status="sent",
+    )
+    await BotScheduler._log_notification(row)
+    calls, statements = strict_stats.by_name["scan_upcoming_log"][:2]
+    assert calls == 1 and statements > 0
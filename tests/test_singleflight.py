@@ -0,0 +1,98 @@
+"""Single-flight оновлень: одночасні запити до джерела зливаються, force не приєднується до звичайного."""
+import asyncio
+
+import pytest
+
+import refresh
+import repositories as r
+from config import Config
+from utils.singleflight import SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+EMPTY_TIMETABLE = "<table id='timeTable'></table>"
+
+
+class CountingSource:
+    """Замість SourceClient: рахує запити і відповідає порожнім розкладом з затримкою."""
+    calls = 0
+
+    def __init__(self, cfg):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def post_filter(self, **kwargs):
+        type(self).calls += 1
+        await asyncio.sleep(0.05)
+        return EMPTY_TIMETABLE
+
+
+@pytest.fixture
+async def engine(write_queue, monkeypatch):
+    from writer import write
+
+    CountingSource.calls = 0
+    monkeypatch.setattr(refresh, "SourceClient", CountingSource)
+    await write(lambda s: r.upsert_groups(s, 1, 1, [(777, "Г")]))
+    return refresh.RefreshEngine(Config.load())
+
+
+async def test_singleflight_runs_once_and_shares_result():
+    sf = SingleFlight()
+    runs = 0
+
+    async def work():
+        nonlocal runs
+        runs += 1
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    assert await asyncio.gather(*(sf.do("k", work) for _ in range(10))) == ["ok"] * 10
+    assert (runs, sf.started, sf.joined) == (1, 1, 9)
+    assert not sf.in_flight("k")
+    await sf.do("k", work)
+    assert runs == 2
+
+
+async def test_singleflight_shares_errors_and_survives_waiter_cancel():
+    sf = SingleFlight()
+
+    async def boom():
+        await asyncio.sleep(0.02)
+        raise RuntimeError("source down")
+
+    first = asyncio.create_task(sf.do("k", boom))
+    second = asyncio.create_task(sf.do("k", boom))
+    await asyncio.sleep(0)
+    first.cancel()
+    with pytest.raises(RuntimeError):
+        await second
+    assert sf.started == 1
+
+
+async def test_concurrent_refreshes_fetch_once(engine):
+    results = await asyncio.gather(*(engine.refresh_group(777) for _ in range(8)))
+    assert CountingSource.calls == 1
+    assert results == [(0, 0, 0)] * 8
+    assert engine.flights.joined == 7
+
+
+async def test_forced_refresh_does_not_join_skipped_flight(engine, monkeypatch):
+    async def slow_hold_off(kind, entity_id):
+        # звичайне оновлення пропускається (backoff / негативний кеш), але не миттєво
+        await asyncio.sleep(0.05)
+        return True
+
+    monkeypatch.setattr(engine, "holding_off", slow_hold_off)
+    regular = asyncio.create_task(engine.refresh_group(777))
+    await asyncio.sleep(0.01)
+    forced = await engine.refresh_group(777, force=True)
+    assert await regular is None
+    assert forced == (0, 0, 0)
+    assert CountingSource.calls == 1
+    assert engine.flights.joined == 0
@@ -0,0 +1,103 @@
+"""Реєстр підписок (subscriptions.py): лічильники посилань, слухачі і звірка з таблицею users."""
+import pytest
+
+import repositories as r
+from models import User
+from subscriptions import SubscriptionRegistry, subscriptions_of
+
+pytestmark = pytest.mark.anyio
+
+G1, G2, T1 = ("group", 1), ("group", 2), ("teacher", 1)
+
+
+@pytest.fixture
+def registry():
+    reg = SubscriptionRegistry()
+    reg.events = []
+    reg.add_listener(lambda kind, entity_id, n: reg.events.append((kind, entity_id, n)))
+    return reg
+
+
+def test_subscriptions_of():
+    assert subscriptions_of(None) == set()
+    assert subscriptions_of(User(user_id=1, role="student")) == set()
+    assert subscriptions_of(User(user_id=1, role="student", group_id=1)) == {G1}
+    assert subscriptions_of(User(user_id=1, role="teacher", teacher_id=1)) == {T1}
+
+
+def test_updates_before_first_load_are_ignored(registry):
+    registry.update(set(), {G1})
+    assert registry.subscribers(*G1) == 0 and registry.events == []
+    assert registry.load({1: 1}, {}) == 0  # знімок з БД уже враховує цю зміну
+    assert registry.subscribers(*G1) == 1
+
+
+def test_subscribe_unsubscribe_refcount(registry):
+    registry.load({}, {})
+    registry.update(set(), {G1})
+    registry.update(set(), {G1})
+    registry.update(set(), {T1})
+    assert registry.counts("group") == {1: 2} and registry.counts("teacher") == {1: 1}
+
+    registry.update({G1}, {G2})  # перехід в іншу групу
+    assert (registry.subscribers(*G1), registry.subscribers(*G2)) == (1, 1)
+    registry.update({G1}, set())
+    registry.update({G2}, {G2})  # той самий вибір — без змін і без сповіщень
+    assert registry.counts("group") == {2: 1}
+    assert registry.events == [
+        ("group", 1, 1), ("group", 1, 2), ("teacher", 1, 1),
+        ("group", 1, 1), ("group", 2, 1), ("group", 1, 0),
+    ]
+
+
+def test_failing_listener_does_not_block_others():
+    def broken(*args):
+        raise RuntimeError("listener bug")
+
+    seen = []
+    reg = SubscriptionRegistry()
+    reg.add_listener(broken)
+    reg.add_listener(lambda *args: seen.append(args))
+    reg.load({}, {})
+    reg.update(set(), {G1})
+    assert seen == [("group", 1, 1)] and reg.subscribers(*G1) == 1
+
+
+def test_load_reports_and_notifies_drift(registry):
+    registry.load({1: 2}, {1: 1})
+    registry.events.clear()
+    assert registry.load({1: 2, 2: 1}, {}) == 2
+    assert sorted(registry.events) == [("group", 2, 1), ("teacher", 1, 0)]
+    assert registry.load({1: 2, 2: 1, 3: 0}, {}) == 0
+
+
+async def test_registry_matches_db_after_onboarding_writes(write_queue, database, registry):
+    from writer import write
+
+    await write(lambda s: r.upsert_groups(s, 1, 1, [(1, "Г1"), (2, "Г2")]))
+    registry.load({}, {})
+
+    async def save(user_id: int, **fields):
+        async def op(s):
+            u = await s.get(User, user_id)
+            before = subscriptions_of(u)
+            if u is None:
+                u = User(user_id=user_id, role="student")
+                s.add(u)
+            for name, value in fields.items():
+                setattr(u, name, value)
+            return before, subscriptions_of(u)
+
+        registry.update(*await write(op))
+
+    await save(10, group_id=1)
+    await save(11, group_id=1)
+    await save(12, role="teacher", teacher_id=5)
+    await save(11, group_id=2)
+    await save(12, teacher_id=None)
+
+    async with database.get_read_sessionmaker()() as s:
+        groups, teachers = await r.subscriber_counts(s)
+    assert registry.counts("group") == groups == {1: 1, 2: 1}
+    assert registry.counts("teacher") == teachers == {}
+    assert registry.load(groups, teachers) == 0
@@ -0,0 +1,134 @@
+"""Захист від флуду (middlewares/throttling.py): token bucket, класи дій і бюджети з підробленим годинником."""
+from types import SimpleNamespace
+
+import pytest
+from aiogram.types import Update
+
+from config import Config
+from keyboards import BTN_SETTINGS, BTN_TODAY
+from middlewares import throttling
+from middlewares.throttling import NAV, OTHER, SCHEDULE, SOURCE, TokenBucket, classify
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def test_bucket_allows_burst_then_refills():
+    rate, capacity = 1.0, 3.0  # токен на секунду, запас — три
+    bucket = TokenBucket(capacity, now=0.0)
+    assert [bucket.take(rate, capacity, 0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take(rate, capacity, 0.0) == pytest.approx(1.0)
+    assert bucket.take(rate, capacity, 0.5) == pytest.approx(0.5)
+    assert bucket.take(rate, capacity, 1.0) == 0.0
+    # довга пауза наповнює bucket лише до місткості
+    assert bucket.full_at(rate, capacity) == pytest.approx(4.0)
+    assert [bucket.take(rate, capacity, 100.0) for _ in range(4)][-1] == pytest.approx(1.0)
+
+
+def _message(text: str, user_id: int = 1) -> Update:
+    return Update.model_validate({
+        "update_id": 1,
+        "message": {
+            "message_id": 1, "date": 0, "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Тест"}, "text": text,
+        },
+    })
+
+
+def _callback(data: str, user_id: int = 1) -> Update:
+    return Update.model_validate({
+        "update_id": 1,
+        "callback_query": {
+            "id": "1", "chat_instance": "1", "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": "Тест"},
+        },
+    })
+
+
+@pytest.mark.parametrize("update, expected", [
+    (_message("/start"), ("/start", SOURCE)),
+    (_message("/start@schedule_bot payload"), ("/start", SOURCE)),
+    (_message(BTN_SETTINGS), ("/start", SOURCE)),
+    (_message("/Today"), ("/today", SCHEDULE)),
+    (_message(BTN_TODAY), ("/today", SCHEDULE)),
+    (_message("/addzoom"), ("/addzoom", OTHER)),
+    (_message("привіт"), ("text", OTHER)),
+    (_callback("grp:12"), ("cb:grp", SOURCE)),
+    (_callback("tch:7"), ("cb:tch", SOURCE)),
+    (_callback("grp:__next__"), ("cb:grp", NAV)),
+    (_callback("fac:3"), ("cb:fac", NAV)),
+    (_callback(""), ("cb:?", NAV)),
+])
+def test_classify(update, expected):
+    assert classify(update.message or update.callback_query) == expected
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(throttling, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+@pytest.fixture
+def middleware(clock, monkeypatch):
+    monkeypatch.setenv("THROTTLE_SOURCE_PER_MINUTE", "6")  # 0.1 токена/с, запас 2
+    monkeypatch.setenv("THROTTLE_SCHEDULE_PER_MINUTE", "0")  # без обмеження
+    monkeypatch.setenv("THROTTLE_GLOBAL_SOURCE_PER_MINUTE", "3")  # 0.05 токена/с, запас 1 — на всіх
+    monkeypatch.setenv("ADMIN_IDS", "42")
+    # створюється вже з підробленим годинником: початкові buckets — від його часу
+    mw = throttling.ThrottlingMiddleware(Config.load())
+    mw.replies = []
+
+    async def reply(target, user_id, wait):
+        mw.replies.append((user_id, wait))
+
+    monkeypatch.setattr(mw, "_reply", reply)
+    return mw
+
+
+async def _send(mw, update: Update, user_id: int = 1) -> bool:
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event)
+
+    await mw(handler, update, {"event_from_user": SimpleNamespace(id=user_id)})
+    return bool(handled)
+
+
+async def test_personal_and_global_source_budgets(middleware, clock):
+    mw = middleware
+    assert await _send(mw, _message("/start"))
+    # у другого користувача особистий запас є, але спільний бюджет джерела (запас 1) вичерпано
+    assert not await _send(mw, _message("/start", 2), user_id=2)
+    assert not await _send(mw, _message("/start"))
+    # особистий запас (2) теж вичерпано: наступний токен — через 10 с
+    assert not await _send(mw, _message("/start"))
+    assert mw.replies == [(2, pytest.approx(20.0)), (1, pytest.approx(20.0)), (1, pytest.approx(10.0))]
+    clock.now += 20
+    assert await _send(mw, _message("/start"))
+    assert mw.throttled["/start"] == 3 and mw.allowed == 2
+
+
+async def test_unlimited_class_and_admins_pass(middleware, clock):
+    mw = middleware
+    assert all([await _send(mw, _message("/today")) for _ in range(50)])
+    assert all([await _send(mw, _message("/start", 42), user_id=42) for _ in range(10)])
+    assert not mw.throttled
+
+
+async def test_nav_callbacks_have_own_budget(middleware, clock):
+    mw = middleware
+    # NAV — 60 за хвилину, запас 20: гортання не з'їдає бюджет source
+    assert all([await _send(mw, _callback("grp:__next__")) for _ in range(20)])
+    assert not await _send(mw, _callback("grp:__next__"))
+    assert await _send(mw, _callback("grp:12"))
+    assert mw.throttled == {"cb:grp": 1}
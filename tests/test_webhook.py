@@ -0,0 +1,98 @@
+"""Приймач webhook (webhook.py): секрет, 200 до обробки і 503 при переповненні."""
+import asyncio
+
+import pytest
+from aiogram import Bot
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from webhook import SECRET_HEADER, WebhookIngest
+
+pytestmark = pytest.mark.anyio
+
+SECRET = "s3cret"
+
+
+class BlockingDispatcher:
+    """Замість Dispatcher: запам'ятовує оновлення і тримає їх, доки тест не відпустить."""
+
+    def __init__(self):
+        self.fed: list[int] = []
+        self.release = asyncio.Event()
+
+    async def feed_update(self, bot, update):
+        self.fed.append(update.update_id)
+        await self.release.wait()
+
+
+def _update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Тест"}, "text": "/today",
+        },
+    }
+
+
+@pytest.fixture
+async def webhook():
+    dp = BlockingDispatcher()
+    bot = Bot("123456:TEST")
+    ingest = WebhookIngest(dp, bot, SECRET, max_pending=2)
+    app = web.Application()
+    app.router.add_post("/hook", ingest.handle)
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    yield ingest, dp, client
+    dp.release.set()
+    await ingest.drain(1)
+    await client.close()
+    await bot.session.close()
+
+
+async def _post(client, update_id: int, headers=None):
+    resp = await client.post("/hook", json=_update(update_id), headers=headers or {})
+    return resp.status
+
+
+@pytest.mark.parametrize("headers", [
+    {},
+    {SECRET_HEADER: "wrong"},
+    {SECRET_HEADER: SECRET + "x"},
+    {SECRET_HEADER: "сікрет"},  # не-ASCII — теж 401, а не 500
+])
+async def test_wrong_or_missing_secret_is_401(webhook, headers):
+    ingest, dp, client = webhook
+    assert await _post(client, 1, headers) == 401
+    assert ingest.rejected == 1 and ingest.received == 0
+    assert dp.fed == []
+
+
+async def test_correct_secret_answers_before_handling(webhook):
+    ingest, dp, client = webhook
+    assert await _post(client, 1, {SECRET_HEADER: SECRET}) == 200
+    await asyncio.sleep(0)
+    # обробник ще не завершився, а Telegram уже отримав 200
+    assert dp.fed == [1] and ingest.pending == 1
+    dp.release.set()
+    await ingest.drain(1)
+    assert ingest.pending == 0 and ingest.received == 1 and ingest.failed == 0
+
+
+async def test_full_queue_is_503_until_drained(webhook):
+    ingest, dp, client = webhook
+    ok = {SECRET_HEADER: SECRET}
+    assert [await _post(client, i, ok) for i in (1, 2, 3)] == [200, 200, 503]
+    assert ingest.pending == ingest.max_pending == 2
+    assert ingest.overloaded == 1
+    dp.release.set()
+    await ingest.drain(1)
+    assert await _post(client, 4, ok) == 200
+
+
+async def test_invalid_body_is_400(webhook):
+    ingest, _dp, client = webhook
+    resp = await client.post("/hook", data=b"{", headers={SECRET_HEADER: SECRET})
+    assert resp.status == 400
+    assert ingest.pending == 0
@@ -0,0 +1,91 @@
+"""Черга письменника: пачки, ізоляція операцій (SAVEPOINT), результати й прямий запис без черги."""
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+import writer
+from models import Faculty
+
+pytestmark = pytest.mark.anyio
+
+
+def _add(fid: int):
+    async def op(s):
+        s.add(Faculty(id=fid, title=f"Ф{fid}"))
+        await s.flush()
+        return fid
+    return op
+
+
+async def _fail(s):
+    s.add(Faculty(id=999, title="не має потрапити в БД"))
+    await s.flush()
+    raise ValueError("boom")
+
+
+async def _count(database) -> int:
+    async with database.get_read_sessionmaker()() as s:
+        return await s.scalar(select(func.count()).select_from(Faculty))
+
+
+async def test_ops_within_window_share_one_transaction(database):
+    q = writer.WriteQueue(database.get_sessionmaker(), max_batch=64, window_ms=50)
+    q.start()
+    try:
+        results = await asyncio.gather(*(q.submit(_add(i)) for i in range(10)))
+    finally:
+        await q.stop()
+    assert results == list(range(10))
+    assert (q.batches, q.ops) == (1, 10)
+    assert await _count(database) == 10
+
+
+async def test_max_batch_splits_transactions(database):
+    q = writer.WriteQueue(database.get_sessionmaker(), max_batch=4, window_ms=50)
+    q.start()
+    try:
+        await asyncio.gather(*(q.submit(_add(i)) for i in range(10)))
+    finally:
+        await q.stop()
+    assert q.batches == 3
+    assert q.ops == 10
+
+
+async def test_failing_op_does_not_roll_back_batch_mates(database):
+    q = writer.WriteQueue(database.get_sessionmaker(), max_batch=64, window_ms=50)
+    q.start()
+    try:
+        futs = [q.submit(_add(1)), q.submit(_fail), q.submit(_add(2))]
+        results = await asyncio.gather(*futs, return_exceptions=True)
+    finally:
+        await q.stop()
+    assert results[0] == 1 and results[2] == 2
+    assert isinstance(results[1], ValueError)
+    assert q.batches == 1
+    async with database.get_read_sessionmaker()() as s:
+        assert set(await s.scalars(select(Faculty.id))) == {1, 2}
+
+
+async def test_stop_waits_for_queued_ops(database):
+    q = writer.WriteQueue(database.get_sessionmaker(), max_batch=2, window_ms=0)
+    q.start()
+    futs = [q.submit(_add(i)) for i in range(5)]
+    await q.stop()
+    assert all(f.done() and f.result() == i for i, f in enumerate(futs))
+    assert not q.running
+
+
+async def test_submit_without_writer_writes_directly(database):
+    assert writer.get_writer() is None
+    assert await writer.write(_add(7)) == 7
+    with pytest.raises(ValueError):
+        await writer.write(_fail)
+    async with database.get_read_sessionmaker()() as s:
+        assert set(await s.scalars(select(Faculty.id))) == {7}
+
+
+async def test_module_write_goes_through_running_writer(write_queue):
+    assert write_queue.running
+    assert await asyncio.gather(*(writer.write(_add(i)) for i in range(3))) == [0, 1, 2]
+    assert write_queue.ops == 3
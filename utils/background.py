@@ -0,0 +1,98 @@
+"""
+Фонові задачі обробників: відповісти користувачу одразу, а довгу роботу (запит до джерела,
+імпорт розкладу) виконати окремою задачею і дописати результат редагуванням повідомлення.
+
+Задачі з однаковим key не дублюються: поки перша працює, повторний spawn повертає її ж
+(користувач натиснув кнопку двічі). Помилки логуються і рахуються — обробник про них не дізнається,
+тому повідомити користувача має сама задача. Під час зупинки drain() дочікує незавершені задачі.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+from querystats import attach
+
+log = logging.getLogger(__name__)
+
+
+class BackgroundJobs:
+    def __init__(self):
+        self._tasks: set[asyncio.Task] = set()
+        self._keyed: dict[Hashable, asyncio.Task] = {}
+        # Лічильники для діагностики
+        self.started = 0
+        self.deduplicated = 0
+        self.failed = 0
+        self.finished = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    @property
+    def running(self) -> int:
+        return len(self._tasks)
+
+    def spawn(self, name: str, fn: Callable[[], Awaitable[Any]], key: Hashable | None = None) -> asyncio.Task:
+        """Запускає fn() у фоні; з key — лише якщо така задача ще не працює."""
+        if key is not None:
+            task = self._keyed.get(key)
+            if task is not None and not task.done():
+                self.deduplicated += 1
+                return task
+        task = asyncio.get_running_loop().create_task(self._run(name, fn), name=f"bg-{name}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if key is not None:
+            self._keyed[key] = task
+            task.add_done_callback(lambda t: self._keyed.pop(key, None) if self._keyed.get(key) is t else None)
+        self.started += 1
+        return task
+
+    async def _run(self, name: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.monotonic()
+        try:
+            # SQL фонової задачі не зараховується обробнику, що її запустив (querystats.py)
+            with attach(None):
+                return await fn()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.failed += 1
+            log.warning("background job %s failed", name, exc_info=True)
+        finally:
+            elapsed = time.monotonic() - started
+            self.finished += 1
+            self.seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+
+    async def drain(self, timeout: float) -> None:
+        """Дочікує фонові задачі; ті, що не встигли за timeout, скасовуються."""
+        if not self._tasks:
+            return
+        _done, left = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in left:
+            task.cancel()
+        if left:
+            log.warning("background drain: %d jobs cancelled after %.0fs", len(left), timeout)
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self.running,
+            "started": self.started,
+            "deduplicated": self.deduplicated,
+            "failed": self.failed,
+            "avg_ms": round(self.seconds / self.finished * 1000) if self.finished else 0,
+            "max_ms": round(self.max_seconds * 1000),
+        }
+
+
+_jobs: BackgroundJobs | None = None
+
+
+def get_background_jobs() -> BackgroundJobs:
+    global _jobs
+    if _jobs is None:
+        _jobs = BackgroundJobs()
+    return _jobs
@@ -0,0 +1,177 @@
+"""
+Тестовий сервер Bot API для локальної перевірки бота без Telegram.
+
+    python -m utils.fakebotapi --port 8081 --users 50
+
+У .env бота: TELEGRAM_API_URL=http://127.0.0.1:8081 (BOT_TOKEN — будь-який, напр. 1:fake).
+Сервер відповідає на методи Bot API, якими користується бот (повідомлення — вигадані),
+і від імені --users користувачів надсилає команди --commands:
+  • після setWebhook — POST на зареєстровану адресу із секретом (режим webhook);
+  • інакше — віддає їх у getUpdates (режим polling).
+Раз на --report секунд друкує: скільки оновлень доставлено, затримку підтвердження webhook
+(p50/p95/max), скільки відповідей надіслав бот і виклики за методами.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import time
+from collections import Counter
+
+import aiohttp
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+MESSAGE_METHODS = {"sendMessage", "editMessageText", "editMessageReplyMarkup", "sendPhoto", "sendDocument"}
+
+
+def _percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class FakeBotAPI:
+    def __init__(self, users: int, commands: list[str]):
+        self.users = users
+        self.commands = commands
+        self.calls: Counter[str] = Counter()
+        self.webhook_url: str | None = None
+        self.webhook_secret = ""
+        self.queue: asyncio.Queue[dict] = asyncio.Queue()
+        self.delivered = 0
+        self.ack_seconds: list[float] = []
+        self.ack_errors: Counter[int] = Counter()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._started = asyncio.Event()
+
+    # ---------- Bot API ----------
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = dict(request.query)
+        if request.can_read_body:
+            if request.content_type == "application/json":
+                params.update(await request.json())
+            else:
+                params.update(await request.post())
+
+        if method == "getMe":
+            return self._ok(BOT_USER)
+        if method == "setWebhook":
+            self.webhook_url = params.get("url")
+            self.webhook_secret = params.get("secret_token", "")
+            self._started.set()
+            return self._ok(True)
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            return self._ok(True)
+        if method == "getUpdates":
+            self._started.set()
+            return self._ok(await self._poll(float(params.get("timeout") or 0)))
+        if method in MESSAGE_METHODS:
+            return self._ok(self._message(int(params.get("chat_id") or 0), params.get("text", "")))
+        return self._ok(True)
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    def _message(self, chat_id: int, text: str) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": text,
+        }
+
+    async def _poll(self, timeout: float) -> list[dict]:
+        updates: list[dict] = []
+        try:
+            updates.append(await asyncio.wait_for(self.queue.get(), timeout=max(0.1, timeout)))
+        except asyncio.TimeoutError:
+            return updates
+        while not self.queue.empty() and len(updates) < 100:
+            updates.append(self.queue.get_nowait())
+        self.delivered += len(updates)
+        return updates
+
+    # ---------- Користувачі ----------
+    def _update(self, user_id: int, text: str) -> dict:
+        user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+        message = self._message(user_id, text)
+        message["from"] = user
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": next(self._update_ids), "message": message}
+
+    async def run_users(self) -> None:
+        await self._started.wait()
+        await asyncio.sleep(0.5)
+        updates = [self._update(1000 + u, cmd) for cmd in self.commands for u in range(self.users)]
+        if not self.webhook_url:
+            for update in updates:
+                self.queue.put_nowait(update)
+            return
+        async with aiohttp.ClientSession() as http:
+            await asyncio.gather(*(self._push(http, u) for u in updates))
+
+    async def _push(self, http: aiohttp.ClientSession, update: dict) -> None:
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret}
+        started = time.monotonic()
+        async with http.post(self.webhook_url, json=update, headers=headers) as resp:
+            self.ack_seconds.append(time.monotonic() - started)
+            if resp.status == 200:
+                self.delivered += 1
+            else:
+                self.ack_errors[resp.status] += 1
+
+    def report(self) -> str:
+        sent = sum(self.calls[m] for m in MESSAGE_METHODS)
+        acks = self.ack_seconds
+        line = f"доставлено {self.delivered}, відповідей бота {sent}"
+        if acks:
+            line += (
+                f", підтвердження webhook p50 {_percentile(acks, 0.5) * 1000:.0f} мс, "
+                f"p95 {_percentile(acks, 0.95) * 1000:.0f} мс, max {max(acks) * 1000:.0f} мс"
+            )
+        if self.ack_errors:
+            line += f", відмови {dict(self.ack_errors)}"
+        return line + f"\nметоди: {dict(self.calls.most_common())}"
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--commands", default="/start,/today,/week", help="через кому")
+    ap.add_argument("--report", type=float, default=5.0)
+    args = ap.parse_args()
+
+    api = FakeBotAPI(args.users, [c.strip() for c in args.commands.split(",") if c.strip()])
+    app = web.Application()
+    app.router.add_route("*", "/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port).start()
+    print(f"fake Bot API: http://{args.host}:{args.port}")
+
+    asyncio.create_task(api.run_users())
+    try:
+        while True:
+            await asyncio.sleep(args.report)
+            print(api.report(), flush=True)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,165 @@
+"""
+Метрики у текстовому форматі Prometheus — без зовнішніх залежностей.
+
+Counter / Gauge / Histogram з мітками реєструються в REGISTRY під час створення; нижче
+оголошено всі метрики гарячих шляхів, а значення пишуть самі модулі (observe/inc/set).
+Уже наявні лічильники діагностики (/status) не дублюються: monitoring.py додає колектори,
+що читають їх під час запиту /metrics.
+"""
+from __future__ import annotations
+
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator
+
+# (мітки, значення) одного ряду
+Sample = tuple[dict[str, str], float]
+# колектор: [(ім'я, тип, опис, ряди)]
+Collector = Callable[[], Iterable[tuple[str, str, str, list[Sample]]]]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs: Iterable[tuple[str, str]]) -> str:
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}" if body else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Collector] = []
+
+    def register(self, metric: "_Metric") -> None:
+        self._metrics.append(metric)
+
+    def add_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        out: list[str] = []
+        for metric in self._metrics:
+            metric.render(out)
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                out.append(f"# HELP {name} {help_text}")
+                out.append(f"# TYPE {name} {kind}")
+                out += [f"{name}{_labels(labels.items())} {_number(value)}" for labels, value in samples]
+        return "\n".join(out) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, object] = {}
+        registry.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self, out: list[str]) -> None:
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} {self.kind}")
+        for key, value in sorted(self._values.items()):
+            self._render_series(out, list(zip(self.labelnames, key)), value)
+
+    def _render_series(self, out: list[str], pairs: list, value) -> None:
+        out.append(f"{self.name}{_labels(pairs)} {_number(value)}")
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS, registry: Registry = REGISTRY):
+        super().__init__(name, help_text, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            # [лічильники по кошиках (не кумулятивні) + переповнення, сума]
+            series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_series(self, out: list[str], pairs: list, value) -> None:
+        counts, total = value
+        cumulative = 0
+        for bound, n in zip((*self.buckets, float("inf")), counts):
+            cumulative += n
+            out.append(f"{self.name}_bucket{_labels([*pairs, ('le', _number(bound))])} {cumulative}")
+        out.append(f"{self.name}_sum{_labels(pairs)} {_number(total)}")
+        out.append(f"{self.name}_count{_labels(pairs)} {cumulative}")
+
+
+# ---------- Метрики гарячих шляхів ----------
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Тривалість обробника оновлення Telegram", ["handler"])
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Обробники, що завершилися винятком", ["handler"])
+
+REMINDER_SCAN_SECONDS = Histogram("bot_reminder_scan_seconds", "Тривалість скану нагадувань (scan_upcoming)")
+REMINDERS_DUE = Gauge("bot_reminder_scan_due", "Нагадувань до надсилання в останньому скані")
+REMINDERS_SENT = Counter("bot_reminders_total", "Надіслані нагадування за результатом", ["status"])
+REMINDER_LATENESS_SECONDS = Histogram(
+    "bot_reminder_lateness_seconds", "Запізнення надсилання відносно запланованого часу нагадування",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600),
+)
+
+REFRESH_SECONDS = Histogram(
+    "bot_refresh_seconds", "Оновлення розкладу однієї групи/викладача", ["kind", "result"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+SYNC_ROWS = Histogram(
+    "bot_sync_rows", "Змінених занять (додано + прибрано + змінено) за одну синхронізацію", ["kind"],
+    buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+SOURCE_REQUESTS = Counter("bot_source_requests_total", "HTTP-запити до джерела", ["endpoint", "status"])
+SOURCE_BYTES = Counter("bot_source_response_bytes_total", "Байтів відповідей джерела", ["endpoint"])
+SOURCE_SECONDS = Histogram("bot_source_request_seconds", "Затримка відповіді джерела", ["endpoint"])
+PARSE_SECONDS = Histogram(
+    "bot_parse_seconds", "Розбір сторінки джерела", ["page"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
@@ -0,0 +1,241 @@
+"""
+Профілювання на вимогу: семплер стеків і знімки tracemalloc для «повільної» години пік.
+
+Семплер — окремий потік, що кожні PROFILE_INTERVAL_MS знімає стеки через sys._current_frames()
+і складає їх у форматі collapsed stacks (`кадр;кадр;кадр кількість`) — його читають
+flamegraph.pl, speedscope, inferno. Потік працює лише, поки щось профілюється, тож у звичайному
+режимі накладних витрат немає.
+
+Два способи:
+  • /profile [секунд] [mem] (адміністратор) — увесь процес протягом заданого часу (до
+    PROFILE_MAX_SECONDS), усі потоки; з mem — ще й топ виділень пам'яті (tracemalloc);
+  • PROFILE_TARGETS — імена завдань планувальника (scan_upcoming, refresh_one_group,
+    refresh_one_teacher, cleanup_old_records_job) та обробників (today, week, pick_group…), які
+    профілюються на кожному виконанні. Враховуються лише семпли, де ціль на стеку (інші корутини
+    того самого циклу подій відкидаються). Перекриті виконання однієї цілі — один файл.
+    З PROFILE_TRACEMALLOC=1 tracemalloc працює постійно (помітно сповільнює!), і до файлу цілі
+    додається різниця виділень до/після.
+
+Файли — у PROFILE_DIR, не більше PROFILE_MAX_FILES (найстаріші видаляються).
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from types import CodeType, FrameType
+from typing import Iterator
+
+from config import Config
+
+log = logging.getLogger(__name__)
+
+ALLOC_TOP = 30
+# кадрів стека, глибше — обрізається (рекурсія, глибокі ланцюжки await)
+MAX_DEPTH = 200
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name}@{os.path.basename(code.co_filename)}:{code.co_firstlineno}"
+
+
+def _stack(frame: FrameType | None, stop: CodeType | None = None) -> list[str] | None:
+    """Кадри від кореня до листа; зі stop — лише від кадру з цим кодом (None, якщо його немає на стеку)."""
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        if stop is not None and frame.f_code is stop:
+            return labels[::-1]
+        frame = frame.f_back
+    return None if stop is not None else labels[::-1]
+
+
+class _Capture:
+    """Семпли одного споживача: увесь процес або одна ціль."""
+
+    def __init__(self, name: str, code: CodeType | None = None, thread_id: int | None = None):
+        self.name = name
+        self.code = code
+        self.thread_id = thread_id
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+
+    def feed(self, frames: dict[int, FrameType], names: dict[int, str]) -> None:
+        if self.code is not None:
+            stack = _stack(frames.get(self.thread_id), self.code)
+            if stack:
+                self.samples += 1
+                self.stacks[";".join([self.name, *stack])] += 1
+            return
+        me = threading.get_ident()
+        for tid, frame in frames.items():
+            if tid == me:
+                continue
+            self.samples += 1
+            self.stacks[";".join([names.get(tid, f"thread-{tid}"), *_stack(frame)])] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+class Profiler:
+    def __init__(self, cfg: Config):
+        self.targets = frozenset(cfg.profile_targets)
+        self.dir = Path(cfg.profile_dir)
+        self.max_files = max(1, cfg.profile_max_files)
+        self.interval = max(1, cfg.profile_interval_ms) / 1000
+        self.max_seconds = max(1, cfg.profile_max_seconds)
+        self.keep_tracemalloc = cfg.profile_tracemalloc
+        self._lock = threading.Lock()
+        self._captures: list[_Capture] = []
+        self._thread: threading.Thread | None = None
+        # ціль -> [capture, кількість активних виконань, знімок tracemalloc на початку]
+        self._active: dict[str, list] = {}
+        # Лічильники для діагностики
+        self.files_written = 0
+        self.samples = 0
+        self.capturing = False
+
+    def start(self) -> None:
+        """На старті бота: PROFILE_TRACEMALLOC=1 — tracemalloc на весь час роботи."""
+        if self.keep_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def wants(self, name: str) -> bool:
+        return name in self.targets
+
+    # ---------- потік семплера ----------
+    def _attach(self, capture: _Capture) -> None:
+        with self._lock:
+            self._captures.append(capture)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+                self._thread.start()
+
+    def _detach(self, capture: _Capture) -> None:
+        with self._lock:
+            self._captures.remove(capture)
+        self.samples += capture.samples
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            # під блокуванням: споживач, якого щойно від'єднали, вже не отримає семпл під час запису файлу
+            with self._lock:
+                if not self._captures:
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for capture in self._captures:
+                    capture.feed(frames, names)
+
+    # ---------- цілі (завдання й обробники) ----------
+    @contextmanager
+    def target(self, name: str, code: CodeType) -> Iterator[None]:
+        """Профілює блок, у якому виконується функція з кодом code (цикл подій цього потоку)."""
+        entry = self._active.get(name)
+        if entry is None:
+            capture = _Capture(name, code, threading.get_ident())
+            before = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+            entry = self._active[name] = [capture, 0, before]
+            self._attach(capture)
+        entry[1] += 1
+        try:
+            yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._active[name]
+                self._finish_target(*entry)
+
+    def _finish_target(self, capture: _Capture, _running: int, before) -> None:
+        self._detach(capture)
+        if capture.samples:
+            self._write(capture.name, "collapsed", capture.collapsed())
+        if before is not None and tracemalloc.is_tracing():
+            diff = tracemalloc.take_snapshot().compare_to(before, "lineno")[:ALLOC_TOP]
+            self._write(capture.name, "alloc.txt", "".join(f"{d}\n" for d in diff))
+
+    # ---------- весь процес (/profile) ----------
+    async def capture(self, seconds: float, *, memory: bool = False) -> list[Path]:
+        """Семпли всіх потоків протягом seconds (не довше PROFILE_MAX_SECONDS); з memory — топ виділень."""
+        seconds = min(max(1.0, seconds), self.max_seconds)
+        started_tracing = memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        capture = _Capture("process")
+        self.capturing = True
+        self._attach(capture)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._detach(capture)
+            self.capturing = False
+        paths = [self._write("profile", "collapsed", capture.collapsed())]
+        if memory:
+            stats = tracemalloc.take_snapshot().statistics("lineno")[:ALLOC_TOP]
+            current, peak = tracemalloc.get_traced_memory()
+            head = f"traced: {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB\n"
+            paths.append(self._write("profile", "alloc.txt", head + "".join(f"{s}\n" for s in stats)))
+            if started_tracing:
+                tracemalloc.stop()
+        return paths
+
+    # ---------- файли ----------
+    def _write(self, name: str, suffix: str, content: str) -> Path:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        path = self.dir / f"{datetime.utcnow():%Y%m%d-%H%M%S-%f}-{name}.{suffix}"
+        path.write_text(content, encoding="utf-8")
+        self.files_written += 1
+        files = sorted((p for p in self.dir.iterdir() if p.is_file()), key=lambda p: p.stat().st_mtime)
+        for old in files[:-self.max_files]:
+            try:
+                old.unlink()
+            except OSError:
+                log.warning("profiler: cannot remove %s", old, exc_info=True)
+        return path
+
+    def snapshot(self) -> dict:
+        return {
+            "targets": sorted(self.targets),
+            "active": sorted(self._active),
+            "capturing": self.capturing,
+            "samples": self.samples,
+            "files": self.files_written,
+            "tracemalloc": tracemalloc.is_tracing(),
+        }
+
+
+_profiler: Profiler | None = None
+
+
+def get_profiler() -> Profiler:
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(Config.load())
+    return _profiler
+
+
+def profiled(name: str):
+    """Декоратор корутини: профілювати кожне виконання, якщо name є в PROFILE_TARGETS."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def _wrapped(*args, **kwargs):
+            profiler = get_profiler()
+            if not profiler.wants(name):
+                return await fn(*args, **kwargs)
+            with profiler.target(name, fn.__code__):
+                return await fn(*args, **kwargs)
+        return _wrapped
+    return decorate
@@ -0,0 +1,187 @@
+"""
+Регресійна перевірка планів запитів для repositories.py (SQLite).
+
+Запуск:
+    python -m utils.queryplan
+
+Створює тимчасову БД зі схемою з models.py, викликає кожну функцію репозиторію,
+перехоплює згенерований SQL (і executemany — з першим набором параметрів)
+і проганяє його через EXPLAIN QUERY PLAN.
+Якщо хоч один запит читає таблицю повним скануванням (SCAN <table> без індексу) —
+друкує план і завершується з кодом 1.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import shutil
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+
+# Очікувані повні проходи: (функція, таблиця) — лише там, де запит за змістом повертає
+# (майже) всю таблицю. SCAN ... USING [COVERING] INDEX проходить перевірку і так.
+ALLOWED_SCANS: set[tuple[str, str]] = {
+    # кожен налаштований користувач — кандидат сканера нагадувань
+    ("users_with_subscription", "users"),
+    # повні довідники для клавіатур онбордингу (десятки рядків, кешуються в directory.py)
+    ("list_faculties", "faculties"),
+    ("list_chairs", "chairs"),
+}
+
+# "SCAN n CONSTANT ROWS" — це VALUES (...) у багаторядковому INSERT, а не таблиця
+_SCAN_RE = re.compile(r"^SCAN (?!\d+ CONSTANT ROWS|CONSTANT ROW)(\w+)(?! USING (?:COVERING )?INDEX)(?:\s|$)")
+
+
+def _calls():
+    """(назва, async fn(session)) для кожного запиту репозиторію."""
+    import repositories as r
+    from models import User, TimetableEvent
+
+    student = User(user_id=1, role="student", group_id=1, notify_offset_min=5)
+    teacher = User(user_id=2, role="teacher", teacher_id=1, notify_offset_min=5)
+    ev = TimetableEvent(id=1, teacher_full="Іванов Іван Іванович", date=date.today())
+    parsed = TimetableEvent(
+        date=date.today(), lesson_number=1, subject_full="Математика",
+        teacher_full="Іванов Іван Іванович", groups_text="Г", raw_html="<div></div>",
+    )
+    now = datetime.now()
+
+    # ті самі заняття після змін на сайті: уточнений тип і інший сирий HTML клітинки
+    def lessons(lesson_type=None, html="<div></div>"):
+        return [
+            TimetableEvent(
+                date=date.today(), lesson_number=n, subject_full="Математика", lesson_type=lesson_type,
+                teacher_full="Іванов Іван Іванович", groups_text="Г", raw_html=f"{html}{n}",
+            )
+            for n in (1, 2)
+        ]
+
+    async def resync(s, sync):
+        # повторна синхронізація: UPDATE занять і хешів зв'язків ідуть через executemany
+        await sync(s, 1, lessons())
+        await sync(s, 1, lessons("Лекція", "<div>змінено</div>"))
+
+    return [
+        ("upsert_faculties", lambda s: r.upsert_faculties(s, [(1, "Ф")])),
+        ("upsert_groups", lambda s: r.upsert_groups(s, 1, 1, [(1, "Г")])),
+        ("upsert_chairs", lambda s: r.upsert_chairs(s, [(1, "К")])),
+        ("upsert_teachers", lambda s: r.upsert_teachers(s, 1, [(1, "Іванов Іван Іванович")])),
+        ("list_faculties", r.list_faculties),
+        ("list_courses", lambda s: r.list_courses(s, 1)),
+        ("list_groups", lambda s: r.list_groups(s, 1, 1)),
+        ("list_chairs", r.list_chairs),
+        ("list_teachers", lambda s: r.list_teachers(s, 1)),
+        ("distinct_group_ids_in_users", r.distinct_group_ids_in_users),
+        ("distinct_teacher_ids_in_users", r.distinct_teacher_ids_in_users),
+        ("users_with_subscription", r.users_with_subscription),
+        ("subscriber_counts", r.subscriber_counts),
+        ("next_lesson_dates[group]", lambda s: r.next_lesson_dates(s, "group", [1, 2], date.today())),
+        ("next_lesson_dates[teacher]", lambda s: r.next_lesson_dates(s, "teacher", [1, 2], date.today())),
+        ("refresh_states", lambda s: r.refresh_states(s, "group", [1, 2])),
+        ("sync_events_for_group", lambda s: r.sync_events_for_group(s, 1, [parsed])),
+        ("sync_events_for_teacher", lambda s: r.sync_events_for_teacher(s, 1, [parsed])),
+        ("sync_events_for_group[range]",
+         lambda s: r.sync_events_for_group(s, 1, [parsed], (date.today(), date.today() + timedelta(days=6)))),
+        ("sync_events_for_group[resync]", lambda s: resync(s, r.sync_events_for_group)),
+        ("sync_events_for_teacher[resync]", lambda s: resync(s, r.sync_events_for_teacher)),
+        ("upsert_lessons", lambda s: r.upsert_lessons(s, [parsed])),
+        ("mark_refreshed", lambda s: r.mark_refreshed(s, "group", 1, full=True, changed=True)),
+        ("get_refresh_state", lambda s: r.get_refresh_state(s, "teacher", 1)),
+        ("mark_refresh_negative",
+         lambda s: r.mark_refresh_negative(s, "group", 1, "missing", timedelta(hours=6), timedelta(days=7))),
+        ("negative_refresh_states", lambda s: r.negative_refresh_states(s, now)),
+        ("teacher_covered_by_groups", lambda s: r.teacher_covered_by_groups(s, 1, now)),
+        ("events_for_user_day[student]", lambda s: r.events_for_user_day(s, student, date.today())),
+        ("events_for_user_day[teacher]", lambda s: r.events_for_user_day(s, teacher, date.today())),
+        ("events_for_user_range[student]",
+         lambda s: r.events_for_user_range(s, student, date.today(), date.today() + timedelta(days=6))),
+        ("events_for_user_range[teacher]",
+         lambda s: r.events_for_user_range(s, teacher, date.today(), date.today() + timedelta(days=6))),
+        ("upcoming_events_for_user[student]", lambda s: r.upcoming_events_for_user(s, student, now, 5)),
+        ("upcoming_events_for_user[teacher]", lambda s: r.upcoming_events_for_user(s, teacher, now, 5)),
+        ("has_notification", lambda s: r.has_notification(s, 1, 1)),
+        ("list_distinct_teachers", r.list_distinct_teachers),
+        ("set_zoom_link", lambda s: r.set_zoom_link(s, "Іванов Іван Іванович", "https://zoom.us/j/1")),
+        ("zoom_for_event", lambda s: r.zoom_for_event(s, ev)),
+        ("cleanup_old_records", lambda s: r.cleanup_old_records(s, date.today(), now)),
+        ("cleanup_old_records[batch]", lambda s: r.cleanup_old_records(s, date.today(), now, limit=500)),
+        ("cleanup_orphan_raw_cells", lambda s: r.cleanup_orphan_raw_cells(s, 500)),
+        ("get_fsm_record", lambda s: r.get_fsm_record(s, "1:1:1:default", now)),
+        ("save_fsm_record", lambda s: r.save_fsm_record(s, "1:1:1:default", "StartFSM:group", '{"fac_page":0}', now)),
+        ("save_fsm_record[clear]", lambda s: r.save_fsm_record(s, "1:1:1:default", None, None, now)),
+        ("cleanup_expired_fsm", lambda s: r.cleanup_expired_fsm(s, now, 500)),
+        ("heartbeat_member", lambda s: r.heartbeat_member(s, "a", now, now, now)),
+        ("live_members", lambda s: r.live_members(s, now)),
+        ("ensure_shards", lambda s: r.ensure_shards(s, 4)),
+        ("claim_shards", lambda s: r.claim_shards(s, "a", {0, 1}, now, now)),
+        ("leave_cluster", lambda s: r.leave_cluster(s, "a")),
+        ("intern_texts", lambda s: r.intern_texts(s, ["Математика"])),
+    ]
+
+
+async def collect_full_scans() -> list[tuple[str, str, list[str]]]:
+    """Повертає [(функція, sql, план)] для запитів з повним скануванням таблиці."""
+    import db
+    import models
+
+    tmpdir = tempfile.mkdtemp(prefix="queryplan_")
+    db.init_engine(f"sqlite+aiosqlite:///{os.path.join(tmpdir, 'plan.db')}")
+    await db.create_all(models)
+    engine = db.get_engine()
+
+    captured: list[tuple[str, object]] = []
+
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH", "DELETE", "UPDATE", "INSERT")):
+            return
+        if executemany:
+            # план той самий для кожного набору параметрів — досить першого
+            if not parameters:
+                return
+            parameters = parameters[0]
+        captured.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", _capture)
+
+    bad: list[tuple[str, str, list[str]]] = []
+    sm = db.get_sessionmaker()
+    for name, fn in _calls():
+        captured.clear()
+        async with sm() as s:
+            await fn(s)
+            await s.flush()
+            statements = list(captured)
+            for statement, params in statements:
+                conn = await s.connection()
+                rows = (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", params)).all()
+                plan = [row[-1] for row in rows]
+                scans = [m.group(1) for line in plan if (m := _SCAN_RE.match(line))]
+                if any((name.split("[")[0], t) not in ALLOWED_SCANS for t in scans):
+                    bad.append((name, statement, plan))
+            await s.rollback()
+
+    event.remove(engine.sync_engine, "before_cursor_execute", _capture)
+    await db.dispose()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    return bad
+
+
+def main() -> int:
+    bad = asyncio.run(collect_full_scans())
+    for name, statement, plan in bad:
+        print(f"[FULL SCAN] {name}\n  {statement}")
+        for line in plan:
+            print(f"    {line}")
+    if bad:
+        print(f"{len(bad)} запит(ів) з повним скануванням таблиці.")
+        return 1
+    print("OK: повних сканувань таблиць не знайдено.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
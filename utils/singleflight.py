@@ -0,0 +1,34 @@
+"""
+Single-flight: одночасні виклики з тим самим ключем виконують роботу один раз.
+
+Перший виклик запускає корутину окремою задачею, решта — чекають на той самий
+результат (або ту саму помилку). Скасування одного з очікувачів не скасовує
+спільну задачу. Після завершення ключ звільняється: наступний виклик знову
+виконає роботу.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task] = {}
+        # Лічильники для діагностики
+        self.started = 0
+        self.joined = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(fn(), name=f"singleflight-{key}")
+            self._calls[key] = task
+            task.add_done_callback(lambda _t: self._calls.pop(key, None))
+            self.started += 1
+        else:
+            self.joined += 1
+        return await asyncio.shield(task)
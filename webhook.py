@@ -0,0 +1,131 @@
+"""
+Приймання оновлень через webhook (альтернатива long polling) — вмикається WEBHOOK_URL.
+
+Вбудований aiohttp-сервер приймає POST від Telegram на WEBHOOK_PATH:
+  • перевіряє заголовок X-Telegram-Bot-Api-Secret-Token (WEBHOOK_SECRET), інакше 401;
+  • одразу відповідає 200, а оновлення обробляється фоновою задачею — Telegram не чекає
+    на повільний онбординг і не повторює доставку;
+  • скільки оновлень виконується одночасно і в якому порядку, вирішує middlewares/ordering.py
+    (як і для polling); якщо прийнятих, але не оброблених уже WEBHOOK_MAX_PENDING — 503,
+    і Telegram повторить пізніше. WEBHOOK_MAX_CONCURRENCY — скільки з'єднань відкриває сам Telegram.
+
+Стан діалогів зберігається в БД (fsm_storage.py), тож кілька примірників можуть стояти
+за балансувальником. Під час зупинки сервер перестає приймати запити й дочікує вже прийняті
+оновлення (до WEBHOOK_DRAIN_SECONDS).
+"""
+from __future__ import annotations
+
+import asyncio
+import hmac
+import logging
+import time
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from config import Config
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookIngest:
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: str, max_pending: int):
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.max_pending = max(1, max_pending)
+        self._tasks: set[asyncio.Task] = set()
+        # Лічильники для діагностики
+        self.received = 0
+        self.rejected = 0
+        self.overloaded = 0
+        self.failed = 0
+        self.handle_seconds = 0.0
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        # байти, а не str: compare_digest(str, str) падає на не-ASCII (500 замість 401);
+        # surrogateescape — aiohttp так декодує байти заголовка, що не є UTF-8
+        header = request.headers.get(SECRET_HEADER, "").encode("utf-8", "surrogateescape")
+        if not hmac.compare_digest(header, self.secret.encode()):
+            self.rejected += 1
+            return web.Response(status=401)
+        if self.pending >= self.max_pending:
+            self.overloaded += 1
+            return web.Response(status=503)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception:
+            self.rejected += 1
+            return web.Response(status=400)
+        self.received += 1
+        task = asyncio.create_task(self._process(update), name=f"update-{update.update_id}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response(status=200)
+
+    async def _process(self, update: Update) -> None:
+        started = time.monotonic()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            self.failed += 1
+            log.exception("update %s failed", update.update_id)
+        finally:
+            self.handle_seconds += time.monotonic() - started
+
+    async def drain(self, timeout: float) -> None:
+        """Дочікує прийняті оновлення; ті, що не встигли за timeout, скасовуються."""
+        if not self._tasks:
+            return
+        _done, left = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in left:
+            task.cancel()
+        if left:
+            log.warning("webhook drain: %d updates cancelled after %.0fs", len(left), timeout)
+
+
+_ingest: WebhookIngest | None = None
+
+
+def get_webhook_ingest() -> WebhookIngest | None:
+    """Активний приймач webhook (None у режимі polling)."""
+    return _ingest
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, cfg: Config) -> None:
+    """Піднімає сервер, реєструє webhook у Telegram і працює до скасування."""
+    global _ingest
+    if not cfg.webhook_secret:
+        raise RuntimeError("WEBHOOK_SECRET не задано")
+    _ingest = WebhookIngest(dp, bot, cfg.webhook_secret, cfg.webhook_max_pending)
+
+    app = web.Application()
+    app.router.add_post(cfg.webhook_path, _ingest.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, cfg.webhook_host, cfg.webhook_port)
+    await site.start()
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    # кілька примірників реєструють ту саму адресу; webhook не знімаємо під час зупинки
+    await bot.set_webhook(
+        url=cfg.webhook_url.rstrip("/") + cfg.webhook_path,
+        secret_token=cfg.webhook_secret,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=cfg.webhook_max_concurrency,
+    )
+    log.info("webhook listening on %s:%s%s", cfg.webhook_host, cfg.webhook_port, cfg.webhook_path)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await site.stop()
+        await _ingest.drain(cfg.webhook_drain_seconds)
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
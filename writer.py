@@ -0,0 +1,183 @@
+"""
+Єдиний письменник БД.
+
+Усі записи (онбординг, журнал нагадувань, Zoom-лінки, синхронізація розкладу)
+ставляться в асинхронну чергу і виконуються однією корутиною. Записи, що прийшли
+майже одночасно, групуються в одну транзакцію (за часовим вікном або розміром пачки):
+одна транзакція = один fsync замість одного на кожен клік/нагадування.
+
+Кожна операція — це `async def op(session) -> result`, яка НЕ робить commit сама.
+Вона виконується у власному SAVEPOINT, тож помилка однієї операції не скасовує
+решту пачки. Викликач отримує future, що завершується після commit.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import Config
+from db import get_sessionmaker
+from querystats import attach, current
+
+WriteOp = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class WriteQueue:
+    def __init__(self, sessionmaker, max_batch: int = 64, window_ms: int = 20):
+        self._sm = sessionmaker
+        self._max_batch = max(1, max_batch)
+        self._window = max(0, window_ms) / 1000
+        self._queue: asyncio.Queue[tuple[WriteOp, asyncio.Future]] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+        # Лічильники для діагностики
+        self.batches = 0
+        self.ops = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="db-writer")
+
+    async def stop(self) -> None:
+        """Дочекатися виконання вже поставлених записів і зупинити письменника."""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def submit(self, op: WriteOp) -> asyncio.Future:
+        scope = current()
+        if scope is not None:
+            # інструкції операції зараховуються обробнику, що її поставив (querystats.py)
+            op = _in_scope(op, scope)
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((op, fut))
+        return fut
+
+    async def _collect(self) -> list[tuple[WriteOp, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._window
+        while len(batch) < self._max_batch:
+            # спершу забираємо все, що вже чекає, без очікування
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            try:
+                await self._execute(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _execute(self, batch: list[tuple[WriteOp, asyncio.Future]]) -> None:
+        outcomes: list[tuple[asyncio.Future, Any, BaseException | None]] = []
+        try:
+            async with self._sm() as s:
+                for op, fut in batch:
+                    if fut.cancelled():
+                        continue
+                    try:
+                        async with s.begin_nested():
+                            result = await op(s)
+                        outcomes.append((fut, result, None))
+                    except Exception as ex:
+                        outcomes.append((fut, None, ex))
+                await s.commit()
+        except Exception as ex:
+            # commit (або відкриття транзакції) не вдався — падає вся пачка
+            for _op, fut in batch:
+                if not fut.done():
+                    fut.set_exception(ex)
+            return
+
+        self.batches += 1
+        self.ops += len(outcomes)
+        for fut, result, ex in outcomes:
+            if fut.done():
+                continue
+            if ex is not None:
+                fut.set_exception(ex)
+            else:
+                fut.set_result(result)
+
+
+def _in_scope(op: WriteOp, scope) -> WriteOp:
+    async def _op(s):
+        with attach(scope):
+            result = await op(s)
+            # інакше s.add() без flush запишеться при виході з SAVEPOINT — уже поза областю
+            await s.flush()
+            return result
+    return _op
+
+
+_writer: WriteQueue | None = None
+
+
+def start_writer(cfg: Config | None = None) -> WriteQueue:
+    global _writer
+    cfg = cfg or Config.load()
+    _writer = WriteQueue(get_sessionmaker(), max_batch=cfg.write_batch_max, window_ms=cfg.write_batch_window_ms)
+    _writer.start()
+    return _writer
+
+
+async def stop_writer() -> None:
+    global _writer
+    if _writer is not None:
+        await _writer.stop()
+        _writer = None
+
+
+def get_writer() -> WriteQueue | None:
+    return _writer
+
+
+def submit(op: WriteOp) -> asyncio.Future:
+    """
+    Поставити запис у чергу, не чекаючи. Якщо письменник не запущений
+    (утиліти, разові скрипти) — виконуємо одразу в окремій сесії.
+    """
+    if _writer is not None:
+        return _writer.submit(op)
+    return asyncio.ensure_future(_write_direct(op))
+
+
+async def write(op: WriteOp) -> Any:
+    """Поставити запис у чергу і дочекатися commit. Повертає результат op."""
+    return await submit(op)
+
+
+async def _write_direct(op: WriteOp) -> Any:
+    async with get_sessionmaker()() as s:
+        result = await op(s)
+        await s.commit()
+    return result